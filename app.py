@@ -1,13 +1,31 @@
+import hashlib
+import json
 import os
 import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file
+import threading
+import time
+import uuid
+from pathlib import Path
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify, Response, abort, make_response
 from werkzeug.security import generate_password_hash, check_password_hash
 import pycountry
 from database import (
     init_db, 
     get_db_connection, 
     with_db_connection, 
-    close_db_connection
+    close_db_connection,
+    get_user_id,
+    save_form_data,
+    get_form_data,
+    update_form_fields,
+    purge_form_data,
+    iter_user_profiles,
+    get_field_mapping,
+    get_fill_form_versions,
+    save_field_mapping,
+    save_user_field_mapping,
+    get_user_profile,
+    save_user_profile
 )
 from config import Config
 from flask_wtf import FlaskForm
@@ -18,7 +36,19 @@ from wtforms import StringField, PasswordField, FileField
 from wtforms.validators import DataRequired, Length
 from werkzeug.utils import secure_filename
 from ocr_processor import SmartPDFProcessor
+from pdf_cache import PDFResultCache
 from fieldextractor import FieldExtractor
+from extraction_cache import ExtractionCache
+from deepseek_client import DeepSeekClient
+from streaming_json import set_path
+from template_registry import TemplateRegistry
+from jobs import JobQueue
+from upload_store import UploadStore
+from pdf_filler import PDFFiller
+from bulk_fill import BulkFiller
+from form_autofill import FormAutofill
+from compression import ResponseCompressor
+from fill_form_handler import FillFormHandler
 
 # Create uploads directory if it doesn't exist
 if not os.path.exists('uploads'):
@@ -31,6 +61,9 @@ app.config.from_object(Config)
 csrf = CSRFProtect()
 csrf.init_app(app)
 
+# Gzip pages, JSON and static assets
+compressor = ResponseCompressor(app)
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -58,16 +91,50 @@ logger.addHandler(stream_handler)
 logger.info("Application logging initialized")
 
 # Initialize processors
-pdf_processor = SmartPDFProcessor()
-field_extractor = FieldExtractor()
+pdf_processor = SmartPDFProcessor(
+    ocr_workers=Config.OCR_WORKERS,
+    page_timeout=Config.OCR_PAGE_TIMEOUT,
+    cache=PDFResultCache(
+        Config.PDF_CACHE_DIR,
+        max_memory_items=Config.PDF_CACHE_MEMORY_ITEMS,
+        max_disk_bytes=Config.PDF_CACHE_MAX_BYTES
+    )
+)
+field_extractor = FieldExtractor(
+    cache=ExtractionCache(
+        Config.EXTRACTION_CACHE_PATH,
+        ttl_seconds=Config.EXTRACTION_CACHE_TTL,
+        max_bytes=Config.EXTRACTION_CACHE_MAX_BYTES
+    ),
+    max_input_tokens=Config.LLM_MAX_INPUT_TOKENS,
+    chunk_tokens=Config.LLM_CHUNK_TOKENS,
+    max_concurrency=Config.LLM_MAX_CONCURRENCY,
+    client=DeepSeekClient.from_env(
+        timeout=Config.LLM_TIMEOUT,
+        connect_timeout=Config.LLM_CONNECT_TIMEOUT,
+        max_retries=Config.LLM_MAX_RETRIES,
+        backoff_base=Config.LLM_BACKOFF_BASE,
+        backoff_max=Config.LLM_BACKOFF_MAX,
+        rate_limit=Config.LLM_RATE_LIMIT,
+        burst=Config.LLM_RATE_BURST,
+        max_connections=Config.LLM_MAX_CONNECTIONS
+    )
+)
+
+form_templates = TemplateRegistry(Config.TEMPLATE_REGISTRY_PATH, threshold=Config.TEMPLATE_MATCH_THRESHOLD)
+
+def register_template(fingerprint, extracted: dict):
+    """Remember the schema of a newly seen form, unless part of its extraction failed"""
+    if fingerprint is None or extracted.get('failed_chunks') or not extracted.get('extracted_fields'):
+        return
+    try:
+        form_templates.add(fingerprint, extracted['extracted_fields'])
+    except Exception as e:
+        logger.warning(f"Could not register form template: {str(e)}")
 
 ALLOWED_GENDERS = ['Male', 'Female', 'Other']
 ALLOWED_RELIGIONS = ['Christianity', 'Islam', 'Hinduism', 'Buddhism', 'Sikhism', 'Judaism', 'Other']
 
-# Initialize database when the app starts
-with app.app_context():
-    init_db()
-
 # Close database connection after each request
 @app.teardown_appcontext
 def teardown_db(exception):
@@ -124,167 +191,436 @@ def validate_user(conn, username, password):
 class UploadForm(FlaskForm):
     file = FileField('PDF File', validators=[DataRequired()])
 
+def extract_upload(job: dict, progress) -> dict:
+    """Template lookup, text extraction and field extraction for one uploaded PDF"""
+    data = Path(job['pdf_path']).read_bytes()
+    
+    # Recurring blank forms reuse their stored schema and skip OCR and the LLM
+    fingerprint = None
+    try:
+        fingerprint = form_templates.fingerprint(data)
+        template = form_templates.lookup(fingerprint)
+    except Exception as e:
+        logger.warning(f"Template lookup failed for {job['filename']}: {str(e)}")
+        template = None
+    progress.stage('template_lookup')
+    if template is not None:
+        return {
+            "extracted_fields": template['extracted_fields'],
+            "raw_text": "",
+            "raw_response": "",
+            "source": "template"
+        }
+    
+    ocr_result = pdf_processor.process_pdf(data, name=job['filename'], compact=True)
+    progress.stage('text_extraction')
+    
+    if ocr_result.get("form_widgets"):
+        # Fillable PDF: read the fields straight from its widgets
+        logger.info("Using AcroForm widgets for field extraction")
+        extracted = FieldExtractor.extract_from_widgets(ocr_result["form_widgets"])
+    elif Config.STREAM_EXTRACTION:
+        # Publish fields as DeepSeek generates them so the status page can show them early
+        logger.info(f"Streaming field extraction for {job['filename']}")
+        partial = {}
+        extracted = None
+        for event in field_extractor.stream_fields_chunked(ocr_result["pages"]):
+            if event["event"] == "field":
+                set_path(partial, event["path"], event["value"])
+                progress.add_fields(FillFormHandler.streamed_form_fields(partial, event["path"]))
+            else:
+                extracted = event
+    else:
+        # Extract form fields using DeepSeek; long forms are split into
+        # page chunks of the compact view and extracted concurrently
+        logger.info("Starting field extraction process")
+        extracted = field_extractor.extract_fields_chunked(ocr_result["pages"])
+    
+    if not extracted or extracted.get('status') not in ('success', 'partial'):
+        raise RuntimeError(f"Field extraction failed: {(extracted or {}).get('error', 'Unknown error')}")
+    progress.stage('field_extraction')
+    if extracted.get('status') == 'partial':
+        logger.warning(f"Partial extraction for {job['filename']}: chunks {extracted['failed_chunks']} failed")
+    
+    if extracted.get('source') != 'acroform':
+        register_template(fingerprint, extracted)
+    
+    return {
+        "extracted_fields": extracted['extracted_fields'],
+        "raw_text": ocr_result['raw_text'],
+        "raw_response": extracted.get('raw_response', ''),
+        "source": extracted.get('source', 'llm'),
+        "field_map": extracted.get('field_map', {}),
+        "failed_chunks": extracted.get('failed_chunks', [])
+    }
+
+def run_upload_job(job: dict, progress) -> dict:
+    """Extract an upload and store the result in temp_form_data for the fill form"""
+    result = extract_upload(job, progress)
+    result['filename'] = job['filename']
+    form_id = save_form_data(get_user_id(job['owner']), job['pdf_path'], result)
+    # The stored form keeps the upload alive after the job itself is purged
+    upload_store.add_ref(UploadStore.digest_of(job['pdf_path']), f"form:{form_id}", owner=job['owner'])
+    return {"form_id": form_id}
+
+def purge_expired_data():
+    """Delete form data, finished jobs and uploads older than FORM_DATA_TTL"""
+    form_ids = purge_form_data(Config.FORM_DATA_TTL, Config.PURGE_BATCH_SIZE)
+    job_ids = upload_jobs.purge(Config.FORM_DATA_TTL, Config.PURGE_BATCH_SIZE)
+    upload_store.release([f"form:{form_id}" for form_id in form_ids] + [f"job:{job_id}" for job_id in job_ids])
+    
+    # Uploads of queued or running jobs are kept even if the store is over budget
+    active = upload_jobs.active_pdf_paths()
+    # and so are the PDFs of stored forms, which the filled-PDF download still needs
+    gc_result = upload_store.gc(protected={UploadStore.digest_of(pdf_path) for pdf_path in active},
+                                pinned_refs=('form:',))
+    
+    # Uploads saved before the content-addressed store existed
+    removed = 0
+    cutoff = time.time() - Config.FORM_DATA_TTL
+    with os.scandir(Config.UPLOAD_FOLDER) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.path not in active and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"Could not delete upload {entry.path}: {str(e)}")
+    logger.info(f"Purged {len(form_ids)} forms and {len(job_ids)} jobs, "
+                f"removed {gc_result['deleted_objects'] + removed} uploads")
+
+def purge_loop():
+    while True:
+        time.sleep(Config.PURGE_INTERVAL)
+        try:
+            purge_expired_data()
+        except Exception as e:
+            logger.error(f"Purge failed: {str(e)}", exc_info=True)
+
+upload_store = UploadStore(
+    Config.UPLOAD_FOLDER,
+    Config.UPLOAD_STORE_DB_PATH,
+    max_bytes=Config.UPLOAD_STORE_MAX_BYTES,
+    max_age_seconds=Config.FORM_DATA_TTL
+)
+pdf_filler = PDFFiller(Config.FILLED_PDF_DIR)
+upload_jobs = JobQueue(Config.JOB_DB_PATH, run_upload_job, workers=Config.JOB_WORKERS)
+
+_services_started = False
+_services_lock = threading.Lock()
+
+def start_services():
+    """Initialize the database and start the job workers and purge thread, once per process
+
+    Not done at import time: OCR and bulk fill workers are spawned processes
+    that re-import this module, and must not requeue jobs or start threads
+    of their own, and neither must the debug reloader's watcher process.
+    Runs before the first request the process serves.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        init_db()
+        upload_jobs.start()
+        threading.Thread(target=purge_loop, name='purge', daemon=True).start()
+        _services_started = True
+
+@app.before_request
+def ensure_services():
+    if not _services_started:
+        start_services()
+
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_form():
-    """Handle PDF upload and form field extraction"""
+    """Handle PDF upload; extraction runs as a background job"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
     form = UploadForm()
     if form.validate_on_submit():
         file = form.file.data
         if file and file.filename.lower().endswith('.pdf'):
             filename = secure_filename(file.filename)
-            filepath = os.path.join('uploads', filename)
-            file.save(filepath)
-            
-            # Extract text from PDF
-            ocr_result = pdf_processor.process_pdf(filepath)
             
-            try:
-                # Extract form fields using DeepSeek
-                logger.info("Starting field extraction process")
-                extracted = field_extractor.extract_fields({
-                    "text": [ocr_result["raw_text"]],
-                    "pdf_path": filepath
-                })
-                
-                logger.info(f"Field extraction result: {extracted}")
-                
-                if extracted.get('status') != 'success':
-                    logger.error(f"Field extraction failed: {extracted.get('error', 'Unknown error')}")
-                    flash('Failed to extract form fields. Please try again.')
-                    return redirect(url_for('upload_form'))
-                
-                from fill_form_handler import FillFormHandler
-                return FillFormHandler.handle_fill_form(
-                    extracted['extracted_fields'],
-                    ocr_result['raw_text'],
-                    extracted['raw_response']  # Pass raw response for debugging
-                )
-                
-            except Exception as e:
-                logger.error(f"Error during field extraction: {str(e)}", exc_info=True)
-                flash('An error occurred while processing your form. Please try again.')
-                return redirect(url_for('upload_form'))
+            # Saved to disk so the job survives a restart; identical files are stored once
+            job_id = uuid.uuid4().hex
+            _, pdf_path = upload_store.save(file.stream, f"job:{job_id}", owner=session['username'])
+            job_id = upload_jobs.submit(filename, pdf_path, owner=session['username'], job_id=job_id)
+            return redirect(url_for('job_page', job_id=job_id))
         
         flash('Invalid file type. Please upload a PDF file.')
         return redirect(url_for('upload_form'))
     
     return render_template('upload_form.html', form=form)
 
+def get_own_job(job_id: str):
+    """Return a job if it belongs to the current session's user, else None"""
+    job = upload_jobs.get(job_id)
+    if job is None or job['owner'] != session.get('username'):
+        return None
+    return job
+
+@app.route('/jobs/<job_id>')
+def job_page(job_id):
+    """Show job progress, or send the user to the fill form once the job is done"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    job = get_own_job(job_id)
+    if job is None:
+        flash('Upload not found. Please upload your form again.')
+        return redirect(url_for('upload_form'))
+    
+    if job['status'] == 'failed':
+        logger.error(f"Job {job_id} failed: {job['error']}")
+        flash('Failed to extract form fields. Please try again.')
+        return redirect(url_for('upload_form'))
+    
+    if job['status'] == 'done':
+        return redirect(url_for('fill_form', form_id=job['result']['form_id']))
+    
+    return render_template(
+        'job_status.html',
+        events_url=url_for('job_events', job_id=job_id),
+        status_url=url_for('job_status', job_id=job_id),
+        job_url=url_for('job_page', job_id=job_id)
+    )
+
+def sse_event(event: str, data) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events carrying a job's stage and form entries the moment they change
+
+    Each progress event holds only the entries added or updated since the
+    previous one. A finished event tells the page to load the job page.
+    """
+    job = get_own_job(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    
+    def generate():
+        since = None
+        current = job
+        while True:
+            if current is None or current['status'] in ('done', 'failed'):
+                yield sse_event("finished", {"status": current['status'] if current else 'failed'})
+                return
+            version, fields = upload_jobs.changes(job_id, since or 0)
+            if version != since:
+                yield sse_event("progress", {"stage": current['stage'], "fields": fields})
+                since = version
+            version, _ = upload_jobs.changes(job_id, since, timeout=Config.JOB_EVENTS_KEEPALIVE)
+            if version == since:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+            current = upload_jobs.get(job_id)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # stop reverse proxies from buffering the stream
+    })
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    """Job state as JSON, polled by the status page when it cannot use the event stream"""
+    job = get_own_job(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({
+        "id": job['id'],
+        "status": job['status'],
+        "stage": job['stage'],
+        "stages": job['stages'],
+        "fields": job['fields']
+    })
+
+@app.route('/fill/<int:form_id>', methods=['GET', 'POST'])
+def fill_form(form_id):
+    """Render a stored extraction result as the fill form, and save submissions to it"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    user_id = get_user_id(session['username'])
+    stored = get_form_data(form_id, user_id)
+    if stored is None:
+        flash('This form has expired. Please upload it again.')
+        return redirect(url_for('upload_form'))
+    
+    result = stored['form_fields']
+    if request.method == 'GET' and result.get('failed_chunks'):
+        flash('Part of this form could not be read, so some fields may be missing.', 'warning')
+    
+    form = None
+    etag = None
+    if request.method == 'GET':
+        etag = fill_form_etag(stored, session['username'])
+        if etag is not None and request.if_none_match.contains_weak(etag):
+            # The browser's copy is what this request would render
+            response = app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+    elif request.method == 'POST':
+        form, form_fields = FillFormHandler.build_form(result['extracted_fields'])
+        if form.validate_on_submit():
+            result['extracted_fields'] = FillFormHandler.apply_submission(result['extracted_fields'], form)
+            update_form_fields(form_id, user_id, result)
+            learn_field_mapping(form_fields, form, session['username'])
+            flash('Form saved.', 'success')
+            return redirect(url_for('fill_form', form_id=form_id))
+    
+    response = make_response(FillFormHandler.handle_fill_form(
+        result['extracted_fields'],
+        result['raw_text'],
+        result['raw_response'],  # Pass raw response for debugging
+        form=form,
+        pdf_url=url_for('fill_form_pdf', form_id=form_id),
+        autofill=lambda form_fields: autofill_from_profile(form_fields, session['username']),
+        stream_min_fields=Config.FILL_FORM_STREAM_FIELDS
+    ))
+    if etag is not None and response.status_code == 200:
+        # Weak: each render signs the same CSRF token with a new timestamp
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+FILL_FORM_TEMPLATES = ('fill_form.html', 'base.html')
+_render_version = None
+
+def fill_form_render_version() -> str:
+    """Version of the code that renders the fill page: APP_VERSION plus a hash of its templates
+
+    Computed once per process, so a deploy that changes the templates (and
+    restarts the app) invalidates every cached page.
+    """
+    global _render_version
+    if _render_version is None:
+        digest = hashlib.sha256(Config.APP_VERSION.encode('utf-8'))
+        for name in FILL_FORM_TEMPLATES:
+            source, _, _ = app.jinja_loader.get_source(app.jinja_env, name)
+            digest.update(source.encode('utf-8'))
+        _render_version = digest.hexdigest()
+    return _render_version
+
+def fill_form_etag(stored: dict, username: str):
+    """Validator of a fresh fill form page, built from the versions of what it is rendered from
+
+    The stored form's row version, the user's profile version and the state
+    of the schema's field mapping are read without loading or rendering any
+    of them; the render version covers the templates and app release. None
+    when the page cannot be reused: the session has no CSRF token yet or
+    there are flashed messages waiting to be shown.
+    """
+    csrf_token = session.get(app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+    if csrf_token is None or session.get('_flashes'):
+        return None
+    signature = FormAutofill.schema_signature(FillFormHandler.input_names(stored['form_fields']['extracted_fields']))
+    versions = get_fill_form_versions(username, signature)
+    payload = json.dumps([fill_form_render_version(), stored['id'], stored['version'], versions, csrf_token],
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def field_mapping_for(form_fields: list, profile: dict, username: str):
+    """Signature and field -> profile column mapping of a form for a user, seeding it on first use"""
+    names = [field['name'] for field in form_fields if field['type'] != 'section']
+    signature = FormAutofill.schema_signature(names)
+    mapping = get_field_mapping(signature, username)
+    if mapping is None:
+        # First fill of this schema: the only time its fields are fuzzy-matched
+        mapping = FormAutofill.map_fields(names, profile)
+        save_field_mapping(signature, mapping, 'matcher')
+    return signature, mapping
+
+def autofill_from_profile(form_fields: list, username: str):
+    """Fill the empty fields of a fill form from the user's profile"""
+    profile = get_user_profile(username)
+    if not profile:
+        return
+    _, mapping = field_mapping_for(form_fields, profile, username)
+    FormAutofill.autofill_form_fields(form_fields, profile, mapping, overwrite=False)
+
+def learn_field_mapping(form_fields: list, form, username: str):
+    """Record the user's field mapping corrections implied by the values they submitted"""
+    try:
+        profile = get_user_profile(username)
+        if not profile:
+            return
+        signature, mapping = field_mapping_for(form_fields, profile, username)
+        submitted = {field['name']: getattr(form, field['name']).data
+                     for field in form_fields if field['type'] != 'section'}
+        previous = {field['name']: field['value'] for field in form_fields if field['type'] != 'section'}
+        changes = FormAutofill.learn_corrections(mapping, submitted, profile, previous)
+        if changes:
+            promoted = save_user_field_mapping(signature, username, changes, Config.FIELD_MAPPING_AGREEMENT)
+            if promoted:
+                logger.info(f"{len(promoted)} field mapping corrections now apply to all users")
+    except Exception as e:
+        # The submission is already saved; a mapping update is not worth failing it for
+        logger.warning(f"Could not update field mapping: {str(e)}")
+
+@app.route('/fill/<int:form_id>/pdf')
+def fill_form_pdf(form_id):
+    """Stream the uploaded PDF with the stored form values written into it"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    stored = get_form_data(form_id, get_user_id(session['username']))
+    if stored is None or not os.path.exists(stored['pdf_path']):
+        flash('This form has expired. Please upload it again.')
+        return redirect(url_for('upload_form'))
+    
+    result = stored['form_fields']
+    try:
+        filled = pdf_filler.fill(stored['pdf_path'], result['extracted_fields'], result.get('field_map'))
+    except Exception as e:
+        logger.error(f"Could not fill PDF for form {form_id}: {str(e)}", exc_info=True)
+        flash('Could not create the filled PDF.', 'danger')
+        return redirect(url_for('fill_form', form_id=form_id))
+    
+    download_name = f"{Path(result.get('filename') or 'form.pdf').stem}_filled.pdf"
+    response = Response(pdf_filler.iter_file(filled['path'], remove=True), mimetype='application/pdf',
+                        direct_passthrough=True)
+    response.headers['Content-Length'] = str(filled['size'])
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(download_name)}"'
+    # The filled copy is only needed until the response has been sent, or abandoned
+    response.call_on_close(lambda: Path(filled['path']).unlink(missing_ok=True))
+    return response
+
+@app.route('/admin/bulk-fill/<int:form_id>')
+def bulk_fill(form_id):
+    """Fill one of the admin's stored forms for every user profile and stream a ZIP"""
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    if session['username'] not in Config.ADMIN_USERS:
+        abort(403)
+    
+    stored = get_form_data(form_id, get_user_id(session['username']))
+    if stored is None or not os.path.exists(stored['pdf_path']):
+        flash('This form has expired. Please upload it again.')
+        return redirect(url_for('upload_form'))
+    
+    result = stored['form_fields']
+    logger.info(f"Bulk fill of form {form_id} started by {session['username']}")
+    bulk = BulkFiller(stored['pdf_path'], result['extracted_fields'], result.get('field_map'),
+                      workers=Config.BULK_FILL_WORKERS, tmp_dir=Config.FILLED_PDF_DIR)
+    chunks = bulk.iter_zip(iter_user_profiles(Config.BULK_FILL_BATCH_SIZE))
+    download_name = f"{Path(result.get('filename') or 'form.pdf').stem}_bulk.zip"
+    response = Response(chunks, mimetype='application/zip', direct_passthrough=True)
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(download_name)}"'
+    # Stops the workers if the download is abandoned
+    response.call_on_close(bulk.close)
+    return response
+
 @app.route('/')
 def home():
     if 'username' in session:
         return redirect(url_for('profile'))
     return redirect(url_for('login'))
 
-@with_db_connection
-def get_user_profile(conn, username):
-    """Retrieve user profile data"""
-    user = conn.execute('SELECT * FROM users WHERE username = ?', 
-                       (username,)).fetchone()
-    if user:
-        profile = conn.execute('SELECT * FROM user_profiles WHERE user_id = ?', 
-                             (user['id'],)).fetchone()
-        return dict(profile) if profile else {}
-    return {}
-
-@with_db_connection
-def save_user_profile(conn, username, profile_data):
-    """Save updated profile data"""
-    user = conn.execute('SELECT * FROM users WHERE username = ?', 
-                       (username,)).fetchone()
-    if user:
-        # Check if profile exists
-        existing_profile = conn.execute('SELECT * FROM user_profiles WHERE user_id = ?', 
-                                      (user['id'],)).fetchone()
-        
-        if existing_profile:
-            # Update existing profile
-            conn.execute('''
-                UPDATE user_profiles SET
-                    given_name = ?,
-                    last_name = ?,
-                    mobile_number = ?,
-                    email_address = ?,
-                    address_line1 = ?,
-                    address_line2 = ?,
-                    address_line3 = ?,
-                    address_line4 = ?,
-                    city = ?,
-                    state = ?,
-                    country = ?,
-                    post_code = ?,
-                    date_of_birth = ?,
-                    passport_number = ?,
-                    gender = ?,
-                    ethnicity = ?,
-                    religion = ?
-                WHERE user_id = ?
-            ''', (
-                profile_data['given_name'],
-                profile_data['last_name'],
-                profile_data['mobile_number'],
-                profile_data['email_address'],
-                profile_data['address_line1'],
-                profile_data['address_line2'],
-                profile_data['address_line3'],
-                profile_data['address_line4'],
-                profile_data['city'],
-                profile_data['state'],
-                profile_data['country'],
-                profile_data['post_code'],
-                profile_data['date_of_birth'],
-                profile_data['passport_number'],
-                profile_data['gender'],
-                profile_data['ethnicity'],
-                profile_data['religion'],
-                user['id']
-            ))
-        else:
-            # Insert new profile
-            conn.execute('''
-                INSERT INTO user_profiles (
-                    user_id,
-                    given_name,
-                    last_name,
-                    mobile_number,
-                    email_address,
-                    address_line1,
-                    address_line2,
-                    address_line3,
-                    address_line4,
-                    city,
-                    state,
-                    country,
-                    post_code,
-                    date_of_birth,
-                    passport_number,
-                    gender,
-                    ethnicity,
-                    religion
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user['id'],
-                profile_data['given_name'],
-                profile_data['last_name'],
-                profile_data['mobile_number'],
-                profile_data['email_address'],
-                profile_data['address_line1'],
-                profile_data['address_line2'],
-                profile_data['address_line3'],
-                profile_data['address_line4'],
-                profile_data['city'],
-                profile_data['state'],
-                profile_data['country'],
-                profile_data['post_code'],
-                profile_data['date_of_birth'],
-                profile_data['passport_number'],
-                profile_data['gender'],
-                profile_data['ethnicity'],
-                profile_data['religion']
-            ))
-        
-        conn.commit()
-
 @app.route('/profile')
 def profile():
     if 'username' not in session:
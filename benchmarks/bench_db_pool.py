@@ -0,0 +1,164 @@
+"""Measure concurrent profile reads and writes against the users database.
+
+Many threads read and save user profiles at once, first through the old
+access pattern (a new connection per call, rollback journal, an extra
+users lookup before each query) and then through the pooled connections
+of database.py (WAL, synchronous=NORMAL, busy timeout, reused statement
+caches). Each run gets a fresh database file.
+
+Usage:
+    python benchmarks/bench_db_pool.py --threads 8 32 64 --ops 200 --writes 0.2
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database
+
+
+def old_connection(path):
+    """The previous with_db_connection setup: a fresh connection with default settings"""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def old_get_user_profile(path, username):
+    conn = old_connection(path)
+    try:
+        user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        if user:
+            profile = conn.execute('SELECT * FROM user_profiles WHERE user_id = ?', (user['id'],)).fetchone()
+            return dict(profile) if profile else {}
+        return {}
+    finally:
+        conn.close()
+
+
+def old_save_user_profile(path, username, profile_data):
+    conn = old_connection(path)
+    try:
+        user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        if user:
+            existing = conn.execute('SELECT * FROM user_profiles WHERE user_id = ?', (user['id'],)).fetchone()
+            values = [profile_data[column] for column in database.PROFILE_COLUMNS]
+            if existing:
+                assignments = ', '.join(f'{column} = ?' for column in database.PROFILE_COLUMNS)
+                conn.execute(f'UPDATE user_profiles SET {assignments} WHERE user_id = ?', (*values, user['id']))
+            else:
+                conn.execute(f"INSERT INTO user_profiles (user_id, {', '.join(database.PROFILE_COLUMNS)}) "
+                             f"VALUES ({', '.join('?' * (len(values) + 1))})", (user['id'], *values))
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def setup(path, users):
+    database.DATABASE = str(path)
+    database._pool = None
+    database.init_db()
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)',
+                     [(f'user{i}', 'x') for i in range(users)])
+    conn.commit()
+    conn.close()
+    for i in range(users):
+        database.save_user_profile(f'user{i}', make_profile(i))
+    database.get_pool().close()
+    database._pool = None
+
+
+def make_profile(i):
+    profile = {column: f'{column} {i}' for column in database.PROFILE_COLUMNS}
+    profile['date_of_birth'] = '1990-01-01'
+    return profile
+
+
+def run(read, save, threads, ops, write_ratio, users):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = []
+        for _ in range(ops):
+            i = rng.randrange(users)
+            start = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    save(f'user{i}', make_profile(i))
+                else:
+                    read(f'user{i}')
+            except sqlite3.OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'ops_per_sec': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) if latencies else 0,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] if latencies else 0,
+        'errors': len(errors),
+        'locked': sum('locked' in error for error in errors)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Users database concurrency benchmark')
+    parser.add_argument('--threads', type=int, nargs='+', default=[8, 32, 64])
+    parser.add_argument('--ops', type=int, default=200, help='operations per thread')
+    parser.add_argument('--writes', type=float, default=0.2, help='share of operations that save a profile')
+    parser.add_argument('--users', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for threads in args.threads:
+            for label in ('new connection per call', 'pooled, WAL'):
+                path = Path(tmp) / f'users_{threads}_{label[0]}.db'
+                setup(path, args.users)
+                if label.startswith('pooled'):
+                    read, save = database.get_user_profile, database.save_user_profile
+                else:
+                    # The pool switched the file to WAL; the old code ran with the rollback journal
+                    conn = sqlite3.connect(path)
+                    conn.execute('PRAGMA journal_mode=DELETE')
+                    conn.close()
+                    read = lambda username, path=path: old_get_user_profile(path, username)
+                    save = lambda username, profile, path=path: old_save_user_profile(path, username, profile)
+                result = run(read, save, threads, args.ops, args.writes, args.users)
+                print(f"{threads:3d} threads, {label:24s}: {result['ops_per_sec']:8.0f} ops/s, "
+                      f"p50 {result['p50'] * 1000:6.2f} ms, p99 {result['p99'] * 1000:7.2f} ms, "
+                      f"{result['errors']} errors ({result['locked']} 'database is locked')")
+                if label.startswith('pooled'):
+                    stats = database.get_pool().stats()
+                    print(f"    pool: {stats['opened']} connections opened, {stats['reused']} reuses, "
+                          f"{stats['closed']} closed beyond the pool size")
+                    database.get_pool().close()
+                    database._pool = None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Exercise DeepSeekClient against a local stand-in for the DeepSeek API.
+
+The stand-in answers /chat/completions after a fixed latency and fails a share
+of requests with 429 or 503, so retries, backoff and the rate limiter can be
+observed without network access or an API key. Requests are sent from several
+threads through the synchronous extract_fields wrapper, as Flask workers would.
+A final streamed request reports time to first field against total time.
+
+Usage:
+    python benchmarks/bench_deepseek_client.py --requests 40 --threads 8 --fail-rate 0.2
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from deepseek_client import DeepSeekClient
+from fieldextractor import FieldExtractor
+
+STUB_FIELDS = {
+    "full_name": "Jane Doe",
+    "date_of_birth": "1990/01/01",
+    "nationality": "Testland",
+    "passport_number": "X1234567",
+    "current_address": None,
+    "phone_number": None,
+    "email": None
+}
+
+
+def make_handler(latency, fail_rate):
+    class StubDeepSeekHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if body.get("stream"):
+                self._stream(body, latency)
+                return
+            time.sleep(latency)
+            if random.random() < fail_rate:
+                status = random.choice([429, 503])
+                self._send(status, {"error": {"message": "stand-in failure", "type": "stub"}},
+                           {'Retry-After': '0'} if status == 429 else {})
+                return
+            self._send(200, {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps(STUB_FIELDS)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150}
+            })
+
+        def _stream(self, body, latency):
+            # Generation time is spread evenly over the tokens, as with a real model
+            content = json.dumps(STUB_FIELDS, indent=2)
+            pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            for piece in pieces:
+                time.sleep(latency / len(pieces))
+                chunk = {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubDeepSeekHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DeepSeek client benchmark against a local stand-in server')
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2, help='stand-in response time in seconds')
+    parser.add_argument('--fail-rate', type=float, default=0.2, help='share of requests answered with 429/503')
+    parser.add_argument('--rate-limit', type=float, default=50, help='client requests per second')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.latency, args.fail_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = DeepSeekClient(
+        'stub-key',
+        base_url=f"http://127.0.0.1:{server.server_port}",
+        backoff_base=0.05,
+        max_retries=6,
+        rate_limit=args.rate_limit,
+        burst=args.threads
+    )
+    extractor = FieldExtractor(client=client)
+
+    def one(i):
+        start = time.perf_counter()
+        # Distinct text per request; there is no cache configured anyway
+        result = extractor.extract_fields({"text": [f"Form {i}\nFull name ___"]})
+        return time.perf_counter() - start, result['status']
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    stats = client.stats()
+    print(f"requests:     {args.requests} ({sum(status == 'success' for _, status in results)} succeeded)")
+    print(f"wall time:    {elapsed:.2f}s ({args.requests / elapsed:.1f} extractions/sec)")
+    print(f"latency p50:  {statistics.median(latencies):.3f}s")
+    print(f"latency p95:  {latencies[int(len(latencies) * 0.95) - 1]:.3f}s")
+    print(f"attempts:     {stats['requests']} ({stats['retries']} retries, {stats['failures']} failures)")
+    print(f"throttled:    {stats['throttled_seconds']:.2f}s total")
+
+    # Time to first field when streaming vs. waiting for the whole response
+    start = time.perf_counter()
+    first_field = None
+    for event in extractor.stream_fields({"text": ["Streamed form\nFull name ___"]}):
+        if event['event'] == 'field' and first_field is None:
+            first_field = time.perf_counter() - start
+    total = time.perf_counter() - start
+    print(f"streaming:    first field after {first_field:.3f}s, complete after {total:.3f}s")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Compare the n-gram field matcher with the old all-pairs SequenceMatcher scan.
+
+Forms are synthetic field names built from section prefixes and profile-like
+words; profiles are the user_profiles columns plus --extra custom keys.
+
+Usage:
+    python benchmarks/bench_field_matcher.py --fields 200 500 --extra 100
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from field_matcher import FieldMatcher
+
+PROFILE_COLUMNS = [
+    'given_name', 'last_name', 'mobile_number', 'email_address', 'address_line1', 'address_line2',
+    'address_line3', 'address_line4', 'city', 'state', 'country', 'post_code', 'date_of_birth',
+    'passport_number', 'gender', 'ethnicity', 'religion'
+]
+SECTIONS = ['applicant_information', 'personal_details', 'contact', 'travel_document', 'sponsor',
+            'employment', 'previous_visits', 'family_member']
+WORDS = ['name', 'given_names', 'surname', 'family_name', 'date_of_birth', 'birth_place', 'passport_no',
+         'passport_number', 'issue_date', 'expiry_date', 'email', 'phone', 'mobile', 'address', 'city',
+         'country', 'postcode', 'occupation', 'employer', 'purpose', 'duration', 'relationship', 'gender',
+         'nationality', 'religion', 'signature', 'remarks']
+
+
+def sequence_matcher_match(field_name, profile_fields):
+    """The previous FormAutofill._match_field, kept as the baseline"""
+    normalize = lambda name: re.sub(r'[^a-z0-9]', '', name.lower())
+    normalized_field = normalize(field_name)
+    if normalized_field in profile_fields:
+        return normalized_field
+    best_match = None
+    best_score = 0.5
+    for profile_field in profile_fields:
+        score = SequenceMatcher(None, normalized_field, normalize(profile_field)).ratio()
+        if score > best_score:
+            best_score = score
+            best_match = profile_field
+    return best_match
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Field matcher benchmark')
+    parser.add_argument('--fields', type=int, nargs='+', default=[200, 500])
+    parser.add_argument('--extra', type=int, default=100, help='custom profile keys beyond the table columns')
+    parser.add_argument('--forms', type=int, default=5, help='forms filled per size (repeats hit the memo)')
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    profile = {column: 'x' for column in PROFILE_COLUMNS}
+    for i in range(args.extra):
+        profile[f"custom_{rng.choice(WORDS)}_{i}"] = 'x'
+
+    for count in args.fields:
+        names = [f"{rng.choice(SECTIONS)}_{rng.choice(WORDS)}" + (f"_{i}" if rng.random() < 0.3 else '')
+                 for i in range(count)]
+
+        start = time.perf_counter()
+        for _ in range(args.forms):
+            baseline = [sequence_matcher_match(name, profile) for name in names]
+        old = (time.perf_counter() - start) / args.forms
+
+        start = time.perf_counter()
+        matcher = FieldMatcher(profile)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        matched = matcher.match_many(names)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.forms):
+            matcher.match_many(names)
+        warm = (time.perf_counter() - start) / args.forms
+
+        agree = sum(a == b for a, b in zip(baseline, matched))
+        print(f"{count:4d} fields x {len(profile)} keys: SequenceMatcher {old * 1000:8.1f} ms/form, "
+              f"n-gram index build {build * 1000:.1f} ms, cold {cold * 1000:.1f} ms, "
+              f"memoized {warm * 1000:.2f} ms; "
+              f"matched {sum(m is not None for m in matched)} vs {sum(b is not None for b in baseline)}, "
+              f"{agree}/{count} same decision")
+
+
+if __name__ == '__main__':
+    main()
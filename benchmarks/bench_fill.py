@@ -0,0 +1,87 @@
+"""Measure PDF fill throughput for a form with many fields.
+
+Builds a synthetic form with --fields labelled text fields, once as a
+fillable AcroForm and once flat (labels only), then fills every field
+--runs times and reports fills per second and the size of the incremental
+update appended to the original.
+
+Usage:
+    python benchmarks/bench_fill.py --fields 300 --runs 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pdf_filler import PDFFiller
+
+
+def build_form(path, fields, fillable):
+    """Write a form with one 'Field N:' label per row, with or without text widgets"""
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 50
+    field_map = {}
+    for i in range(fields):
+        if y > 790:
+            page = doc.new_page()
+            y = 50
+        label = f"Field {i}"
+        page.insert_text((40, y + 12), f"{label}:", fontsize=10)
+        if fillable:
+            widget = fitz.Widget()
+            widget.field_name = f"form[0].page[{page.number}].field{i}[0]"
+            widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+            widget.rect = fitz.Rect(160, y, 520, y + 16)
+            page.add_widget(widget)
+            field_map[f"field_{i}"] = widget.field_name
+        y += 20
+    doc.save(path)
+    doc.close()
+    return field_map
+
+
+def bench(filler, path, values, field_map, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = filler.fill(path, values, field_map)
+        # Read the output the way the download endpoint streams it
+        for _chunk in filler.iter_file(result['path'], remove=True):
+            pass
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF fill throughput benchmark')
+    parser.add_argument('--fields', type=int, default=300)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    values = {f"field_{i}": f"Value number {i}" for i in range(args.fields)}
+    filler = PDFFiller()
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, fillable in (('acroform', True), ('overlay', False)):
+            path = os.path.join(tmp, f"{mode}.pdf")
+            field_map = build_form(path, args.fields, fillable)
+            timings, result = bench(filler, path, values, field_map, args.runs)
+            median = timings[len(timings) // 2]
+            written = result['widgets_filled'] + result['overlay_placed']
+            original = os.path.getsize(path)
+            print(f"{mode:8s}: {args.fields} fields, median {median * 1000:7.1f} ms/fill "
+                  f"({written / median:8.0f} fields/s, p90 {timings[int(len(timings) * 0.9)] * 1000:.1f} ms), "
+                  f"{original} -> {result['size']} bytes (+{result['size'] - original} appended), "
+                  f"{len(result['unplaced'])} unplaced")
+
+
+if __name__ == '__main__':
+    main()
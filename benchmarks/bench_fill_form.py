@@ -0,0 +1,110 @@
+"""Measure the CPU time of building the fill form for one request.
+
+Compares the previous build (a new DynamicForm class per request, with
+validators chosen by repeated substring scans) with the shared per-schema
+class, for forms of --fields fields. Both build the form entries and bind a
+form instance inside a request context, as a /fill request does.
+
+Usage:
+    python benchmarks/bench_fill_form.py --fields 50 300 --requests 200
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from flask import Flask
+from flask_wtf import FlaskForm
+from wtforms import StringField, validators
+
+from fill_form_handler import FillFormHandler
+
+SECTIONS = ['applicant', 'contact', 'travel_document', 'sponsor', 'employment']
+WORDS = ['given_name', 'surname', 'email_address', 'home_phone', 'mobile_phone', 'ssn', 'date_of_birth',
+         'passport_number', 'address', 'city', 'postcode', 'occupation', 'employer', 'remarks']
+
+
+def old_validators(field_name):
+    """The previous FillFormHandler._create_field_validators, kept as the baseline"""
+    validators_list = [validators.DataRequired()]
+    if 'email' in field_name.lower():
+        validators_list.append(validators.Email())
+    elif 'phone' in field_name.lower():
+        validators_list.append(validators.Regexp(r'^\+?1?\d{9,15}$'))
+    elif 'ssn' in field_name.lower():
+        validators_list.append(validators.Regexp(r'^\d{3}-?\d{2}-?\d{4}$'))
+    return validators_list
+
+
+def old_build_form_fields(fields, form_class, prefix=''):
+    form_fields = []
+    for field_name, field_value in fields.items():
+        full_name = f"{prefix}_{field_name}" if prefix else field_name
+        sanitized_name = FillFormHandler._sanitize_field_name(full_name)
+        if isinstance(field_value, dict):
+            form_fields.append(FillFormHandler._section_info(sanitized_name, field_name))
+            form_fields.extend(old_build_form_fields(field_value, form_class, sanitized_name))
+        else:
+            field_info = {
+                'name': sanitized_name,
+                'label': field_name.replace('_', ' ').title(),
+                'type': 'text',
+                'value': str(field_value) if field_value is not None else '',
+                'required': True
+            }
+            setattr(form_class, sanitized_name,
+                    StringField(field_info['label'], validators=old_validators(field_name)))
+            form_fields.append(field_info)
+    return form_fields
+
+
+def old_build_form(extracted_fields):
+    """The previous FillFormHandler.build_form"""
+    class DynamicForm(FlaskForm):
+        pass
+    form_fields = old_build_form_fields(extracted_fields, DynamicForm)
+    return DynamicForm(), form_fields
+
+
+def make_fields(count, rng):
+    fields = {}
+    for i in range(count):
+        section = fields.setdefault(rng.choice(SECTIONS), {})
+        section[f"{rng.choice(WORDS)}_{i}"] = rng.choice(['', 'value'])
+    return fields
+
+
+def cpu_per_request(build, fields, requests):
+    start = time.process_time()
+    for _ in range(requests):
+        build(fields)
+    return (time.process_time() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill form build benchmark')
+    parser.add_argument('--fields', type=int, nargs='+', default=[50, 300])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='bench', WTF_CSRF_ENABLED=False)
+    rng = random.Random(5)
+    with app.test_request_context('/fill/1'):
+        for count in args.fields:
+            fields = make_fields(count, rng)
+            old = cpu_per_request(old_build_form, fields, args.requests)
+            start = time.process_time()
+            FillFormHandler.build_form(fields)
+            first = time.process_time() - start
+            cached = cpu_per_request(FillFormHandler.build_form, fields, args.requests)
+            print(f"{count:4d} fields: new class per request {old * 1000:6.2f} ms CPU, "
+                  f"first build {first * 1000:6.2f} ms, cached class {cached * 1000:6.2f} ms "
+                  f"({(old - cached) * 1000:.2f} ms saved per request, {old / cached:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Measure time to first byte and transfer size of the fill form page.
+
+Serves fill_form.html for a form of --fields entries from a local server,
+once rendered in one piece and sent uncompressed (the previous behaviour)
+and once streamed and gzipped, and fetches each --requests times.
+
+Usage:
+    python benchmarks/bench_fill_page.py --fields 100 300 1000 --requests 20
+"""
+import argparse
+import http.client
+import logging
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from compression import ResponseCompressor
+from fill_form_handler import FillFormHandler
+
+SECTIONS = ['applicant', 'contact', 'travel_document', 'sponsor', 'employment', 'previous_visits']
+WORDS = ['given_name', 'surname', 'email_address', 'home_phone', 'date_of_birth', 'passport_number',
+         'address', 'city', 'postcode', 'occupation', 'employer', 'remarks']
+
+
+def make_fields(count):
+    fields = {}
+    for i in range(count):
+        section = fields.setdefault(SECTIONS[i % len(SECTIONS)], {})
+        section[f"{WORDS[i % len(WORDS)]}_{i}"] = f"value {i}" if i % 3 else ''
+    return fields
+
+
+def make_app(fields, streamed):
+    app = Flask(__name__, template_folder=str(ROOT / 'templates'))
+    app.config.update(SECRET_KEY='bench', WTF_CSRF_ENABLED=False)
+    if streamed:
+        ResponseCompressor(app)
+
+    @app.route('/fill')
+    def fill():
+        return FillFormHandler.handle_fill_form(fields, '', stream_min_fields=1 if streamed else None)
+
+    return app
+
+
+def fetch(port):
+    """Time to the first body byte, total time and bytes on the wire for one request"""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    start = time.perf_counter()
+    conn.request('GET', '/fill', headers={'Accept-Encoding': 'gzip'})
+    response = conn.getresponse()
+    size = len(response.read1(65536))
+    first_byte = time.perf_counter() - start
+    size += len(response.read())
+    total = time.perf_counter() - start
+    conn.close()
+    return first_byte, total, size
+
+
+def measure(app, requests):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        fetch(server.port)  # warm up templates and the form class
+        runs = [fetch(server.port) for _ in range(requests)]
+    finally:
+        server.shutdown()
+    return (statistics.median(run[0] for run in runs), statistics.median(run[1] for run in runs), runs[0][2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill form page benchmark')
+    parser.add_argument('--fields', type=int, nargs='+', default=[100, 300, 1000])
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    for count in args.fields:
+        fields = make_fields(count)
+        for label, streamed in (('buffered, identity', False), ('streamed, gzip   ', True)):
+            first_byte, total, size = measure(make_app(fields, streamed), args.requests)
+            print(f"{count:5d} fields {label}: first byte {first_byte * 1000:6.1f} ms, "
+                  f"complete {total * 1000:6.1f} ms, {size / 1024:7.1f} KiB transferred")
+
+
+if __name__ == '__main__':
+    main()
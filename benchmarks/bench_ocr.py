@@ -0,0 +1,52 @@
+"""Compare OCR throughput of the in-memory page path against the temp PNG path.
+
+Usage:
+    python benchmarks/bench_ocr.py "Sample Files/Visa Application_blank.pdf" --rounds 3
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fitz  # PyMuPDF
+
+from ocr_processor import SmartPDFProcessor
+
+
+def bench(processor, pdf_path, pages, in_memory, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        processor._run_ocr(pdf_path, pages, in_memory=in_memory)
+        best = min(best, time.perf_counter() - start)
+    return len(pages) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR path benchmark')
+    parser.add_argument('pdf_path', nargs='?', default='Sample Files/Visa Application_blank.pdf')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--max-pages', type=int)
+    args = parser.parse_args()
+
+    with fitz.open(args.pdf_path) as doc:
+        total_pages = len(doc)
+    pages = list(range(min(total_pages, args.max_pages or total_pages)))
+
+    processor = SmartPDFProcessor()
+    processor._init_ocr()
+    # Warm up the engine so model loading is not counted against either path
+    processor._run_ocr(args.pdf_path, pages[:1])
+
+    file_rate = bench(processor, args.pdf_path, pages, False, args.rounds)
+    memory_rate = bench(processor, args.pdf_path, pages, True, args.rounds)
+
+    print(f"pages:          {len(pages)}")
+    print(f"temp PNG path:  {file_rate:.2f} pages/sec")
+    print(f"in-memory path: {memory_rate:.2f} pages/sec ({memory_rate / file_rate:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
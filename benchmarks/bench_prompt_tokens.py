@@ -0,0 +1,50 @@
+"""Measure how many tokens the compact text view saves over raw_text.
+
+Counts use tiktoken's cl100k_base encoding when it is available (a close
+stand-in for the DeepSeek tokenizer). Otherwise they fall back to an estimate
+of one token per Latin word, digit, symbol or non-Latin character.
+
+Usage:
+    python benchmarks/bench_prompt_tokens.py "Sample Files/Visa Application_blank.pdf"
+"""
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ocr_processor import SmartPDFProcessor
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+
+    def count_tokens(text):
+        return len(_encoding.encode(text))
+except Exception:  # not installed, or the encoding cannot be downloaded
+    def count_tokens(text):
+        return len(re.findall(r'[A-Za-z]+|[^\sA-Za-z]', text))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prompt token benchmark')
+    parser.add_argument('pdf_path', nargs='?', default='Sample Files/Visa Application_blank.pdf')
+    args = parser.parse_args()
+
+    result = SmartPDFProcessor().process_pdf(args.pdf_path, compact=True)
+    raw_tokens = count_tokens(result['raw_text'])
+    compact_tokens = count_tokens(result['compact_text'])
+    # What extract_fields serialises for the model today: the json.dumps'd input dict
+    request_tokens = count_tokens(json.dumps({"text": [result['raw_text']], "pdf_path": args.pdf_path}))
+
+    print(f"raw_text:            {raw_tokens:6d} tokens ({len(result['raw_text'])} chars)")
+    print(f"json-encoded input:  {request_tokens:6d} tokens")
+    print(f"compact_text:        {compact_tokens:6d} tokens ({len(result['compact_text'])} chars)")
+    print(f"reduction vs raw:    {1 - compact_tokens / raw_tokens:.1%}")
+    print(f"reduction vs json:   {1 - compact_tokens / request_tokens:.1%}")
+
+
+if __name__ == '__main__':
+    main()
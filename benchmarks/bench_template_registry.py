@@ -0,0 +1,65 @@
+"""Measure template registry lookup time as the number of stored templates grows.
+
+Synthetic templates are random shingle sets. Each lookup is a near-duplicate
+of one stored template, with 5% of its shingles replaced.
+
+Usage:
+    python benchmarks/bench_template_registry.py --templates 20000 --lookups 200
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from template_registry import TemplateRegistry
+
+
+def synthetic_fingerprint(registry, tokens):
+    return {
+        "page_count": 5,
+        "page_sizes": [[595.0, 842.0]] * 5,
+        "signature": registry._minhash(tokens)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Template registry lookup benchmark')
+    parser.add_argument('--templates', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--shingles', type=int, default=500, help='shingles per template')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = TemplateRegistry(Path(tmp) / 'templates.db')
+        token_sets = []
+        checkpoints = sorted({min(args.templates, n) for n in (100, 1000, 10000, args.templates)})
+
+        start = time.perf_counter()
+        for count in checkpoints:
+            while len(token_sets) < count:
+                tokens = {f"t{rng.getrandbits(40)}" for _ in range(args.shingles)}
+                token_sets.append(tokens)
+                registry.add(synthetic_fingerprint(registry, tokens), {"field": None})
+
+            matched = 0
+            lookup_start = time.perf_counter()
+            for _ in range(args.lookups):
+                tokens = set(rng.choice(token_sets))
+                for token in rng.sample(sorted(tokens), len(tokens) // 20):
+                    tokens.discard(token)
+                    tokens.add(f"n{rng.getrandbits(40)}")
+                matched += registry.lookup(synthetic_fingerprint(registry, tokens)) is not None
+            per_lookup = (time.perf_counter() - lookup_start) / args.lookups
+
+            print(f"{count:6d} templates: {per_lookup * 1000:7.2f} ms/lookup, "
+                  f"{matched}/{args.lookups} matched")
+        print(f"build time: {time.perf_counter() - start:.1f}s, stats: {registry.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Fill one form for many user profiles and write the results to a ZIP.
+
+Usage:
+    python bulk_fill.py "Sample Files/form.pdf" -o filled.zip --workers 4
+"""
+import argparse
+import logging
+import multiprocessing
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from field_matcher import FieldMatcher
+from form_autofill import FormAutofill, NON_PROFILE_COLUMNS
+from pdf_filler import PDFFiller
+from template_registry import blank_schema
+
+logger = logging.getLogger(__name__)
+
+# Per-process filler used by pool workers; set up once by the initializer
+_worker_filler = None
+_worker_form = None
+
+def _init_fill_worker(pdf_path: str, field_map: Dict[str, str], tmp_dir: str):
+    """Process pool initializer: keep the form and a filler for every task"""
+    global _worker_filler, _worker_form
+    _worker_filler = PDFFiller(tmp_dir)
+    _worker_form = (pdf_path, field_map)
+
+def _fill_worker(fields: Dict[str, Any]) -> Dict:
+    """Fill the form with one profile's values inside a pool worker"""
+    pdf_path, field_map = _worker_form
+    return _worker_filler.fill(pdf_path, fields, field_map)
+
+def _discard_result(future):
+    if not future.cancelled() and future.exception() is None:
+        Path(future.result()['path']).unlink(missing_ok=True)
+
+def _leaf_paths(fields: Dict[str, Any], path: Tuple = ()) -> List[Tuple]:
+    paths = []
+    for name, value in fields.items():
+        if isinstance(value, dict):
+            paths.extend(_leaf_paths(value, path + (name,)))
+        else:
+            paths.append(path + (name,))
+    return paths
+
+class _ZipStream:
+    """Write-only file object that collects what ZipFile writes until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+class BulkFiller:
+    """Fill one form for many profiles in parallel worker processes
+
+    The field-to-profile-column mapping is computed once for the form; each
+    profile then only needs its values looked up and written into a copy of
+    the PDF. Results come back in profile order and at most a few fills are
+    in flight at a time, so memory stays flat for any number of profiles.
+    """
+
+    def __init__(self, pdf_path: str, extracted_fields: Dict[str, Any], field_map: Dict[str, str] = None,
+                 workers: int = 0, tmp_dir: str = None):
+        """
+        Args:
+            pdf_path: The uploaded form
+            extracted_fields: Its extracted (or stored) fields
+            field_map: Field name to AcroForm widget name, for fillable forms
+            workers: Number of fill worker processes; 0 or 1 fills in-process
+            tmp_dir: Where filled copies are written until they are zipped
+        """
+        self.pdf_path = pdf_path
+        self.extracted_fields = extracted_fields
+        self.field_map = field_map or {}
+        self.workers = workers or 0
+        self.tmp_dir = tmp_dir
+        self.filler = PDFFiller(tmp_dir)
+        self.mapping = None
+        self._pool = None
+
+    def map_fields(self, profile_columns: Iterable[str]) -> Dict[Tuple, str]:
+        """Match every form field to a profile column; unmatched fields are left out"""
+        matcher = FieldMatcher(column for column in profile_columns if column not in NON_PROFILE_COLUMNS)
+        paths = _leaf_paths(self.extracted_fields)
+        mapping = {
+            path: column
+            for path, column in zip(paths, matcher.match_many(str(path[-1]) for path in paths))
+            if column
+        }
+        logger.info(f"Mapped {len(mapping)} of {len(paths)} form fields to profile columns")
+        return mapping
+
+    def profile_fields(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        """The form's fields with one profile's values; fields without a match stay empty"""
+        if self.mapping is None:
+            self.mapping = self.map_fields(profile.keys())
+        fields = blank_schema(self.extracted_fields)
+        for path, column in self.mapping.items():
+            value = profile.get(column)
+            if value in (None, ''):
+                continue
+            node = fields
+            for key in path[:-1]:
+                node = node[key]
+            node[path[-1]] = FormAutofill.format_value(str(path[-1]), value)
+        return fields
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            logger.info(f"Starting fill pool with {self.workers} workers...")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # spawn keeps the workers free of the web app's threads and connections
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_fill_worker,
+                initargs=(self.pdf_path, self.field_map, self.tmp_dir)
+            )
+        return self._pool
+
+    def iter_filled(self, profiles: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Dict, Dict]]:
+        """Yield (profile, fill result) in profile order
+
+        A failed fill yields a result with an "error" key instead of a path.
+        The caller owns the filled copies and should delete them.
+        """
+        if self.workers <= 1:
+            for profile in profiles:
+                try:
+                    yield profile, self.filler.fill(self.pdf_path, self.profile_fields(profile), self.field_map)
+                except Exception as e:
+                    logger.error(f"Fill failed for profile {profile.get('id')}: {str(e)}")
+                    yield profile, {"error": str(e)}
+            return
+
+        pool = self._get_pool()
+        window = deque()
+        profiles = iter(profiles)
+        exhausted = False
+        try:
+            while True:
+                # Keep every worker busy plus one queued fill each, without reading ahead further
+                while not exhausted and len(window) < self.workers * 2:
+                    profile = next(profiles, None)
+                    if profile is None:
+                        exhausted = True
+                        break
+                    window.append((profile, pool.submit(_fill_worker, self.profile_fields(profile))))
+                if not window:
+                    return
+                profile, future = window.popleft()
+                try:
+                    yield profile, future.result()
+                except Exception as e:
+                    logger.error(f"Fill failed for profile {profile.get('id')}: {str(e)}")
+                    yield profile, {"error": str(e)}
+        finally:
+            # Stopped early: drop queued fills and clean up after the ones already running
+            for _, future in window:
+                if not future.cancel():
+                    future.add_done_callback(_discard_result)
+
+    @staticmethod
+    def entry_name(profile: Dict[str, Any]) -> str:
+        name = re.sub(r'[^\w.-]+', '_', str(profile.get('username') or 'profile')).strip('_')
+        return f"{profile.get('id', 0):06d}_{name or 'profile'}.pdf"
+
+    def iter_zip(self, profiles: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        """Yield a ZIP of the filled forms as it is written, one PDF at a time
+
+        Fills that failed are listed in errors.txt at the end of the archive.
+        """
+        start_time = time.perf_counter()
+        stream = _ZipStream()
+        filled = 0
+        errors = []
+        pending = None
+        try:
+            # PDFs barely compress, so entries are stored as they are
+            with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+                for profile, result in self.iter_filled(profiles):
+                    if 'error' in result:
+                        errors.append(f"{self.entry_name(profile)}: {result['error']}")
+                        continue
+                    pending = result['path']
+                    with archive.open(self.entry_name(profile), 'w') as entry:
+                        for chunk in self.filler.iter_file(pending, remove=True):
+                            entry.write(chunk)
+                            data = stream.drain()
+                            if data:
+                                yield data
+                    pending = None
+                    filled += 1
+                if errors:
+                    archive.writestr('errors.txt', "\n".join(errors) + "\n")
+            yield stream.drain()
+            logger.info(f"Bulk filled {filled} forms ({len(errors)} failed) "
+                        f"in {time.perf_counter() - start_time:.1f}s")
+        finally:
+            if pending is not None:
+                Path(pending).unlink(missing_ok=True)
+            self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+def extract_form(pdf_path: str) -> Dict:
+    """Extract a form's fields the way an upload job does, for command-line use"""
+    from ocr_processor import SmartPDFProcessor
+    from fieldextractor import FieldExtractor
+
+    ocr_result = SmartPDFProcessor().process_pdf(pdf_path, compact=True)
+    if ocr_result.get("form_widgets"):
+        return FieldExtractor.extract_from_widgets(ocr_result["form_widgets"])
+    from deepseek_client import DeepSeekClient
+    return FieldExtractor(client=DeepSeekClient.from_env()).extract_fields_chunked(ocr_result["pages"])
+
+def main():
+    from database import iter_user_profiles
+
+    parser = argparse.ArgumentParser(description='Fill one form for every user profile')
+    parser.add_argument('pdf', help='blank form to fill')
+    parser.add_argument('-o', '--output', default='filled_forms.zip')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=200, help='profiles read per query')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    extracted = extract_form(args.pdf)
+    if extracted.get('status') != 'success':
+        parser.error(f"Could not extract form fields: {extracted.get('error', 'Unknown error')}")
+
+    bulk = BulkFiller(args.pdf, extracted['extracted_fields'], extracted.get('field_map'), workers=args.workers)
+    with open(args.output, 'wb') as f:
+        for chunk in bulk.iter_zip(iter_user_profiles(args.batch_size)):
+            f.write(chunk)
+    print(f"Wrote {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional
+
+from flask import Flask, Response, current_app, request
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+class ResponseCompressor:
+    """Gzip text responses for clients that accept it
+
+    Buffered responses are compressed in one go. Streamed responses are
+    compressed chunk by chunk with a sync flush after each, so the browser
+    can render every chunk as soon as it arrives. Files served by Flask
+    (static assets) are compressed too, once per file version: the gzipped
+    bytes are kept keyed on path, mtime and size. PDFs and ZIPs are left
+    alone.
+    """
+
+    MIMETYPES = ('text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                 'application/json', 'image/svg+xml')
+
+    STATIC_CACHE_ENTRIES = 256  # compressed static files kept in memory
+    STATIC_CACHE_MAX_FILE = 1024 * 1024  # larger static files are compressed on every request
+
+    def __init__(self, app: Flask = None, min_size: int = 500, level: int = 6):
+        self.min_size = min_size
+        self.level = level
+        self._static_cache = OrderedDict()
+        self._static_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        app.after_request(self.after_request)
+
+    def after_request(self, response: Response) -> Response:
+        if response.mimetype not in self.MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or 'Content-Encoding' in response.headers
+                or request.method == 'HEAD' or not request.accept_encodings['gzip']):
+            return response
+
+        if response.is_streamed and not response.direct_passthrough:
+            response.response = self._gzip_stream(response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            key = self._static_key(response)
+            body = self._cached_static(key) if key else None
+            if body is not None:
+                # Same file version as last time: drop the open file and reuse its gzip
+                if hasattr(response.response, 'close'):
+                    response.response.close()
+            else:
+                # Files from send_file are passed through; read them so they can be compressed
+                response.direct_passthrough = False
+                data = response.get_data()
+                if len(data) < self.min_size:
+                    return response
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+                body = compressor.compress(data) + compressor.flush()
+                if key and len(data) <= self.STATIC_CACHE_MAX_FILE:
+                    self._cache_static(key, body)
+            response.direct_passthrough = False
+            response.set_data(body)
+
+        response.headers['Content-Encoding'] = 'gzip'
+        # The compressed body is a different byte sequence than the one a strong ETag names
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _static_key(self, response: Response) -> Optional[tuple]:
+        """Identify the file version behind a static file response, or None for other responses"""
+        if request.endpoint != 'static' or not response.direct_passthrough:
+            return None
+        path = safe_join(current_app.static_folder, request.view_args.get('filename', ''))
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_mtime_ns, stat.st_size, self.level
+
+    def _cached_static(self, key: tuple) -> Optional[bytes]:
+        with self._static_lock:
+            body = self._static_cache.get(key)
+            if body is not None:
+                self._static_cache.move_to_end(key)
+            return body
+
+    def _cache_static(self, key: tuple, body: bytes):
+        with self._static_lock:
+            # An older version of the same file is never served again
+            for stale in [old for old in self._static_cache if old[0] == key[0]]:
+                del self._static_cache[stale]
+            self._static_cache[key] = body
+            while len(self._static_cache) > self.STATIC_CACHE_ENTRIES:
+                self._static_cache.popitem(last=False)
+
+    def _gzip_stream(self, chunks: Iterable) -> Iterator[bytes]:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            # Closing the wrapped generator releases the request context it holds
+            if hasattr(chunks, 'close'):
+                chunks.close()
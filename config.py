@@ -18,4 +18,84 @@ class Config:
     
     # File upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
-    UPLOAD_FOLDER = 'uploads' 
\ No newline at end of file
+    UPLOAD_FOLDER = 'uploads' 
+    
+    # OCR settings
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS', 0))  # 0 = OCR in the request process
+    OCR_PAGE_TIMEOUT = float(os.environ.get('OCR_PAGE_TIMEOUT', 120))  # seconds per page in worker mode
+    
+    # Cache of process_pdf results, keyed by PDF content and processing options
+    PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', os.path.join('cache', 'pdf_results'))
+    PDF_CACHE_MEMORY_ITEMS = int(os.environ.get('PDF_CACHE_MEMORY_ITEMS', 128))
+    PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    
+    # Cache of parsed DeepSeek extractions, keyed by form text, model and prompt version
+    EXTRACTION_CACHE_PATH = os.environ.get('EXTRACTION_CACHE_PATH', os.path.join('cache', 'extraction_cache.db'))
+    EXTRACTION_CACHE_TTL = int(os.environ.get('EXTRACTION_CACHE_TTL', 7 * 24 * 3600))  # seconds
+    EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    
+    # Upper bound on estimated input tokens (instructions plus form text) per extraction request
+    LLM_MAX_INPUT_TOKENS = int(os.environ.get('LLM_MAX_INPUT_TOKENS', 6000))
+    
+    # Long documents are extracted in page chunks of this many estimated tokens, several requests at a time
+    LLM_CHUNK_TOKENS = int(os.environ.get('LLM_CHUNK_TOKENS', 3000))
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+    
+    # DeepSeek HTTP client (DEEPSEEK_BASE_URL, read with the API key, can point at a local stand-in server)
+    LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))  # seconds per attempt
+    LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 10))
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 4))  # on 429, 5xx, timeouts and connection errors
+    LLM_BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', 0.5))  # seconds, doubled per retry with jitter
+    LLM_BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', 20))
+    LLM_RATE_LIMIT = float(os.environ.get('LLM_RATE_LIMIT', 5))  # requests per second across the app
+    LLM_RATE_BURST = int(os.environ.get('LLM_RATE_BURST', 10))
+    LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', 16))
+    
+    # Show extracted fields on the job status page as the model generates them
+    STREAM_EXTRACTION = os.environ.get('STREAM_EXTRACTION', '1').lower() not in ('0', 'false', 'no')
+    
+    # Registry of recurring blank forms, matched by page layout and MinHash similarity
+    TEMPLATE_REGISTRY_PATH = os.environ.get('TEMPLATE_REGISTRY_PATH', os.path.join('cache', 'form_templates.db'))
+    TEMPLATE_MATCH_THRESHOLD = float(os.environ.get('TEMPLATE_MATCH_THRESHOLD', 0.8))  # estimated Jaccard similarity
+    
+    # Background upload jobs, persisted so they survive a restart
+    JOB_DB_PATH = os.environ.get('JOB_DB_PATH', 'jobs.db')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_EVENTS_KEEPALIVE = float(os.environ.get('JOB_EVENTS_KEEPALIVE', 15))  # seconds between idle event stream pings
+    
+    # Stored extraction results, finished jobs and their uploads are purged after this long
+    FORM_DATA_TTL = int(os.environ.get('FORM_DATA_TTL', 24 * 3600))  # seconds
+    PURGE_INTERVAL = int(os.environ.get('PURGE_INTERVAL', 3600))  # seconds between purge runs
+    PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 500))  # rows deleted per transaction
+    
+    # Content-addressed upload store: reference database and total size budget
+    UPLOAD_STORE_DB_PATH = os.environ.get('UPLOAD_STORE_DB_PATH', 'upload_store.db')
+    UPLOAD_STORE_MAX_BYTES = int(os.environ.get('UPLOAD_STORE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+    
+    # Scratch directory for filled PDFs while they are streamed; defaults to the system temp dir
+    FILLED_PDF_DIR = os.environ.get('FILLED_PDF_DIR')
+    
+    # Users allowed to run admin tools such as bulk fill (comma-separated usernames)
+    ADMIN_USERS = {name.strip() for name in os.environ.get('ADMIN_USERS', '').split(',') if name.strip()}
+    
+    # Bulk fill: worker processes and profiles read per query
+    BULK_FILL_WORKERS = int(os.environ.get('BULK_FILL_WORKERS', os.cpu_count() or 2))
+    BULK_FILL_BATCH_SIZE = int(os.environ.get('BULK_FILL_BATCH_SIZE', 200))
+    
+    # Distinct users who must make the same field mapping correction before it applies to everyone
+    FIELD_MAPPING_AGREEMENT = int(os.environ.get('FIELD_MAPPING_AGREEMENT', 3))
+    
+    # Release identifier; part of the fill page ETag so a deploy never revalidates stale pages
+    APP_VERSION = os.environ.get('APP_VERSION', '')
+    
+    # Fill forms with at least this many entries are streamed to the browser while they render
+    FILL_FORM_STREAM_FIELDS = int(os.environ.get('FILL_FORM_STREAM_FIELDS', 100))
+    
+    # Gzip text responses (pages, JSON, static assets) of at least this many bytes
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    
+    # users.db connection pool: connections kept open, lock wait and prepared statements cached per connection
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 16))
+    DB_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', 10000))  # milliseconds
+    DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 256))
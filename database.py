@@ -1,32 +1,136 @@
 import sqlite3
 import os
-from flask import g
+import json
+import queue
+import threading
+from flask import g, has_app_context
 from functools import wraps
 import logging
+from config import Config
 
 logger = logging.getLogger(__name__)
 
 # Define the database path
 DATABASE = 'users.db'
 
+class ConnectionPool:
+    """Open SQLite connections to one database, handed out and taken back
+
+    Connections are set up once for concurrent use: WAL journal so readers
+    never block the writer, synchronous=NORMAL (safe with WAL), and a busy
+    timeout so a writer waits for the lock instead of failing with
+    "database is locked". Reusing connections also reuses their prepared
+    statement caches. When every pooled connection is in use an extra one
+    is opened, and closed again when it comes back.
+    """
+
+    def __init__(self, path: str, size: int = 16, busy_timeout: int = 10000, cached_statements: int = 256):
+        self.path = path
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'opened': 0,
+            'reused': 0,
+            'closed': 0
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            cached_statements=self.cached_statements,
+            # A connection is used by one thread at a time, but not always the same one
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+            with self._lock:
+                self._stats['opened'] += 1
+            return conn
+        with self._lock:
+            self._stats['reused'] += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            conn.close()
+            with self._lock:
+                self._stats['closed'] += 1
+
+    def close(self):
+        """Close the idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle'] = self._idle.qsize()
+        return stats
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """The connection pool of the users database, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DATABASE, Config.DB_POOL_SIZE, Config.DB_BUSY_TIMEOUT,
+                                   Config.DB_STATEMENT_CACHE_SIZE)
+        return _pool
+
 def get_db_connection():
-    """Create and return a new database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Return the current request's database connection, taken from the pool on first use
+
+    Outside an app context a connection is borrowed from the pool instead;
+    hand it back with close_db_connection(conn).
+    """
+    if has_app_context():
+        if 'db' not in g:
+            g.db = get_pool().acquire()
+        return g.db
+    return get_pool().acquire()
 
 def close_db_connection(conn=None):
-    """Close a specific database connection"""
-    if conn is not None:
-        conn.close()
+    """Return a connection to the pool; without one, the current request's connection
+
+    The request's own connection is only returned by the call without
+    arguments, made when the app context is torn down.
+    """
+    if conn is None:
+        conn = g.pop('db', None) if has_app_context() else None
+        if conn is None:
+            return
+    elif has_app_context() and g.get('db') is conn:
+        return
+    get_pool().release(conn)
 
 def with_db_connection(func):
     """Decorator to handle database connections"""
     @wraps(func)
     def wrapper(*args, **kwargs):
-        # Create a new connection for this request
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row
+        # The request's connection, or one borrowed from the pool outside a request
+        conn = get_db_connection()
         
         try:
             # Pass the connection as first argument
@@ -38,13 +142,21 @@ def with_db_connection(func):
             logger.error(f"Database error in {func.__name__}: {str(e)}")
             raise
         finally:
-            conn.close()  # Always close the connection
+            close_db_connection(conn)  # Back to the pool unless the request holds it
     return wrapper
 
+def _add_missing_column(conn, table, column, definition):
+    """Add a column that databases created by an older version of init_db lack"""
+    columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
 def init_db():
     """Initialize the database with required tables"""
+    # Borrowed from the pool directly: at startup the app context that would
+    # hand a request connection back may not be torn down
+    conn = get_pool().acquire()
     try:
-        conn = get_db_connection()
         # Create users table
         conn.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -76,6 +188,7 @@ def init_db():
                 gender TEXT,
                 ethnicity TEXT,
                 religion TEXT,
+                version INTEGER NOT NULL DEFAULT 0,
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
@@ -88,13 +201,54 @@ def init_db():
                 pdf_path TEXT,
                 form_fields TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                version INTEGER NOT NULL DEFAULT 0,
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
         
+        # Row versions, bumped on every update, let the fill page revalidate cheaply
+        for table in ('user_profiles', 'temp_form_data'):
+            _add_missing_column(conn, table, 'version', 'INTEGER NOT NULL DEFAULT 0')
+        
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_temp_form_data_user_created
+            ON temp_form_data (user_id, created_at)
+        ''')
+
+        # Learned form field -> user_profiles column mappings, per form schema.
+        # A NULL column records that the field should not be autofilled.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS field_mappings (
+                schema_signature TEXT NOT NULL,
+                field_name TEXT NOT NULL,
+                profile_column TEXT,
+                source TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                version INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (schema_signature, field_name)
+            )
+        ''')
+
+        # Each user's own corrections to the shared mappings above. They apply to
+        # that user only, until enough users agree to change the shared row.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS field_mapping_overrides (
+                schema_signature TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                field_name TEXT NOT NULL,
+                profile_column TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                version INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (schema_signature, field_name, user_id),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        for table in ('field_mappings', 'field_mapping_overrides'):
+            _add_missing_column(conn, table, 'version', 'INTEGER NOT NULL DEFAULT 1')
+
         conn.commit()
     finally:
-        conn.close()
+        get_pool().release(conn)
 
 @with_db_connection
 def get_all_users(conn):
@@ -133,4 +287,229 @@ def count_users(conn):
         return result['count']
     except sqlite3.Error as e:
         logger.error(f"Error counting users: {e}")
-        return 0
\ No newline at end of file
+        return 0
+
+@with_db_connection
+def get_user_id(conn, username):
+    """Return the id of a user, or None if there is no such user"""
+    row = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+    return row['id'] if row else None
+
+@with_db_connection
+def save_form_data(conn, user_id, pdf_path, form_fields):
+    """Store an upload's extraction result and return its id"""
+    cursor = conn.execute(
+        'INSERT INTO temp_form_data (user_id, pdf_path, form_fields) VALUES (?, ?, ?)',
+        (user_id, pdf_path, json.dumps(form_fields, ensure_ascii=False))
+    )
+    return cursor.lastrowid
+
+@with_db_connection
+def get_form_data(conn, form_id, user_id):
+    """Return a stored extraction result owned by user_id, or None"""
+    row = conn.execute(
+        'SELECT * FROM temp_form_data WHERE id = ? AND user_id = ?',
+        (form_id, user_id)
+    ).fetchone()
+    if row is None:
+        return None
+    form_data = dict(row)
+    form_data['form_fields'] = json.loads(form_data['form_fields'])
+    return form_data
+
+@with_db_connection
+def update_form_fields(conn, form_id, user_id, form_fields):
+    """Replace the stored fields of a form, e.g. after the user submitted it"""
+    conn.execute(
+        'UPDATE temp_form_data SET form_fields = ?, version = version + 1 WHERE id = ? AND user_id = ?',
+        (json.dumps(form_fields, ensure_ascii=False), form_id, user_id)
+    )
+
+def purge_form_data(max_age_seconds, batch_size=500):
+    """Delete stored form data older than max_age_seconds in small batches
+
+    Each batch is its own transaction so the users database is never
+    locked for long. Returns the ids of the deleted rows.
+    """
+    form_ids = []
+    while True:
+        batch = _purge_form_data_batch(max_age_seconds, batch_size)
+        form_ids.extend(batch)
+        if len(batch) < batch_size:
+            return form_ids
+
+@with_db_connection
+def _purge_form_data_batch(conn, max_age_seconds, batch_size):
+    rows = conn.execute('''
+        SELECT id FROM temp_form_data
+        WHERE created_at < datetime('now', ?)
+        ORDER BY created_at
+        LIMIT ?
+    ''', (f'-{int(max_age_seconds)} seconds', batch_size)).fetchall()
+    conn.executemany('DELETE FROM temp_form_data WHERE id = ?', [(row['id'],) for row in rows])
+    return [row['id'] for row in rows]
+
+def iter_user_profiles(batch_size=200):
+    """Yield every user profile, with its username, in user_profiles.id order
+
+    Profiles are read in keyset-paginated batches, one short transaction
+    each, so memory stays flat however many profiles there are.
+    """
+    last_id = 0
+    while True:
+        batch = _user_profile_batch(last_id, batch_size)
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1]['id']
+
+@with_db_connection
+def _user_profile_batch(conn, after_id, batch_size):
+    rows = conn.execute('''
+        SELECT user_profiles.*, users.username
+        FROM user_profiles
+        JOIN users ON users.id = user_profiles.user_id
+        WHERE user_profiles.id > ?
+        ORDER BY user_profiles.id
+        LIMIT ?
+    ''', (after_id, batch_size)).fetchall()
+    return [dict(row) for row in rows]
+
+@with_db_connection
+def get_field_mapping(conn, schema_signature, username=None):
+    """Return the stored field -> profile column mapping of a form schema, or None if there is none
+
+    With a username, that user's own corrections replace the shared entries.
+    """
+    rows = conn.execute(
+        'SELECT field_name, profile_column FROM field_mappings WHERE schema_signature = ?',
+        (schema_signature,)
+    ).fetchall()
+    if not rows:
+        return None
+    mapping = {row['field_name']: row['profile_column'] for row in rows}
+    if username is not None:
+        overrides = conn.execute('''
+            SELECT field_name, profile_column FROM field_mapping_overrides
+            WHERE schema_signature = ? AND user_id = (SELECT id FROM users WHERE username = ?)
+        ''', (schema_signature, username)).fetchall()
+        mapping.update((row['field_name'], row['profile_column']) for row in overrides)
+    return mapping
+
+# Every change bumps the row's version, so the versions' sum names a mapping's state exactly
+_UPSERT_FIELD_MAPPING_SQL = '''
+    INSERT INTO field_mappings (schema_signature, field_name, profile_column, source)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (schema_signature, field_name) DO UPDATE SET
+        profile_column = excluded.profile_column,
+        source = excluded.source,
+        updated_at = CURRENT_TIMESTAMP,
+        version = version + 1
+'''
+
+@with_db_connection
+def save_field_mapping(conn, schema_signature, mapping, source):
+    """Store shared field -> profile column decisions for a form schema
+
+    source is 'matcher' for fuzzy-matched seeds and 'user' for corrections
+    that enough users agreed on; seeds never replace a user's correction.
+    """
+    if source == 'user':
+        conn.executemany(_UPSERT_FIELD_MAPPING_SQL, [(schema_signature, field_name, column, source) for field_name, column in mapping.items()])
+    else:
+        conn.executemany('''
+            INSERT OR IGNORE INTO field_mappings (schema_signature, field_name, profile_column, source)
+            VALUES (?, ?, ?, ?)
+        ''', [(schema_signature, field_name, column, source) for field_name, column in mapping.items()])
+
+@with_db_connection
+def save_user_field_mapping(conn, schema_signature, username, mapping, agreement):
+    """Store a user's field mapping corrections for a form schema
+
+    A correction changes the shared mapping only once `agreement` distinct
+    users have made the same one, so a single user's stale profile or
+    coincidental value never remaps a field for everyone.
+
+    Returns the corrections that were promoted to the shared mapping.
+    """
+    conn.executemany('''
+        INSERT INTO field_mapping_overrides (schema_signature, user_id, field_name, profile_column)
+        SELECT ?, id, ?, ? FROM users WHERE username = ?
+        ON CONFLICT (schema_signature, field_name, user_id) DO UPDATE SET
+            profile_column = excluded.profile_column,
+            updated_at = CURRENT_TIMESTAMP,
+            version = version + 1
+    ''', [(schema_signature, field_name, column, username) for field_name, column in mapping.items()])
+    
+    promoted = {}
+    for field_name, column in mapping.items():
+        agreeing = conn.execute('''
+            SELECT COUNT(*) FROM field_mapping_overrides
+            WHERE schema_signature = ? AND field_name = ? AND profile_column IS ?
+        ''', (schema_signature, field_name, column)).fetchone()[0]
+        if agreeing >= agreement:
+            promoted[field_name] = column
+    if promoted:
+        conn.executemany(_UPSERT_FIELD_MAPPING_SQL,
+                         [(schema_signature, field_name, column, 'user') for field_name, column in promoted.items()])
+    return promoted
+
+@with_db_connection
+def get_fill_form_versions(conn, username, schema_signature):
+    """Versions of what a user's fill page is autofilled from, without reading the data itself
+
+    Returns the profile row version and, for the form schema, the row
+    count and version sum of the shared mapping and of the user's own
+    corrections; rows are never deleted and every change bumps a row's
+    version, so any change alters them. Every lookup is by primary key or
+    key prefix.
+    """
+    row = conn.execute('''
+        SELECT
+            (SELECT version FROM user_profiles WHERE user_id = users.id) AS profile_version,
+            (SELECT COUNT(*) || ':' || IFNULL(SUM(version), 0) FROM field_mappings
+             WHERE schema_signature = ?) AS mapping_version,
+            (SELECT COUNT(*) || ':' || IFNULL(SUM(version), 0) FROM field_mapping_overrides
+             WHERE schema_signature = ? AND user_id = users.id) AS override_version
+        FROM users WHERE username = ?
+    ''', (schema_signature, schema_signature, username)).fetchone()
+    return dict(row) if row else None
+
+PROFILE_COLUMNS = (
+    'given_name', 'last_name', 'mobile_number', 'email_address',
+    'address_line1', 'address_line2', 'address_line3', 'address_line4',
+    'city', 'state', 'country', 'post_code', 'date_of_birth',
+    'passport_number', 'gender', 'ethnicity', 'religion'
+)
+
+@with_db_connection
+def get_user_profile(conn, username):
+    """Retrieve user profile data"""
+    profile = conn.execute('''
+        SELECT user_profiles.*
+        FROM user_profiles
+        JOIN users ON users.id = user_profiles.user_id
+        WHERE users.username = ?
+    ''', (username,)).fetchone()
+    return dict(profile) if profile else {}
+
+_UPDATE_PROFILE_SQL = f'''
+    UPDATE user_profiles SET {', '.join(f'{column} = ?' for column in PROFILE_COLUMNS)}, version = version + 1
+    WHERE user_id = (SELECT id FROM users WHERE username = ?)
+'''
+_INSERT_PROFILE_SQL = f'''
+    INSERT INTO user_profiles (user_id, {', '.join(PROFILE_COLUMNS)})
+    SELECT id, {', '.join('?' for _ in PROFILE_COLUMNS)} FROM users WHERE username = ?
+'''
+
+@with_db_connection
+def save_user_profile(conn, username, profile_data):
+    """Save updated profile data
+
+    The update comes first so the transaction holds the write lock from its
+    first statement; a profile is inserted only when there was none to update.
+    Nothing is written for an unknown user.
+    """
+    values = [profile_data[column] for column in PROFILE_COLUMNS]
+    if conn.execute(_UPDATE_PROFILE_SQL, (*values, username)).rowcount == 0:
+        conn.execute(_INSERT_PROFILE_SQL, (*values, username))
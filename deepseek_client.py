@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, Timeout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every request made through a client
+
+    Tokens refill at rate per second up to capacity. acquire() reserves a token
+    immediately and sleeps until it is due, so callers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take tokens from the bucket and return how long to wait before using them"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(-self._tokens / self.rate, 0.0)
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait for tokens; returns the time spent waiting"""
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+class DeepSeekClient:
+    """Async DeepSeek chat client with retries, backoff and client-side rate limiting
+
+    All calls share one AsyncOpenAI client, and therefore one keep-alive
+    connection pool, on a background event loop. Coroutines from this client
+    must run on that loop: synchronous code submits them with run(). Rate
+    limits (429), server errors (5xx), timeouts and connection errors are
+    retried with jittered exponential backoff.
+    """
+
+    RETRY_STATUSES = {408, 409, 429}
+
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL, timeout: float = 60.0,
+                 connect_timeout: float = 10.0, max_retries: int = 4, backoff_base: float = 0.5,
+                 backoff_max: float = 20.0, rate_limit: float = 5.0, burst: int = 10,
+                 max_connections: int = 16):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_connections = max_connections
+        self.limiter = TokenBucket(rate_limit, burst)
+        # Retries are handled here so backoff and the rate limiter see every attempt
+        self._client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=Timeout(timeout, connect=connect_timeout),
+            max_retries=0
+        )
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'throttled_seconds': 0.0
+        }
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._semaphore = None
+
+    @classmethod
+    def from_env(cls, **kwargs) -> 'DeepSeekClient':
+        """Build a client from DEEPSEEK_API_KEY and DEEPSEEK_BASE_URL"""
+        load_dotenv()
+        api_key = os.getenv("DEEPSEEK_API_KEY")
+        if not api_key:
+            raise ValueError("DEEPSEEK_API_KEY environment variable not set")
+        kwargs.setdefault('base_url', os.getenv("DEEPSEEK_BASE_URL") or DEFAULT_BASE_URL)
+        return cls(api_key, **kwargs)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background event loop on first use"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='deepseek-client', daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro):
+        """Run a coroutine on the client's event loop and block until it finishes"""
+        loop = self._get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("DeepSeekClient.run() called from its own event loop; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """Drive an async generator on the client's event loop from synchronous code"""
+        loop = self._get_loop()
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Runs when the consumer stops early too, e.g. a browser closing its event stream
+            asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+    def _should_retry(self, error: Exception) -> bool:
+        if isinstance(error, APIConnectionError):  # includes timeouts
+            return True
+        if isinstance(error, APIStatusError):
+            return error.status_code in self.RETRY_STATUSES or error.status_code >= 500
+        return False
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when the server sends one"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    async def chat_completion(self, messages: List[Dict], **kwargs):
+        """Send a chat completion request, retrying transient failures"""
+        if self._semaphore is None:
+            # Created lazily so it binds to the loop the request runs on
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+
+        attempt = 0
+        while True:
+            waited = await self.limiter.acquire()
+            with self._stats_lock:
+                self._stats['requests'] += 1
+                self._stats['throttled_seconds'] += waited
+            try:
+                async with self._semaphore:
+                    return await self._client.chat.completions.create(messages=messages, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._should_retry(e):
+                    with self._stats_lock:
+                        self._stats['failures'] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                with self._stats_lock:
+                    self._stats['retries'] += 1
+                logger.warning(f"DeepSeek request failed ({type(e).__name__}: {str(e)}), "
+                               f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def chat_completion_stream(self, messages: List[Dict], **kwargs) -> AsyncIterator[str]:
+        """Stream a chat completion, yielding content deltas as they arrive
+
+        Transient failures are retried until the first delta has been yielded;
+        after that an error is raised to the caller, since the partial output
+        cannot be taken back.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+
+        attempt = 0
+        while True:
+            waited = await self.limiter.acquire()
+            with self._stats_lock:
+                self._stats['requests'] += 1
+                self._stats['throttled_seconds'] += waited
+            started = False
+            try:
+                async with self._semaphore:
+                    stream = await self._client.chat.completions.create(messages=messages, stream=True, **kwargs)
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            started = True
+                            yield delta
+                return
+            except Exception as e:
+                if started or attempt >= self.max_retries or not self._should_retry(e):
+                    with self._stats_lock:
+                        self._stats['failures'] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                with self._stats_lock:
+                    self._stats['retries'] += 1
+                logger.warning(f"DeepSeek stream failed ({type(e).__name__}: {str(e)}), "
+                               f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        """Return request, retry and throttling counters"""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self):
+        """Close the connection pool and stop the background loop"""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._client.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
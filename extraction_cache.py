@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+class ExtractionCache:
+    """SQLite-backed cache of parsed LLM field extractions
+
+    Entries expire after ttl_seconds. Once the stored payloads exceed
+    max_bytes, the least recently used entries are evicted. Expiry and
+    eviction run as a sweep at most every sweep_interval seconds rather than
+    on every store, and a hit only records its use when the recorded time is
+    more than touch_interval seconds old, so hits rarely take the write lock.
+    """
+
+    def __init__(self, db_path: Union[str, Path] = 'extraction_cache.db', ttl_seconds: int = 7 * 24 * 3600,
+                 max_bytes: int = 64 * 1024 * 1024, sweep_interval: int = 300, touch_interval: int = 60):
+        self.db_path = str(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.touch_interval = touch_interval
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS extraction_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used '
+                         'ON extraction_cache (last_used)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_extraction_cache_created_at '
+                         'ON extraction_cache (created_at)')
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success, rolls back on error and is always closed"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Collapse whitespace so re-extracted copies of the same form hash identically"""
+        return re.sub(r'\s+', ' ', text).strip()
+
+    @classmethod
+    def make_key(cls, text: str, **params) -> str:
+        """Key an extraction on its normalized input text and everything that shapes the answer"""
+        param_str = json.dumps(params, sort_keys=True, default=str)
+        payload = f"{param_str}\n{cls.normalize_text(text)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a cached extraction, or None if missing, expired or unreadable
+
+        A database error (e.g. "database is locked") is logged and treated as
+        a miss so it never fails the extraction itself.
+        """
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT payload, created_at, last_used FROM extraction_cache '
+                                   'WHERE cache_key = ?', (key,)).fetchone()
+                if row is not None and now - row[1] > self.ttl_seconds:
+                    conn.execute('DELETE FROM extraction_cache WHERE cache_key = ?', (key,))
+                    with self._lock:
+                        self._stats['expired'] += 1
+                    row = None
+                if row is not None and now - row[2] > self.touch_interval:
+                    conn.execute('UPDATE extraction_cache SET last_used = ? WHERE cache_key = ?', (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read extraction cache: {str(e)}")
+            row = None
+
+        with self._lock:
+            self._stats['hits' if row is not None else 'misses'] += 1
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key: str, value: Dict):
+        """Store an extraction, sweeping expired and over-budget entries when a sweep is due"""
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            sweep = now >= self._next_sweep
+            if sweep:
+                self._next_sweep = now + self.sweep_interval
+        evicted = 0
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO extraction_cache '
+                             '(cache_key, payload, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)',
+                             (key, payload, len(payload.encode('utf-8')), now, now))
+                if sweep:
+                    conn.execute('DELETE FROM extraction_cache WHERE created_at < ?', (now - self.ttl_seconds,))
+                    evicted = self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store extraction in cache: {str(e)}")
+            return
+
+        with self._lock:
+            self._stats['stores'] += 1
+            self._stats['evictions'] += evicted
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Delete least recently used entries until the payloads fit in max_bytes"""
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM extraction_cache').fetchone()[0]
+        evicted = 0
+        while total > self.max_bytes:
+            rows = conn.execute('SELECT cache_key, size FROM extraction_cache '
+                                'ORDER BY last_used LIMIT 50').fetchall()
+            if not rows:
+                break
+            for cache_key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM extraction_cache WHERE cache_key = ?', (cache_key,))
+                total -= size
+                evicted += 1
+        return evicted
+
+    def counters(self) -> Dict:
+        """Return the in-memory hit/miss counters without touching the database"""
+        with self._lock:
+            return dict(self._stats)
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters plus the current entry count and size"""
+        with self._connect() as conn:
+            entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) '
+                                         'FROM extraction_cache').fetchone()
+        stats = self.counters()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['entries'] = entries
+        stats['bytes'] = size
+        return stats
@@ -0,0 +1,163 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def normalize_key(name: str) -> str:
+    """Lowercase a field or profile key and drop everything but letters and digits"""
+    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+
+class FieldMatcher:
+    """Match form field names to profile keys through a character n-gram index
+
+    Profile keys are normalized and split into n-grams once. Field names are
+    scored against every key at the same time as a Dice coefficient over
+    shared n-grams (one matrix product for a batch of names). Only the best
+    few keys are then compared character by character, and the best one wins
+    if its SequenceMatcher ratio is above threshold. Decisions are memoized
+    per normalized field name in a bounded LRU.
+    """
+
+    NGRAM = 3
+    SHORTLIST = 8  # keys re-ranked per field name
+
+    def __init__(self, keys: Iterable[str], threshold: float = 0.5, cache_size: int = 4096):
+        self.keys = list(dict.fromkeys(keys))
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0
+        }
+
+        normalized = [normalize_key(key) for key in self.keys]
+        # SequenceMatcher indexes its second sequence once; set_seq1 then only swaps the field name
+        self._key_matchers = [SequenceMatcher(None, '', norm) for norm in normalized]
+        self._score_lock = threading.Lock()
+        # The first key wins when two normalize the same, as with the old linear scan
+        self._exact = {}
+        for key, norm in zip(self.keys, normalized):
+            self._exact.setdefault(norm, key)
+
+        self._vocab = {}
+        key_grams = [self._ngrams(norm) for norm in normalized]
+        for grams in key_grams:
+            for gram in grams:
+                self._vocab.setdefault(gram, len(self._vocab))
+        self._key_matrix = np.zeros((len(self.keys), max(len(self._vocab), 1)), dtype=np.float32)
+        for row, grams in enumerate(key_grams):
+            self._key_matrix[row, [self._vocab[gram] for gram in grams]] = 1
+        self._key_sizes = np.array([len(grams) for grams in key_grams], dtype=np.float32)
+
+    @classmethod
+    def _ngrams(cls, norm: str) -> set:
+        padded = f"${norm}$"
+        if len(padded) <= cls.NGRAM:
+            return {padded}
+        return {padded[i:i + cls.NGRAM] for i in range(len(padded) - cls.NGRAM + 1)}
+
+    def _score(self, norms: List[str]) -> List[Optional[str]]:
+        """Best key above threshold for each normalized name"""
+        if not self.keys:
+            return [None] * len(norms)
+        name_matrix = np.zeros((len(norms), self._key_matrix.shape[1]), dtype=np.float32)
+        name_sizes = np.empty(len(norms), dtype=np.float32)
+        for row, norm in enumerate(norms):
+            grams = self._ngrams(norm)
+            name_sizes[row] = len(grams)
+            columns = [self._vocab[gram] for gram in grams if gram in self._vocab]
+            name_matrix[row, columns] = 1
+
+        shared = name_matrix @ self._key_matrix.T
+        dice = 2 * shared / (name_sizes[:, None] + self._key_sizes[None, :])
+        # Shortlist the keys sharing the most n-grams, then rank the shortlist with the
+        # character-level ratio so decisions stay those of a full SequenceMatcher scan
+        shortlist_size = min(self.SHORTLIST, len(self.keys))
+        shortlists = np.argpartition(-dice, shortlist_size - 1, axis=1)[:, :shortlist_size]
+
+        matches = []
+        with self._score_lock:
+            for norm, candidates, scores in zip(norms, shortlists, dice):
+                best_key = None
+                best_score = self.threshold
+                for index in sorted(candidates.tolist()):
+                    if scores[index] == 0:
+                        continue
+                    matcher = self._key_matchers[index]
+                    matcher.set_seq1(norm)
+                    # The cheap upper bounds skip most candidates that cannot win
+                    if matcher.real_quick_ratio() <= best_score or matcher.quick_ratio() <= best_score:
+                        continue
+                    score = matcher.ratio()
+                    if score > best_score:
+                        best_score = score
+                        best_key = self.keys[index]
+                matches.append(best_key)
+        return matches
+
+    def match_many(self, names: Iterable[str]) -> List[Optional[str]]:
+        """Return the matching profile key (or None) for each field name"""
+        norms = [normalize_key(name) for name in names]
+        results = {}
+        pending = []
+        with self._lock:
+            for norm in dict.fromkeys(norms):
+                if norm in self._exact:
+                    results[norm] = self._exact[norm]
+                elif norm in self._memo:
+                    self._memo.move_to_end(norm)
+                    results[norm] = self._memo[norm]
+                    self._stats['hits'] += 1
+                else:
+                    pending.append(norm)
+                    self._stats['misses'] += 1
+
+        if pending:
+            scored = self._score(pending)
+            with self._lock:
+                for norm, key in zip(pending, scored):
+                    results[norm] = key
+                    self._memo[norm] = key
+                    self._memo.move_to_end(norm)
+                while len(self._memo) > self.cache_size:
+                    self._memo.popitem(last=False)
+
+        return [results[norm] for norm in norms]
+
+    def match(self, name: str) -> Optional[str]:
+        """Return the matching profile key for a field name, or None"""
+        return self.match_many([name])[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memoized'] = len(self._memo)
+        stats['keys'] = len(self.keys)
+        stats['ngrams'] = len(self._vocab)
+        return stats
+
+_matchers = OrderedDict()
+_matchers_lock = threading.Lock()
+
+def matcher_for(keys: Iterable[str], max_matchers: int = 32) -> FieldMatcher:
+    """Shared matcher for a set of profile keys, so the index is built once per key set"""
+    signature: Tuple = tuple(keys)
+    with _matchers_lock:
+        matcher = _matchers.get(signature)
+        if matcher is not None:
+            _matchers.move_to_end(signature)
+            return matcher
+    matcher = FieldMatcher(signature)
+    with _matchers_lock:
+        _matchers[signature] = matcher
+        while len(_matchers) > max_matchers:
+            _matchers.popitem(last=False)
+    return matcher
@@ -1,12 +1,16 @@
+import asyncio
 import datetime
+import hashlib
 import os
 import logging
 import json
 import re
 from pathlib import Path
-from typing import Dict, Optional, Union
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
+from deepseek_client import DeepSeekClient
+from extraction_cache import ExtractionCache
+from prompt_builder import PromptBuilder
+from streaming_json import IncrementalJSONParser, iter_leaves
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,10 +23,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class FieldExtractor:
-    PROMPT_TEMPLATE = """You are a visa application form data extraction assistant. Analyze this form data and extract all relevant fields.
+    MODEL = "deepseek-chat"
+    MAX_TOKENS = 1024
+    TEMPERATURE = 0.1  # Lower temperature for more consistent output
+    MAX_INPUT_TOKENS = 6000  # default budget for system prompt plus form text
+    CHUNK_TOKENS = 3000  # default form text per request in chunked mode
+    MAX_CONCURRENCY = 4  # default parallel requests in chunked mode
 
-Form data:
-{text}
+    PROMPT_TEMPLATE = """You are a visa application form data extraction assistant. Analyze the form data in the user message and extract all relevant fields.
 
 Required fields to extract (include any additional fields you find):
 - Applicant Information:
@@ -64,17 +72,33 @@ Important instructions:
 
 Return the JSON object only, no other text."""
 
-    def __init__(self):
-        load_dotenv()
-        api_key = os.getenv("DEEPSEEK_API_KEY")
-        if not api_key:
-            raise ValueError("DEEPSEEK_API_KEY environment variable not set")
-        
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
+    def __init__(self, cache: ExtractionCache = None, max_input_tokens: int = None,
+                 chunk_tokens: int = None, max_concurrency: int = None, client: DeepSeekClient = None):
+        # Raises ValueError when DEEPSEEK_API_KEY is not set
+        self.client = client or DeepSeekClient.from_env()
+        self.cache = cache
+        # Cached extractions are keyed on the prompt itself, so editing it never serves stale answers
+        self.prompt_version = hashlib.sha256(self.PROMPT_TEMPLATE.encode('utf-8')).hexdigest()[:16]
+        self.prompt_builder = PromptBuilder(self.PROMPT_TEMPLATE, max_input_tokens or self.MAX_INPUT_TOKENS)
+        self.chunk_tokens = chunk_tokens or self.CHUNK_TOKENS
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+
+    def _cache_key(self, data: Union[Dict, str]) -> str:
+        """Key a request on its form text and the settings that shape the answer"""
+        # Only the form text matters; pdf_path differs between uploads of the same form
+        return ExtractionCache.make_key(
+            PromptBuilder.document_text(data),
+            model=self.MODEL,
+            prompt_version=self.prompt_version,
+            max_tokens=self.MAX_TOKENS,
+            temperature=self.TEMPERATURE,
+            max_input_tokens=self.prompt_builder.max_input_tokens
         )
 
+    def cache_stats(self) -> Dict:
+        """Return extraction cache statistics, or an empty dict when caching is off"""
+        return self.cache.stats() if self.cache is not None else {}
+
     def _validate_extracted_fields(self, fields: Dict) -> bool:
         """Validate the structure of extracted fields"""
         required_fields = {
@@ -88,6 +112,52 @@ Return the JSON object only, no other text."""
         }
         return all(field in fields for field in required_fields)
 
+    @staticmethod
+    def _widget_field_key(widget: Dict) -> str:
+        """Derive a readable field key from a widget's tooltip or its last name component"""
+        # e.g. "topmostSubform[0].Page1[0].FamilyName[0]" -> "FamilyName"
+        name = widget.get('label') or re.sub(r'\[\d+\]', '', widget['name']).split('.')[-1]
+        return re.sub(r'\W+', '_', name).strip('_').lower() or 'field'
+
+    @staticmethod
+    def extract_from_widgets(widgets: List[Dict]) -> Dict:
+        """Build extracted fields directly from a fillable PDF's AcroForm widgets
+
+        Produces the same structure as extract_fields without calling the API.
+        field_map records which widget each extracted field came from.
+        """
+        extracted_fields = {}
+        field_map = {}
+        keys_by_name = {}
+        
+        for widget in widgets:
+            value = widget.get('value')
+            if widget['type'] in ('checkbox', 'radiobutton') and value in ('Off', '', False):
+                value = None
+            elif value == '':
+                value = None
+            
+            # Radio groups repeat the same field name once per button
+            key = keys_by_name.get(widget['name'])
+            if key is None:
+                key = FieldExtractor._widget_field_key(widget)
+                if key in extracted_fields:
+                    key = re.sub(r'\W+', '_', widget['name']).strip('_').lower()
+                keys_by_name[widget['name']] = key
+                extracted_fields[key] = value
+                field_map[key] = widget['name']
+            elif value is not None:
+                extracted_fields[key] = value
+        
+        logger.info(f"Extracted {len(extracted_fields)} fields from AcroForm widgets")
+        return {
+            "extracted_fields": extracted_fields,
+            "field_map": field_map,
+            "raw_response": "",
+            "status": "success",
+            "source": "acroform"
+        }
+
     def clean_api_response(self, text: str) -> Union[str, None]:
         """Clean and validate the API response text to ensure it contains valid JSON."""
         try:
@@ -120,28 +190,30 @@ Return the JSON object only, no other text."""
 
     def extract_fields(self, data: Union[Dict, str]) -> Dict:
         """Extract form fields using DeepSeek API with robust error handling."""
+        return self.client.run(self.extract_fields_async(data))
+
+    def stream_fields(self, data: Union[Dict, str]) -> Iterator[Dict]:
+        """Synchronous generator over stream_fields_async events"""
+        return self.client.iterate(self.stream_fields_async(data))
+
+    async def extract_fields_async(self, data: Union[Dict, str]) -> Dict:
+        """Async version of extract_fields; must run on the DeepSeek client's event loop"""
         try:
             # Log the input data
             logger.info("Starting field extraction")
             
-            # Convert input data to string if it's a dict
-            input_text = json.dumps(data) if isinstance(data, dict) else str(data)
-            
-            # Prepare the API request with formatted prompt
-            formatted_prompt = self.PROMPT_TEMPLATE.format(text=input_text)
-            
-            request_messages = [
-                {"role": "system", "content": formatted_prompt},
-                {"role": "user", "content": input_text}
-            ]
+            cache_key, cached = self._lookup_cache(data)
+            if cached is not None:
+                return cached
             
+            request_messages = self._build_messages(data)
             logger.debug("Sending API request")
             
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=request_messages,
-                max_tokens=1024,
-                temperature=0.1  # Lower temperature for more consistent output
+            response = await self.client.chat_completion(
+                request_messages,
+                model=self.MODEL,
+                max_tokens=self.MAX_TOKENS,
+                temperature=self.TEMPERATURE
             )
             
             if not response.choices or not response.choices[0].message:
@@ -151,29 +223,270 @@ Return the JSON object only, no other text."""
             response_text = response.choices[0].message.content
             logger.debug(f"Raw API response content: {response_text}")
             
-            # Clean and parse the response
-            cleaned_response = self.clean_api_response(response_text)
-            if not cleaned_response:
-                raise ValueError("Failed to clean API response")
-                
-            extracted_fields = json.loads(cleaned_response)
-            
-            # Validate the extracted fields
-            if not self._validate_extracted_fields(extracted_fields):
-                logger.warning("Missing required fields in response")
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                logger.info(f"Token usage: prompt {usage.prompt_tokens}, completion {usage.completion_tokens}")
             
-            logger.info("Successfully extracted fields")
-            return {
-                "extracted_fields": extracted_fields,
-                "raw_response": response_text,
-                "status": "success"
-            }
+            return self._parse_response(response_text, cache_key)
                 
         except Exception as e:
             logger.error(f"Field extraction failed: {str(e)}", exc_info=True)
+            return self._error_result(e)
+
+    async def stream_fields_async(self, data: Union[Dict, str]) -> AsyncIterator[Dict]:
+        """Stream an extraction, yielding each field as soon as its value is complete
+
+        Yields {"event": "field", "path": [...], "value": ...} events while the
+        model is still generating, then one {"event": "done", ...} event that
+        carries the same result extract_fields would return. The done result
+        is parsed from the full response and is authoritative.
+        """
+        try:
+            logger.info("Starting streamed field extraction")
+            
+            cache_key, cached = self._lookup_cache(data)
+            if cached is not None:
+                for path, value in iter_leaves(cached["extracted_fields"]):
+                    yield {"event": "field", "path": list(path), "value": value}
+                yield {"event": "done", **cached}
+                return
+            
+            request_messages = self._build_messages(data)
+            start_time = datetime.datetime.now()
+            parser = IncrementalJSONParser()
+            parts = []
+            fields_seen = 0
+            
+            async for delta in self.client.chat_completion_stream(
+                request_messages,
+                model=self.MODEL,
+                max_tokens=self.MAX_TOKENS,
+                temperature=self.TEMPERATURE
+            ):
+                parts.append(delta)
+                if parser is None:
+                    continue
+                try:
+                    events = parser.feed(delta)
+                except ValueError as e:
+                    # Keep collecting; the final parse below is more forgiving
+                    logger.warning(f"Incremental parse failed, waiting for the full response: {str(e)}")
+                    parser = None
+                    continue
+                for path, value in events:
+                    if fields_seen == 0:
+                        logger.info(f"First field streamed after {datetime.datetime.now() - start_time}")
+                    fields_seen += 1
+                    yield {"event": "field", "path": list(path), "value": value}
+            
+            response_text = "".join(parts)
+            logger.debug(f"Raw API response content: {response_text}")
+            logger.info(f"Stream finished after {datetime.datetime.now() - start_time}, {fields_seen} fields streamed")
+            yield {"event": "done", **self._parse_response(response_text, cache_key)}
+            
+        except Exception as e:
+            logger.error(f"Streamed field extraction failed: {str(e)}", exc_info=True)
+            yield {"event": "done", **self._error_result(e)}
+
+    def _lookup_cache(self, data: Union[Dict, str]):
+        """Return (cache_key, cached result or None); the key is None when caching is off"""
+        if self.cache is None:
+            return None, None
+        cache_key = self._cache_key(data)
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+        counters = self.cache.counters()
+        logger.info(f"Using cached extraction {cache_key[:12]} "
+                    f"({counters['hits']} hits, {counters['misses']} misses)")
+        return cache_key, {
+            "extracted_fields": cached["extracted_fields"],
+            "raw_response": cached["raw_response"],
+            "status": "success",
+            "cache_hit": True
+        }
+
+    def _build_messages(self, data: Union[Dict, str]) -> List[Dict]:
+        """Send the form text once, trimmed to the token budget"""
+        request_messages, prompt_stats = self.prompt_builder.build(data)
+        logger.info(
+            f"Prompt tokens (estimated): {prompt_stats['input_tokens']} of {prompt_stats['budget']} "
+            f"(system {prompt_stats['system_tokens']}, document {prompt_stats['document_tokens']}, "
+            f"dropped {prompt_stats['dropped_lines']} lines"
+            f"{', truncated' if prompt_stats['truncated'] else ''})"
+        )
+        return request_messages
+
+    def _parse_response(self, response_text: str, cache_key: Optional[str]) -> Dict:
+        """Clean, parse, validate and cache a complete model response"""
+        # Clean and parse the response
+        cleaned_response = self.clean_api_response(response_text)
+        if not cleaned_response:
+            raise ValueError("Failed to clean API response")
+            
+        extracted_fields = json.loads(cleaned_response)
+        
+        # Validate the extracted fields
+        if not self._validate_extracted_fields(extracted_fields):
+            logger.warning("Missing required fields in response")
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, {
+                "extracted_fields": extracted_fields,
+                "raw_response": response_text
+            })
+        
+        logger.info("Successfully extracted fields")
+        return {
+            "extracted_fields": extracted_fields,
+            "raw_response": response_text,
+            "status": "success"
+        }
+
+    @staticmethod
+    def _error_result(error: Exception) -> Dict:
+        return {
+            "extracted_fields": {},
+            "raw_response": "",
+            "status": "error",
+            "error": str(error)
+        }
+
+    @staticmethod
+    def _is_empty(value) -> bool:
+        return value is None or value == "" or value == [] or value == {}
+
+    @classmethod
+    def merge_fields(cls, base: Dict, incoming: Dict) -> Dict:
+        """Deep-merge one chunk's fields into the fields of the chunks before it
+
+        Non-null values win over nulls. When two chunks both found a value,
+        the earlier chunk wins, except that lists are combined and nested
+        objects are merged key by key.
+        """
+        merged = dict(base)
+        for key, value in incoming.items():
+            if key not in merged or cls._is_empty(merged[key]):
+                merged[key] = value
+            elif cls._is_empty(value):
+                continue
+            elif isinstance(merged[key], dict) and isinstance(value, dict):
+                merged[key] = cls.merge_fields(merged[key], value)
+            elif isinstance(merged[key], list) and isinstance(value, list):
+                merged[key] = merged[key] + [item for item in value if item not in merged[key]]
+            elif merged[key] != value:
+                logger.debug(f"Conflicting values for '{key}', keeping the earlier one: "
+                             f"{merged[key]!r} over {value!r}")
+        return merged
+
+    def extract_fields_chunked(self, pages: List[Dict]) -> Dict:
+        """Extract fields from a long document in page chunks sent concurrently
+
+        Pages from process_pdf are packed into chunks of at most chunk_tokens,
+        each chunk is extracted with extract_fields (up to max_concurrency at a
+        time), and the results are merged in page order so the outcome does
+        not depend on which request finishes first. If only some chunks fail,
+        the status is "partial" and failed_chunks lists their indexes.
+        """
+        return self.client.run(self.extract_fields_chunked_async(pages))
+
+    async def extract_fields_chunked_async(self, pages: List[Dict]) -> Dict:
+        """Async version of extract_fields_chunked"""
+        chunks = self.prompt_builder.chunk_pages(pages, self.chunk_tokens)
+        if len(chunks) <= 1:
+            return await self.extract_fields_async({"text": chunks})
+        
+        logger.info(f"Extracting fields from {len(chunks)} chunks, {min(self.max_concurrency, len(chunks))} at a time")
+        start_time = datetime.datetime.now()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def extract_chunk(chunk: str) -> Dict:
+            async with semaphore:
+                return await self.extract_fields_async({"text": [chunk]})
+        
+        # gather keeps results in chunk order
+        results = await asyncio.gather(*(extract_chunk(chunk) for chunk in chunks))
+        
+        logger.info(f"Chunked extraction finished in {datetime.datetime.now() - start_time}")
+        return self._merge_chunk_results(results)
+
+    def stream_fields_chunked(self, pages: List[Dict]) -> Iterator[Dict]:
+        """Synchronous generator over stream_fields_chunked_async events"""
+        return self.client.iterate(self.stream_fields_chunked_async(pages))
+
+    async def stream_fields_chunked_async(self, pages: List[Dict]) -> AsyncIterator[Dict]:
+        """Streaming version of extract_fields_chunked_async
+
+        Chunks stream concurrently and each field is yielded the first time a
+        non-empty value for its path arrives, whichever chunk it comes from.
+        The final done event carries the deterministic page-order merge.
+        """
+        chunks = self.prompt_builder.chunk_pages(pages, self.chunk_tokens)
+        if len(chunks) <= 1:
+            async for event in self.stream_fields_async({"text": chunks}):
+                yield event
+            return
+        
+        logger.info(f"Streaming fields from {len(chunks)} chunks, {min(self.max_concurrency, len(chunks))} at a time")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        queue = asyncio.Queue()
+        
+        async def stream_chunk(index: int, chunk: str):
+            async with semaphore:
+                async for event in self.stream_fields_async({"text": [chunk]}):
+                    await queue.put((index, event))
+        
+        tasks = [asyncio.ensure_future(stream_chunk(index, chunk)) for index, chunk in enumerate(chunks)]
+        results = [None] * len(chunks)
+        shown = {}
+        try:
+            while any(result is None for result in results):
+                index, event = await queue.get()
+                if event["event"] == "done":
+                    results[index] = event
+                    continue
+                path = tuple(event["path"])
+                if path not in shown or (self._is_empty(shown[path]) and not self._is_empty(event["value"])):
+                    shown[path] = event["value"]
+                    yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        yield {"event": "done", **self._merge_chunk_results(results)}
+
+    def _merge_chunk_results(self, results: List[Dict]) -> Dict:
+        """Merge per-chunk extraction results in chunk order"""
+        extracted_fields = {}
+        raw_responses = []
+        failed_chunks = []
+        for index, result in enumerate(results):
+            if result.get("status") != "success":
+                failed_chunks.append(index)
+                continue
+            extracted_fields = self.merge_fields(extracted_fields, result["extracted_fields"])
+            raw_responses.append(result["raw_response"])
+        
+        logger.info(f"{len(failed_chunks)} of {len(results)} chunks failed")
+        if len(failed_chunks) == len(results):
             return {
                 "extracted_fields": {},
                 "raw_response": "",
                 "status": "error",
-                "error": str(e)
+                "error": results[0].get("error", "All chunks failed")
             }
+        
+        if not self._validate_extracted_fields(extracted_fields):
+            logger.warning("Missing required fields in merged response")
+        merged = {
+            "extracted_fields": extracted_fields,
+            "raw_response": "\n\n".join(raw_responses),
+            "status": "success",
+            "chunks": len(results),
+            "failed_chunks": failed_chunks
+        }
+        if failed_chunks:
+            # Only successful chunks are cached, so extracting again retries just the failed ones
+            merged["status"] = "partial"
+            merged["error"] = f"{len(failed_chunks)} of {len(results)} chunks failed"
+        return merged
@@ -1,26 +1,40 @@
+import hashlib
 import logging
 import re
-from flask import render_template, flash
+import threading
+from collections import OrderedDict
+from flask import Response, render_template, stream_template, flash, get_flashed_messages
 from flask_wtf import FlaskForm
 from wtforms import StringField, validators
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional, Union
 
 logger = logging.getLogger(__name__)
 
+# One pass over a field name decides its kind; the alternatives are tried in
+# order at the start, so "email" still wins over "phone" wherever they appear
+FIELD_KIND_PATTERN = re.compile(r'^(?:(?=.*email)(?P<email>)|(?=.*phone)(?P<phone>)|(?=.*ssn)(?P<ssn>))',
+                                re.IGNORECASE | re.DOTALL)
+
+# Validators hold no per-field state, so every field of a kind shares them
+KIND_VALIDATORS = {
+    'text': (),
+    'email': (validators.Email(),),
+    'phone': (validators.Regexp(r'^\+?1?\d{9,15}$'),),
+    'ssn': (validators.Regexp(r'^\d{3}-?\d{2}-?\d{4}$'),)
+}
+_required = validators.DataRequired()
+
+_form_classes = OrderedDict()
+_form_classes_lock = threading.Lock()
+
 class FillFormHandler:
+    STREAM_CHUNK_SIZE = 16 * 1024  # bytes of rendered page sent at a time when streaming
+
     @staticmethod
-    def _create_field_validators(field_name: str) -> List:
-        """Create appropriate validators for each field type"""
-        validators_list = [validators.DataRequired()]
-        
-        if 'email' in field_name.lower():
-            validators_list.append(validators.Email())
-        elif 'phone' in field_name.lower():
-            validators_list.append(validators.Regexp(r'^\+?1?\d{9,15}$'))
-        elif 'ssn' in field_name.lower():
-            validators_list.append(validators.Regexp(r'^\d{3}-?\d{2}-?\d{4}$'))
-            
-        return validators_list
+    def _field_kind(field_name: str) -> str:
+        """Classify a field as email, phone, ssn or plain text by its name"""
+        match = FIELD_KIND_PATTERN.match(field_name)
+        return match.lastgroup if match else 'text'
 
     @staticmethod
     def _sanitize_field_name(name: str) -> str:
@@ -30,8 +44,196 @@ class FillFormHandler:
         return name.lower()
 
     @staticmethod
-    def handle_fill_form(extracted_fields: Dict[str, Any], raw_text: str, raw_response: str = None) -> str:
-        """Handle the fill form page rendering with extracted fields"""
+    def _field_info(sanitized_name: str, field_name: str, field_value: Any) -> Dict:
+        """Describe one text input of the fill form"""
+        return {
+            'name': sanitized_name,
+            'label': field_name.replace('_', ' ').title(),
+            'type': 'text',
+            'value': str(field_value) if field_value is not None else '',
+            'required': True,
+            'kind': FillFormHandler._field_kind(field_name)
+        }
+
+    @staticmethod
+    def _section_info(sanitized_name: str, field_name: str) -> Dict:
+        return {
+            'type': 'section',
+            'label': field_name.replace('_', ' ').title(),
+            'name': sanitized_name
+        }
+
+    @staticmethod
+    def build_form_fields(fields: Dict[str, Any], form_class: type = None, prefix: str = '') -> List[Dict]:
+        """Recursively process fields to handle nested structures
+
+        When form_class is given, a StringField is added to it for every input.
+        """
+        form_fields = []
+        
+        for field_name, field_value in fields.items():
+            full_name = f"{prefix}_{field_name}" if prefix else field_name
+            sanitized_name = FillFormHandler._sanitize_field_name(full_name)
+            
+            if isinstance(field_value, dict):
+                # Add section heading
+                form_fields.append(FillFormHandler._section_info(sanitized_name, field_name))
+                # Recursively process nested fields
+                form_fields.extend(FillFormHandler.build_form_fields(field_value, form_class, sanitized_name))
+            else:
+                # Create form field
+                field_info = FillFormHandler._field_info(sanitized_name, field_name, field_value)
+                
+                if form_class is not None:
+                    # Determine validators and add field to dynamic form
+                    setattr(form_class, sanitized_name, FillFormHandler._string_field(field_info))
+                
+                form_fields.append(field_info)
+        
+        return form_fields
+
+    @staticmethod
+    def input_names(fields: Dict[str, Any], prefix: str = '') -> List[str]:
+        """Names build_form_fields gives the inputs, without building their entries"""
+        names = []
+        for field_name, field_value in fields.items():
+            full_name = f"{prefix}_{field_name}" if prefix else field_name
+            sanitized_name = FillFormHandler._sanitize_field_name(full_name)
+            if isinstance(field_value, dict):
+                names.extend(FillFormHandler.input_names(field_value, sanitized_name))
+            else:
+                names.append(sanitized_name)
+        return names
+
+    @staticmethod
+    def streamed_form_fields(partial: Dict[str, Any], path: List) -> List[Dict]:
+        """Form entries for a value that just arrived in a streamed extraction
+
+        partial is the extraction assembled so far and path points at the new
+        value. Returns the section headings leading to it followed by its
+        input, named exactly as build_form_fields would name them. Values
+        inside lists update the input for the whole list.
+        """
+        entries = []
+        prefix = ''
+        node = partial
+        for key in path:
+            if isinstance(key, int) or not isinstance(node, dict):
+                break
+            full_name = f"{prefix}_{key}" if prefix else key
+            sanitized_name = FillFormHandler._sanitize_field_name(full_name)
+            value = node[key]
+            if isinstance(value, dict):
+                entries.append(FillFormHandler._section_info(sanitized_name, key))
+            else:
+                entries.append(FillFormHandler._field_info(sanitized_name, key, value))
+                break
+            prefix = sanitized_name
+            node = value
+        return entries
+
+    @staticmethod
+    def _string_field(field_info: Dict) -> StringField:
+        return StringField(
+            field_info['label'],
+            validators=[_required, *KIND_VALIDATORS[field_info['kind']]]
+        )
+
+    @staticmethod
+    def schema_key(form_fields: List[Dict]) -> str:
+        """Identify the form class a list of form entries needs: input names, labels and kinds in order"""
+        schema = "\n".join(
+            f"{field['name']}\t{field['label']}\t{field['kind']}"
+            for field in form_fields if field['type'] != 'section'
+        )
+        return hashlib.sha256(schema.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def form_class_for(form_fields: List[Dict], max_classes: int = 256) -> type:
+        """Shared DynamicForm class for the form entries, so each schema's class is built once"""
+        key = FillFormHandler.schema_key(form_fields)
+        with _form_classes_lock:
+            form_class = _form_classes.get(key)
+            if form_class is not None:
+                _form_classes.move_to_end(key)
+                return form_class
+
+        class DynamicForm(FlaskForm):
+            pass
+
+        for field_info in form_fields:
+            if field_info['type'] != 'section':
+                setattr(DynamicForm, field_info['name'], FillFormHandler._string_field(field_info))
+
+        with _form_classes_lock:
+            # Another request may have built the same schema meanwhile; keep the first class
+            form_class = _form_classes.setdefault(key, DynamicForm)
+            _form_classes.move_to_end(key)
+            while len(_form_classes) > max_classes:
+                _form_classes.popitem(last=False)
+        return form_class
+
+    @staticmethod
+    def build_form(extracted_fields: Dict[str, Any]):
+        """Return a bound DynamicForm instance for the fields and their form entries"""
+        # Process fields recursively
+        form_fields = FillFormHandler.build_form_fields(extracted_fields)
+        return FillFormHandler.form_class_for(form_fields)(), form_fields
+
+    @staticmethod
+    def apply_submission(extracted_fields: Dict[str, Any], form: FlaskForm, prefix: str = '') -> Dict[str, Any]:
+        """Return a copy of the extracted fields with the values the user submitted"""
+        updated = {}
+        for field_name, field_value in extracted_fields.items():
+            full_name = f"{prefix}_{field_name}" if prefix else field_name
+            sanitized_name = FillFormHandler._sanitize_field_name(full_name)
+            if isinstance(field_value, dict):
+                updated[field_name] = FillFormHandler.apply_submission(field_value, form, sanitized_name)
+            else:
+                field = getattr(form, sanitized_name, None)
+                updated[field_name] = field.data if field is not None else field_value
+        return updated
+
+    @staticmethod
+    def _buffered(chunks: Iterator[str], size: int) -> Iterator[str]:
+        """Join the template's many small output pieces into chunks of about size characters"""
+        try:
+            pending = []
+            pending_size = 0
+            for chunk in chunks:
+                pending.append(chunk)
+                pending_size += len(chunk)
+                if pending_size >= size:
+                    yield ''.join(pending)
+                    pending = []
+                    pending_size = 0
+            if pending:
+                yield ''.join(pending)
+        finally:
+            chunks.close()
+
+    @staticmethod
+    def stream_page(template_name: str, **context) -> Response:
+        """Render a template as a streamed response, so the browser paints it as it arrives"""
+        # The session is saved before a streamed body is rendered, so take the
+        # flashed messages out of it now; the template then reads them from the request
+        get_flashed_messages(with_categories=True)
+        chunks = stream_template(template_name, **context)
+        return Response(FillFormHandler._buffered(chunks, FillFormHandler.STREAM_CHUNK_SIZE), mimetype='text/html')
+
+    @staticmethod
+    def handle_fill_form(extracted_fields: Dict[str, Any], raw_text: str, raw_response: str = None,
+                         form: FlaskForm = None, pdf_url: str = None,
+                         autofill: Callable[[List[Dict]], None] = None,
+                         stream_min_fields: int = None) -> Union[str, Response]:
+        """Handle the fill form page rendering with extracted fields
+
+        Pass the submitted form to re-render it with the user's values and
+        validation errors, and pdf_url to offer the filled PDF for download.
+        autofill is called with the form entries of a fresh form so it can
+        fill in their values. Forms with at least stream_min_fields entries
+        are returned as a streamed response.
+        """
         try:
             logger.info("Processing form fields")
             
@@ -40,56 +242,17 @@ class FillFormHandler:
                 flash("No form fields could be extracted", "warning")
                 extracted_fields = {}
 
-            
-            class DynamicForm(FlaskForm):
-                pass
-
-            def process_fields(fields: Dict[str, Any], prefix: str = '') -> List[Dict]:
-                """Recursively process fields to handle nested structures"""
-                form_fields = []
-                
-                for field_name, field_value in fields.items():
-                    full_name = f"{prefix}_{field_name}" if prefix else field_name
-                    sanitized_name = FillFormHandler._sanitize_field_name(full_name)
-                    
-                    if isinstance(field_value, dict):
-                        # Add section heading
-                        form_fields.append({
-                            'type': 'section',
-                            'label': field_name.replace('_', ' ').title(),
-                            'name': sanitized_name
-                        })
-                        # Recursively process nested fields
-                        form_fields.extend(process_fields(field_value, sanitized_name))
-                    else:
-                        # Determine field type and validators
-                        validators_list = FillFormHandler._create_field_validators(field_name)
-                        
-                        # Create form field
-                        field_info = {
-                            'name': sanitized_name,
-                            'label': field_name.replace('_', ' ').title(),
-                            'type': 'text',
-                            'value': str(field_value) if field_value is not None else '',
-                            'required': True
-                        }
-                        
-                        # Add field to dynamic form
-                        setattr(
-                            DynamicForm,
-                            sanitized_name,
-                            StringField(
-                                field_info['label'],
-                                validators=validators_list
-                            )
-                        )
-                        
-                        form_fields.append(field_info)
-                
-                return form_fields
-
-            # Process fields recursively
-            form_fields = process_fields(extracted_fields)
+            if form is None:
+                form, form_fields = FillFormHandler.build_form(extracted_fields)
+                if autofill is not None:
+                    autofill(form_fields)
+            else:
+                form_fields = FillFormHandler.build_form_fields(extracted_fields)
+                for field_info in form_fields:
+                    field = getattr(form, field_info['name'], None)
+                    if field_info['type'] != 'section' and field is not None:
+                        field_info['value'] = field.data or ''
+                        field_info['errors'] = list(field.errors)
             
             if not form_fields:
                 logger.warning("No form fields generated")
@@ -99,17 +262,17 @@ class FillFormHandler:
                     error="No form fields could be generated"
                 )
             
-            # Create form instance
-            form = DynamicForm()
-            
             logger.info(f"Generated {len(form_fields)} form fields")
             
-            return render_template(
-                'fill_form.html',
-                form=form,
-                form_fields=form_fields,
-                raw_text=raw_text
-            )
+            context = {
+                'form': form,
+                'form_fields': form_fields,
+                'raw_text': raw_text,
+                'pdf_url': pdf_url
+            }
+            if stream_min_fields is not None and len(form_fields) >= stream_min_fields:
+                return FillFormHandler.stream_page('fill_form.html', **context)
+            return render_template('fill_form.html', **context)
             
         except Exception as e:
             logger.error(f"Error handling fill form: {str(e)}", exc_info=True)
@@ -1,51 +1,59 @@
-import re
-from difflib import SequenceMatcher
+import hashlib
+import logging
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Optional
+
+from field_matcher import matcher_for
+
+logger = logging.getLogger(__name__)
+
+# Profile columns that identify a row rather than describe the applicant
+NON_PROFILE_COLUMNS = ('id', 'user_id', 'username', 'version')
 
 class FormAutofill:
     @staticmethod
-    def _normalize_field_name(name: str) -> str:
-        """Normalize field names for better matching"""
-        return re.sub(r'[^a-z0-9]', '', name.lower())
+    def format_value(field_name: str, profile_value: Any) -> Any:
+        """Convert a profile value to the format the form field expects"""
+        # Handle special field types
+        if 'date' in field_name.lower() and isinstance(profile_value, str):
+            try:
+                # Convert to standard date format
+                dt = datetime.strptime(profile_value, '%Y-%m-%d')
+                return dt.strftime('%d/%m/%Y')
+            except ValueError:
+                return profile_value
+        return profile_value
 
     @staticmethod
-    def _similarity(a: str, b: str) -> float:
-        """Calculate similarity between two strings"""
-        return SequenceMatcher(None, a, b).ratio()
+    def schema_signature(field_names: Iterable[str]) -> str:
+        """Identify a form schema by its set of field names"""
+        return hashlib.sha256("\n".join(sorted(set(field_names))).encode('utf-8')).hexdigest()
 
     @staticmethod
-    def _match_field(field_name: str, profile_fields: Dict[str, Any]) -> str:
-        """Find the best matching field in profile data"""
-        normalized_field = FormAutofill._normalize_field_name(field_name)
-        
-        # Try exact match first
-        if normalized_field in profile_fields:
-            return normalized_field
-            
-        # Find best matching field
-        best_match = None
-        best_score = 0.5  # Lower threshold for better matching
-        
-        for profile_field in profile_fields:
-            normalized_profile = FormAutofill._normalize_field_name(profile_field)
-            score = FormAutofill._similarity(normalized_field, normalized_profile)
-            
-            if score > best_score:
-                best_score = score
-                best_match = profile_field
-                
-        return best_match
+    def map_fields(field_names: Iterable[str], profile_data: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """Fuzzy-match each field name to a profile column (None when nothing matches)"""
+        field_names = list(field_names)
+        columns = [column for column in profile_data if column not in NON_PROFILE_COLUMNS]
+        return dict(zip(field_names, matcher_for(columns).match_many(field_names)))
 
     @staticmethod
-    def autofill_form_fields(form_fields: List[Dict[str, Any]], profile_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Autofill form fields with matching profile data"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        logger.info(f"Profile data received: {profile_data}")
+    def autofill_form_fields(form_fields: List[Dict[str, Any]], profile_data: Dict[str, Any],
+                             mapping: Dict[str, Optional[str]] = None, overwrite: bool = True) -> List[Dict[str, Any]]:
+        """Autofill form fields with matching profile data
+
+        With a stored mapping (field name -> profile column) the fields are
+        filled from it directly; otherwise they are fuzzy-matched. With
+        overwrite=False only empty fields are filled.
+        """
+        logger.debug(f"Profile data received: {profile_data}")
         filled_fields = []
         
+        if mapping is None:
+            mapping = FormAutofill.map_fields(
+                (field['name'] for field in form_fields if field.get('type') != 'section'), profile_data
+            )
+        
+        filled = 0
         for field in form_fields:
             # Skip section headers
             if field.get('type') == 'section':
@@ -55,28 +63,62 @@ class FormAutofill:
             field_name = field['name']
             field_value = field['value']
             
-            logger.info(f"Processing field: {field_name}")
+            logger.debug(f"Processing field: {field_name}")
             
             # Find matching profile field
-            matched_field = FormAutofill._match_field(field_name, profile_data)
+            matched_field = mapping.get(field_name)
             
-            if matched_field:
+            if matched_field and (overwrite or not field_value) and profile_data.get(matched_field) not in (None, ''):
                 profile_value = profile_data[matched_field]
-                logger.info(f"Matched {field_name} with profile field {matched_field}: {profile_value}")
+                logger.debug(f"Matched {field_name} with profile field {matched_field}")
                 
-                # Handle special field types
-                if 'date' in field_name.lower() and isinstance(profile_value, str):
-                    try:
-                        # Convert to standard date format
-                        dt = datetime.strptime(profile_value, '%Y-%m-%d')
-                        field['value'] = dt.strftime('%d/%m/%Y')
-                    except ValueError:
-                        field['value'] = profile_value
-                else:
-                    field['value'] = profile_value
+                field['value'] = FormAutofill.format_value(field_name, profile_value)
+                filled += 1
             else:
-                logger.info(f"No match found for field: {field_name}")
+                logger.debug(f"No match found for field: {field_name}")
                     
             filled_fields.append(field)
-                
+        
+        logger.info(f"Autofilled {filled} of {len(mapping)} form fields from the profile")
         return filled_fields
+
+    @staticmethod
+    def learn_corrections(mapping: Dict[str, Optional[str]], submitted: Dict[str, Any],
+                          profile_data: Dict[str, Any], previous: Dict[str, Any] = None) -> Dict[str, Optional[str]]:
+        """Mapping changes implied by the values a user submitted
+
+        A submitted value equal to a profile column's value maps the field to
+        that column. A field that was empty before (so it was autofilled) and
+        was submitted with a value that is in no column is unmapped, so it is
+        not autofilled again. previous holds the stored values before the
+        submission; values read from the document say nothing about the
+        mapping.
+        """
+        by_value = {}
+        for column, value in profile_data.items():
+            if column not in NON_PROFILE_COLUMNS and value not in (None, ''):
+                by_value.setdefault(str(value).strip().lower(), []).append(column)
+        
+        changes = {}
+        for field_name, value in submitted.items():
+            if value in (None, ''):
+                continue
+            current = mapping.get(field_name)
+            text = str(value).strip().lower()
+            columns = by_value.get(text, [])
+            if not columns and 'date' in field_name.lower():
+                # Dates are shown reformatted, so compare against the formatted profile values
+                columns = [
+                    column for matches in by_value.values() for column in matches
+                    if str(FormAutofill.format_value(field_name, profile_data[column])).strip().lower() == text
+                ]
+            if current in columns:
+                continue
+            if columns:
+                changes[field_name] = columns[0]
+            elif current and profile_data.get(current) not in (None, '') and not (previous or {}).get(field_name):
+                changes[field_name] = None
+        
+        if changes:
+            logger.info(f"Learned {len(changes)} field mapping corrections")
+        return changes
@@ -0,0 +1,246 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+class JobProgress:
+    """Handed to a job handler so it can report stages and partial results"""
+
+    def __init__(self, jobs: 'JobQueue', job_id: str):
+        self._jobs = jobs
+        self.job_id = job_id
+
+    def stage(self, name: str):
+        """Record that a stage of the job has finished"""
+        self._jobs._finish_stage(self.job_id, name)
+
+    def add_fields(self, entries: List[Dict]):
+        """Publish form entries found so far; entries with the same name replace earlier ones"""
+        self._jobs._add_fields(self.job_id, entries)
+
+class JobQueue:
+    """SQLite-persisted job queue served by a pool of worker threads
+
+    Each job runs handler(job, progress) and stores the dict it returns.
+    Queued and interrupted jobs are picked up again when the queue starts,
+    so uploads survive a restart. Only one process should own a queue
+    database.
+    """
+
+    def __init__(self, db_path: Union[str, Path], handler: Callable[[Dict, JobProgress], Dict],
+                 workers: int = 2, max_attempts: int = 3):
+        self.db_path = str(db_path)
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue()
+        self._threads = []
+        # Partial form entries of running jobs, each with the change number that last
+        # set it; not persisted, a restarted job starts over
+        self._fields = {}
+        self._fields_lock = threading.Lock()
+        # Change counters per job, so status streams can wait for the next change
+        self._versions = {}
+        self._changed = threading.Condition(self._fields_lock)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT,
+                    filename TEXT NOT NULL,
+                    pdf_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    stages TEXT NOT NULL DEFAULT '[]',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def start(self):
+        """Requeue unfinished jobs and start the workers"""
+        if self._threads:
+            return
+        with self._connect() as conn:
+            # Jobs that were running when the process stopped go back in the queue
+            conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+                         (time.time(),))
+            pending = [row['id'] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")]
+        for job_id in pending:
+            self._queue.put(job_id)
+        if pending:
+            logger.info(f"Requeued {len(pending)} unfinished jobs")
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, filename: str, pdf_path: str, owner: str = None, job_id: str = None) -> str:
+        """Persist a new job and queue it; returns the job id"""
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT INTO jobs (id, owner, filename, pdf_path, status, stage, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'queued', 'queued', ?, ?)
+            ''', (job_id, owner, filename, pdf_path, now, now))
+        self._queue.put(job_id)
+        logger.info(f"Queued job {job_id} for {filename}")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a job with its stages, result and any partial fields, or None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['stages'] = json.loads(job['stages'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        with self._fields_lock:
+            job['fields'] = [entry for _, entry in self._fields.get(job_id, {}).values()]
+        return job
+
+    def changes(self, job_id: str, since: int = 0, timeout: float = None) -> tuple:
+        """Wait up to timeout for a job to change after change number since
+
+        Returns (version, fields): the job's current change number and the
+        form entries added or updated after since. The version equals since
+        when nothing changed before the timeout. Stage and status changes
+        bump the version too; read them with get().
+        """
+        with self._changed:
+            if timeout:
+                self._changed.wait_for(lambda: self._versions.get(job_id, 0) != since, timeout)
+            version = self._versions.get(job_id, 0)
+            fields = [entry for seq, entry in self._fields.get(job_id, {}).values() if seq > since]
+        return version, fields
+
+    def purge(self, max_age_seconds: float, batch_size: int = 500) -> List[str]:
+        """Delete finished jobs older than max_age_seconds in batches; returns their ids"""
+        cutoff = time.time() - max_age_seconds
+        job_ids = []
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute('''
+                    SELECT id FROM jobs
+                    WHERE status IN ('done', 'failed') AND updated_at < ?
+                    ORDER BY updated_at LIMIT ?
+                ''', (cutoff, batch_size)).fetchall()
+                conn.executemany('DELETE FROM jobs WHERE id = ?', [(row['id'],) for row in rows])
+            job_ids.extend(row['id'] for row in rows)
+            with self._changed:
+                for row in rows:
+                    self._versions.pop(row['id'], None)
+            if len(rows) < batch_size:
+                return job_ids
+
+    def active_pdf_paths(self) -> set:
+        """Uploads still needed by queued or running jobs"""
+        with self._connect() as conn:
+            return {row['pdf_path'] for row in conn.execute(
+                "SELECT pdf_path FROM jobs WHERE status IN ('queued', 'running')")}
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job worker error for {job_id}: {str(e)}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _claim(self, job_id: str) -> Optional[Dict]:
+        """Mark a queued job as running; returns None if it is no longer queued"""
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?
+                WHERE id = ? AND status = 'queued'
+            ''', (time.time(), job_id))
+            if cursor.rowcount != 1:
+                return None
+            return dict(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def _run(self, job_id: str):
+        job = self._claim(job_id)
+        if job is None:
+            return
+        if job['attempts'] > self.max_attempts:
+            self._fail(job_id, f"Gave up after {self.max_attempts} attempts")
+            return
+
+        start_time = time.perf_counter()
+        try:
+            result = self.handler(job, JobProgress(self, job_id))
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}", exc_info=True)
+            self._fail(job_id, str(e))
+            return
+
+        with self._connect() as conn:
+            conn.execute('''
+                UPDATE jobs SET status = 'done', stage = 'done', result = ?, updated_at = ? WHERE id = ?
+            ''', (json.dumps(result, ensure_ascii=False), time.time(), job_id))
+        self._clear_fields(job_id)
+        self._notify(job_id)
+        logger.info(f"Job {job_id} done in {time.perf_counter() - start_time:.2f}s")
+
+    def _fail(self, job_id: str, error: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                         (error, time.time(), job_id))
+        self._clear_fields(job_id)
+        self._notify(job_id)
+
+    def _finish_stage(self, job_id: str, name: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute('SELECT stages FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            stages = json.loads(row['stages']) if row else []
+            stages.append({"name": name, "finished_at": now})
+            conn.execute('UPDATE jobs SET stage = ?, stages = ?, updated_at = ? WHERE id = ?',
+                         (name, json.dumps(stages), now, job_id))
+        self._notify(job_id)
+
+    def _bump(self, job_id: str) -> int:
+        """Count a change to a job and wake its waiting streams; caller holds _changed"""
+        version = self._versions.get(job_id, 0) + 1
+        self._versions[job_id] = version
+        self._changed.notify_all()
+        return version
+
+    def _notify(self, job_id: str):
+        with self._changed:
+            self._bump(job_id)
+
+    def _add_fields(self, job_id: str, entries: List[Dict]):
+        with self._changed:
+            version = self._bump(job_id)
+            fields = self._fields.setdefault(job_id, OrderedDict())
+            for entry in entries:
+                fields[(entry['type'], entry['name'])] = (version, entry)
+
+    def _clear_fields(self, job_id: str):
+        with self._fields_lock:
+            self._fields.pop(job_id, None)
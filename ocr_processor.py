@@ -5,28 +5,187 @@ from pathlib import Path
 import json
 from datetime import datetime
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from itertools import islice
+import multiprocessing
+import glob
+import os
+import tempfile
+import threading
+import time
 import argparse
 import fitz  # PyMuPDF
+import numpy as np
 import re
+import hashlib
+from typing import BinaryIO, Union
+from pdf_cache import PDFResultCache, sha256_file
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# A PDF given as a filesystem path, raw bytes or an open binary file (e.g. an upload stream)
+PDFSource = Union[str, Path, bytes, BinaryIO]
+
+def _create_ocr_engine(lang: str = 'en'):
+    """Build a PaddleOCR engine with the settings used across the app"""
+    return paddleocr.PaddleOCR(
+        use_angle_cls=False,  # Disable angle detection for speed
+        lang=lang,
+        show_log=False,
+        use_gpu=False  # Set to True if you have GPU
+    )
+
+def _ocr_result_text(result) -> str:
+    """Join the recognised lines of a PaddleOCR result"""
+    if result and result[0]:
+        return "\n".join([line[1][0] for line in result[0] if line])
+    return ""
+
+# Per-process engine used by pool workers; loaded once by the initializer and kept warm
+_worker_ocr = None
+
+def _init_ocr_worker(lang: str, ready):
+    """Process pool initializer: load the OCR engine once per worker"""
+    global _worker_ocr
+    _worker_ocr = _create_ocr_engine(lang)
+    # Tell the parent this worker's engine is loaded
+    ready.release()
+
+def _noop():
+    return None
+
+def _ocr_worker_page(samples: bytes, height: int, width: int, channels: int) -> str:
+    """OCR one rendered page inside a pool worker"""
+    image = np.frombuffer(samples, dtype=np.uint8).reshape(height, width, channels)
+    return _ocr_result_text(_worker_ocr.ocr(np.ascontiguousarray(image[:, :, ::-1])))
+
 class SmartPDFProcessor:
-    def __init__(self):
-        """Initialize with minimal settings first"""
+    POOL_STARTUP_TIMEOUT = 300  # seconds to wait for worker engines to load
+    MAX_PAGE_RETRIES = 2  # resubmissions of a page whose pool broke or was retired under it
+    CACHE_VERSION = 2  # bump when the result layout changes so stale cache entries are ignored
+    
+    # Compact text settings
+    LEADER_RE = re.compile(r'[.\u2026\u00b7_\-]{3,}')  # dotted/underscored leader lines
+    EMPTY_BOX_RE = re.compile(r'\[\s*\]')  # checkbox placeholders like "[   ]"
+    BLANK_GAP_RE = re.compile(r'\s{3,}')  # wide gaps left for handwritten answers
+    NON_LATIN_RE = re.compile(r'[^\W\d_A-Za-z\u00C0-\u024F]+')  # letters outside the Latin scripts
+    MARGIN_FRACTION = 0.08  # share of page height treated as header/footer margin
+    
+    # AcroForm widget types that hold form data, by PyMuPDF type code
+    WIDGET_TYPES = {
+        fitz.PDF_WIDGET_TYPE_TEXT: "text",
+        fitz.PDF_WIDGET_TYPE_CHECKBOX: "checkbox",
+        fitz.PDF_WIDGET_TYPE_RADIOBUTTON: "radiobutton",
+        fitz.PDF_WIDGET_TYPE_COMBOBOX: "combobox",
+        fitz.PDF_WIDGET_TYPE_LISTBOX: "listbox"
+    }
+
+    def __init__(self, ocr_workers: int = 0, page_timeout: float = None, lang: str = 'en',
+                 cache: PDFResultCache = None):
+        """Initialize with minimal settings first
+
+        Args:
+            ocr_workers: Number of OCR worker processes; 0 or 1 runs OCR in-process
+            page_timeout: Seconds to wait for a single page in pool mode before giving up on it
+            lang: PaddleOCR language code
+            cache: Optional result cache keyed by document content and options
+        """
         self.ocr = None  # Initialize OCR only when needed
+        self.ocr_workers = ocr_workers or 0
+        self.page_timeout = page_timeout
+        self.lang = lang
+        self.cache = cache
+        self._pool = None
+        # One processor may serve several threads (e.g. upload job workers):
+        # PaddleOCR is not thread-safe, and the pool must be started and
+        # retired by one thread at a time
+        self._ocr_lock = threading.Lock()
+        self._pool_lock = threading.RLock()
         
     def _init_ocr(self):
         """Lazy initialization of OCR to save memory when not needed"""
-        if self.ocr is None:
-            logger.info("Initializing OCR engine...")
-            self.ocr = paddleocr.PaddleOCR(
-                use_angle_cls=False,  # Disable angle detection for speed
-                lang='en',
-                show_log=False,
-                use_gpu=False  # Set to True if you have GPU
-            )
+        with self._ocr_lock:
+            if self.ocr is None:
+                logger.info("Initializing OCR engine...")
+                self.ocr = _create_ocr_engine(self.lang)
+
+    def _submit_page(self, pix):
+        """Submit a rendered page to the worker pool; returns (pool, future)"""
+        with self._pool_lock:
+            pool = self._get_pool()
+            try:
+                return pool, pool.submit(_ocr_worker_page, pix.samples, pix.height, pix.width, pix.n)
+            except BrokenProcessPool:
+                # A worker died since the last page; start over on a fresh pool
+                self._retire_pool(pool)
+                pool = self._get_pool()
+                return pool, pool.submit(_ocr_worker_page, pix.samples, pix.height, pix.width, pix.n)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Lazily start the OCR worker pool; it stays warm between documents"""
+        with self._pool_lock:
+            return self._start_pool() if self._pool is None else self._pool
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        """Start the worker pool and wait for its engines to load; caller holds _pool_lock"""
+        logger.info(f"Starting OCR pool with {self.ocr_workers} workers...")
+        # spawn avoids forking a parent that may already hold Paddle threads
+        context = multiprocessing.get_context('spawn')
+        ready = context.Semaphore(0)
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.ocr_workers,
+            mp_context=context,
+            initializer=_init_ocr_worker,
+            initargs=(self.lang, ready)
+        )
+        # One task per worker makes the pool start every process now, and we
+        # wait until each engine has loaded so model load time is never
+        # charged against a page timeout
+        warmup = [self._pool.submit(_noop) for _ in range(self.ocr_workers)]
+        deadline = time.monotonic() + self.POOL_STARTUP_TIMEOUT
+        loaded = 0
+        while loaded < self.ocr_workers:
+            if ready.acquire(timeout=1):
+                loaded += 1
+                continue
+            # A worker that dies while starting never signals
+            failed = [f for f in warmup if f.done() and f.exception() is not None]
+            if failed:
+                self._retire_pool()
+                raise RuntimeError(f"OCR pool failed to start: {failed[0].exception()}")
+            if time.monotonic() >= deadline:
+                logger.warning(f"Only {loaded} of {self.ocr_workers} OCR workers finished loading; continuing")
+                break
+        return self._pool
+
+    def _retire_pool(self, pool: ProcessPoolExecutor = None):
+        """Terminate the current pool's workers and drop it
+
+        shutdown() alone never stops a hung worker, which would keep its OCR
+        engine loaded while the next pool starts a fresh set of engines. With
+        pool given, nothing happens if another thread already replaced it.
+        """
+        with self._pool_lock:
+            if self._pool is None or (pool is not None and pool is not self._pool):
+                return
+            pool, self._pool = self._pool, None
+            processes = list((pool._processes or {}).values())
+            pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join(timeout=5)
+
+    def close(self):
+        """Shut down the OCR worker pool"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
 
     def _extract_text_with_pypdf(self, pdf_path: str) -> tuple:
         """Extract text using PyPDF"""
@@ -40,143 +199,688 @@ class SmartPDFProcessor:
                 
         return text_content, len(text_content) > 0
 
-    def _extract_text_with_pymupdf(self, pdf_path: str) -> tuple:
-        """Extract text using PyMuPDF (usually better quality)"""
-        doc = fitz.open(pdf_path)
-        text_content = []
+    def _extract_text_with_pymupdf(self, doc, page_numbers, force_ocr: bool = False,
+                                   form_pages=frozenset()):
+        """Extract text using PyMuPDF (usually better quality)
+
+        Yields (page_num, text) for each page, with text set to None when the
+        page's text layer is missing or too poor to use and it should be OCR'd.
+        Pages in form_pages carry data widgets and are not OCR'd unless forced.
+        """
+        for page_num in page_numbers:
+            text = doc[page_num].get_text()
+            if force_ocr or (page_num not in form_pages and self._is_poor_text_layer(text)):
+                yield page_num, None
+            else:
+                yield page_num, text
+
+    @classmethod
+    def _extract_widgets(cls, page) -> list:
+        """Read the fillable AcroForm widgets on a page"""
+        widgets = []
+        for widget in page.widgets():
+            field_type = cls.WIDGET_TYPES.get(widget.field_type)
+            if field_type is None:
+                continue  # push buttons and signatures carry no form data
+            
+            if field_type in ("checkbox", "radiobutton"):
+                options = [widget.on_state()]
+            else:
+                options = list(widget.choice_values or [])
+            
+            widgets.append({
+                "name": widget.field_name,
+                "label": widget.field_label,
+                "type": field_type,
+                "options": options,
+                "value": widget.field_value,
+                "page_number": page.number + 1,
+                "rect": [round(coord, 2) for coord in widget.rect]
+            })
+        return widgets
+
+    @classmethod
+    def _normalize_compact_line(cls, text: str) -> str:
+        """Shrink a text line to its label and blank markers
+
+        Dotted leaders, empty boxes and wide gaps become short markers. On
+        bilingual lines that already carry a Latin-script label, the
+        other-script translation is dropped.
+        """
+        text = cls.LEADER_RE.sub(' ___ ', text)
+        text = cls.EMPTY_BOX_RE.sub('[ ]', text)
+        text = cls.BLANK_GAP_RE.sub(' ___ ', text.strip())
+        if re.search(r'[A-Za-z]{3,}', text):
+            text = cls.NON_LATIN_RE.sub('', text)
+            text = re.sub(r'‘’|“”|\(\)|(^|\s)[/,]', r'\1', text)
+        text = re.sub(r'\s+', ' ', text)
+        return re.sub(r'(?:___ ?){2,}', '___ ', text).strip()
+
+    @classmethod
+    def _compact_page(cls, page, seen_margin_lines: set, ocr_text: str = None) -> tuple:
+        """Build a compact label/blank view of a page from its span layout
+
+        Lines in the top and bottom margins that already appeared on an
+        earlier page (running headers, footers, form codes) are dropped, as
+        are immediate repeats.
+
+        Returns the compact text and the kept lines with their page positions.
+        """
+        if ocr_text is not None:
+            # No span layout for OCR'd pages; normalise line by line instead
+            lines = [cls._normalize_compact_line(line) for line in ocr_text.splitlines()]
+            return "\n".join(line for line in lines if line), []
         
-        for page in doc:
-            text = page.get_text()
-            if text.strip():
-                text_content.append(text)
+        margin = page.rect.height * cls.MARGIN_FRACTION
+        kept = []
+        for block in page.get_text("dict")["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                text = cls._normalize_compact_line("".join(span["text"] for span in line["spans"]))
+                if not text or (kept and kept[-1]["text"] == text):
+                    continue
                 
-        doc.close()
-        return text_content, len(text_content) > 0
-
-    def _run_ocr(self, pdf_path: str, page_numbers=None) -> list:
-        """Run OCR on specific pages or all pages"""
-        self._init_ocr()
-        doc = fitz.open(pdf_path)
-        text_content = []
+                x0, y0, x1, y1 = line["bbox"]
+                if y0 < margin or y1 > page.rect.height - margin:
+                    if text in seen_margin_lines:
+                        continue
+                    seen_margin_lines.add(text)
+                
+                kept.append({"text": text, "bbox": [round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1)]})
         
+        return "\n".join(line["text"] for line in kept), kept
+
+    @staticmethod
+    def _pixmap_to_array(pix) -> np.ndarray:
+        """Convert pixmap samples to a contiguous HxWxC BGR array"""
+        image = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        # PaddleOCR expects OpenCV channel order; the reversed view has a negative
+        # stride and is read-only, so make the one BGR copy here
+        return np.ascontiguousarray(image[:, :, ::-1])
+
+    def _ocr_image(self, image) -> str:
+        """Run OCR on a file path or an image array and join the recognised lines"""
+        with self._ocr_lock:
+            return _ocr_result_text(self.ocr.ocr(image))
+
+    @staticmethod
+    def _read_source(source: PDFSource) -> tuple:
+        """Normalise a PDF source into (path, data); exactly one of them is set"""
+        if isinstance(source, (str, Path)):
+            return str(source), None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return None, bytes(source)
+        if hasattr(source, 'read'):
+            return None, source.read()
+        raise TypeError(f"Unsupported PDF source: {type(source).__name__}")
+
+    @staticmethod
+    def _open_document(path: str = None, data: bytes = None):
+        """Open a PDF from a path or from in-memory bytes"""
+        if path is not None:
+            return fitz.open(path)
+        return fitz.open(stream=data, filetype="pdf")
+
+    def _run_ocr(self, source: PDFSource, page_numbers=None, in_memory: bool = True) -> list:
+        """Run OCR on specific pages or all pages, returning one text per page
+
+        With in_memory=True pages are handed to the OCR engine as arrays copied
+        from the pixmap samples, so nothing is written to disk; otherwise each
+        page goes through a PNG in a private temporary file.
+        """
+        doc = self._open_document(*self._read_source(source))
         pages_to_process = page_numbers if page_numbers else range(len(doc))
         
-        for page_num in tqdm(pages_to_process, desc="Running OCR"):
-            page = doc[page_num]
-            pix = page.get_pixmap()
+        try:
+            pages = self._iter_ocr(doc, ((page_num, None) for page_num in pages_to_process), in_memory)
+            return [text for _, _, text, _ in pages]
+        finally:
+            doc.close()
+
+    def _iter_ocr(self, doc, classified_pages, in_memory: bool = True):
+        """OCR the pages that need it and yield (page_num, method, text, ocr_error) in page order
+
+        classified_pages yields (page_num, text) pairs, where text is None for
+        pages that must be OCR'd. ocr_error is None unless OCR failed or timed
+        out on the page, in which case its text is left empty.
+        """
+        if self.ocr_workers > 1:
+            return self._iter_ocr_parallel(doc, classified_pages)
+        return self._iter_ocr_serial(doc, classified_pages, in_memory)
+
+    def _iter_ocr_serial(self, doc, classified_pages, in_memory: bool = True):
+        """OCR pages one at a time on the in-process engine"""
+        progress = None
+        
+        for page_num, page_text in classified_pages:
+            if page_text is not None:
+                yield page_num, "text_extraction", page_text, None
+                continue
             
-            # Save page as temporary image
-            temp_img = f"temp_page_{page_num}.png"
-            pix.save(temp_img)
+            self._init_ocr()
+            if progress is None:
+                progress = tqdm(desc="Running OCR", unit="page")
             
-            # Run OCR
-            result = self.ocr.ocr(temp_img)
+            page = doc[page_num]
+            pix = page.get_pixmap(alpha=False)
             
-            if result and result[0]:
-                page_text = "\n".join([line[1][0] for line in result[0] if line])
-                text_content.append(page_text)
-                
-            # Clean up
-            Path(temp_img).unlink()
+            if in_memory:
+                page_text = self._ocr_image(self._pixmap_to_array(pix))
+            else:
+                # Save page as a temporary image no other job can collide with
+                fd, temp_img = tempfile.mkstemp(prefix=f"page_{page_num}_", suffix=".png")
+                os.close(fd)
+                try:
+                    pix.save(temp_img)
+                    page_text = self._ocr_image(temp_img)
+                finally:
+                    Path(temp_img).unlink(missing_ok=True)
             
-        doc.close()
-        return text_content
+            progress.update(1)
+            yield page_num, "ocr", page_text, None
+        
+        if progress is not None:
+            progress.close()
+
+    def _iter_ocr_parallel(self, doc, classified_pages):
+        """OCR pages on the worker pool and yield results in page order
 
-    def _is_scanned_pdf(self, text_content: list, total_pages: int) -> bool:
-        """Determine if PDF is likely scanned based on text extraction results"""
-        if not text_content:
+        Pages are read ahead into a bounded window so OCR for later pages runs
+        while earlier ones are still in progress. At most one page per worker
+        is in flight, so a page's timeout starts when a worker is free to take
+        it. A page that times out is logged and left empty, and the pool is
+        terminated and replaced; pages that were still running on it are
+        resubmitted. A crashed worker breaks the whole pool, so it is replaced
+        the same way. A page is resubmitted at most MAX_PAGE_RETRIES times, so
+        one that keeps crashing workers is eventually left empty.
+        """
+        window = deque()
+        in_flight = {}
+        lookahead = self.ocr_workers * 4
+        exhausted = False
+        progress = None
+        
+        def submit(entry):
+            pix = doc[entry["page_num"]].get_pixmap(alpha=False)
+            entry["pool"], future = self._submit_page(pix)
+            entry["started"] = time.monotonic()
+            in_flight[future] = entry
+        
+        try:
+            while True:
+                # Read ahead while there is room in the window and a free worker
+                while not exhausted and len(window) < lookahead and len(in_flight) < self.ocr_workers:
+                    item = next(classified_pages, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    page_num, page_text = item
+                    entry = {"page_num": page_num, "text": page_text}
+                    if page_text is None:
+                        if progress is None:
+                            progress = tqdm(desc="Running OCR", unit="page")
+                        submit(entry)
+                    window.append(entry)
+                
+                # Yield every finished page at the head of the window
+                while window and window[0]["text"] is not None:
+                    entry = window.popleft()
+                    yield (entry["page_num"], "ocr" if "started" in entry else "text_extraction",
+                           entry["text"], entry.get("error"))
+                
+                if not window:
+                    if exhausted:
+                        break
+                    continue
+                
+                timeout = None
+                if self.page_timeout:
+                    oldest = min(entry["started"] for entry in in_flight.values())
+                    timeout = max(0, oldest + self.page_timeout - time.monotonic())
+                
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    entry = in_flight.pop(future, None)
+                    if entry is None:
+                        continue  # already resubmitted along with a sibling from a broken pool
+                    try:
+                        entry["text"] = future.result()
+                    except Exception as e:
+                        if isinstance(e, BrokenProcessPool) and entry["pool"] is self._pool:
+                            # A worker died and the executor refuses all further work
+                            logger.warning(f"OCR pool broke on page {entry['page_num'] + 1}; replacing it")
+                            self._retire_pool(entry["pool"])
+                        if entry["pool"] is not self._pool and entry.get("retries", 0) < self.MAX_PAGE_RETRIES:
+                            # The pool is gone: retry this page and everything else that ran on it
+                            retry = [entry] + [sibling for sibling in in_flight.values()
+                                               if sibling["pool"] is entry["pool"]]
+                            for sibling_future in [f for f, sibling in in_flight.items()
+                                                   if sibling["pool"] is entry["pool"]]:
+                                in_flight.pop(sibling_future)
+                            for sibling in retry:
+                                sibling["retries"] = sibling.get("retries", 0) + 1
+                                submit(sibling)
+                            continue
+                        logger.error(f"OCR failed on page {entry['page_num'] + 1}: {str(e)}")
+                        entry["text"] = ""
+                        entry["error"] = f"failed: {e}"
+                    progress.update(1)
+                
+                if self.page_timeout:
+                    now = time.monotonic()
+                    timed_out = [future for future, entry in in_flight.items()
+                                 if now - entry["started"] >= self.page_timeout]
+                    timed_out_entries = []
+                    for future in timed_out:
+                        entry = in_flight.pop(future)
+                        timed_out_entries.append(entry)
+                        logger.warning(f"OCR timed out on page {entry['page_num'] + 1} after {self.page_timeout}s")
+                        entry["text"] = ""
+                        entry["error"] = f"timed out after {self.page_timeout}s"
+                        progress.update(1)
+                    if timed_out:
+                        # Retiring kills every worker, so pages still running on
+                        # healthy workers are resubmitted to the fresh pool
+                        retired = {entry["pool"] for entry in timed_out_entries}
+                        requeue = [(future, entry) for future, entry in in_flight.items()
+                                   if entry["pool"] in retired]
+                        for pool in retired:
+                            self._retire_pool(pool)
+                        for future, entry in requeue:
+                            in_flight.pop(future)
+                            submit(entry)
+        finally:
+            for future in in_flight:
+                future.cancel()
+            if progress is not None:
+                progress.close()
+
+    @staticmethod
+    def _is_poor_text_layer(text: str) -> bool:
+        """Determine if a page is likely scanned based on its extracted text"""
+        # Check text density
+        if len(text.strip()) < 100:
             return True
             
-        # Check text density
-        total_text = "\n".join(text_content)
-        chars_per_page = len(total_text) / total_pages
-        
         # Check for common patterns in digital PDFs
-        has_common_patterns = bool(re.search(r'[A-Za-z]{3,}', total_text))
+        return not re.search(r'[A-Za-z]{3,}', text)
+
+    def iter_pages(self, source: PDFSource, max_pages: int = None, force_ocr: bool = False,
+                   compact: bool = False):
+        """
+        Yield page results in page order as soon as each page is extracted or OCR'd
+        
+        Pages with a usable text layer keep their extracted text; only pages
+        whose text layer is missing or poor are sent to OCR.
+        
+        Args:
+            source: Path to PDF file, PDF bytes or a binary file-like object
+            max_pages: Maximum number of pages to process
+            force_ocr: Force OCR even if text is extractable
+            compact: Also build the compact label/blank view of each page
+        
+        Yields:
+            dict with page_number, method ("text_extraction" or "ocr"), content
+            and the page's AcroForm widgets, plus ocr_error when OCR failed or
+            timed out on the page; with compact=True also
+            compact_content and layout (the kept lines and their positions)
+        """
+        doc = self._open_document(*self._read_source(source))
+        try:
+            yield from self._iter_document_pages(doc, max_pages, force_ocr, compact)
+        finally:
+            doc.close()
+
+    def _iter_document_pages(self, doc, max_pages: int = None, force_ocr: bool = False,
+                             compact: bool = False):
+        """Run text extraction and OCR over an already open document"""
+        total_pages = len(doc)
+        pages_to_process = range(min(total_pages, max_pages or total_pages))
+        
+        # Pages with fillable data widgets describe their own fields, so they are
+        # never OCR'd unless explicitly forced. Decided per page: a scanned form
+        # whose only widgets are signatures or buttons still needs OCR.
+        widgets = {}
+        if doc.is_form_pdf:
+            widgets = {page_num: self._extract_widgets(doc[page_num]) for page_num in pages_to_process}
+        form_pages = {page_num for page_num, page_widgets in widgets.items() if page_widgets}
+        classified_pages = self._extract_text_with_pymupdf(
+            doc, pages_to_process, force_ocr, form_pages=form_pages
+        )
         
-        return chars_per_page < 100 or not has_common_patterns
+        seen_margin_lines = set()
+        for page_num, method, content, ocr_error in self._iter_ocr(doc, classified_pages):
+            page_result = {
+                "page_number": page_num + 1,
+                "method": method,
+                "content": content,
+                "widgets": widgets.get(page_num, [])
+            }
+            if ocr_error:
+                page_result["ocr_error"] = ocr_error
+            if compact:
+                page_result["compact_content"], page_result["layout"] = self._compact_page(
+                    doc[page_num], seen_margin_lines, content if method == "ocr" else None
+                )
+            yield page_result
 
-    def process_pdf(self, pdf_path: str, output_path: str = None, 
-                   max_pages: int = None, force_ocr: bool = False) -> dict:
+    def process_pdf(self, source: PDFSource, output_path: str = None, 
+                   max_pages: int = None, force_ocr: bool = False, name: str = None,
+                   compact: bool = False) -> dict:
         """
-        Smart PDF processing with automatic detection of PDF type
+        Smart PDF processing with per-page detection of scanned pages
+        
+        The document is opened once and shared by text extraction and OCR.
         
         Args:
-            pdf_path: Path to PDF file
+            source: Path to PDF file, PDF bytes or a binary file-like object
             output_path: Optional path to save results
             max_pages: Maximum number of pages to process
             force_ocr: Force OCR even if text is extractable
+            name: Name to report as pdf_path when the source is not a path
+            compact: Also build compact_text, a deduplicated label/blank view
+                of the document that is much cheaper to send to the LLM
         """
         try:
-            logger.info(f"Processing PDF: {pdf_path}")
+            pdf_path, data = self._read_source(source)
+            name = name or pdf_path
+            logger.info(f"Processing PDF: {name}")
             start_time = datetime.now()
             
-            # Get basic PDF info
-            doc = fitz.open(pdf_path)
-            total_pages = len(doc)
-            doc.close()
-            
-            pages_to_process = range(min(total_pages, max_pages or total_pages))
+            cache_key = None
+            if self.cache is not None:
+                digest = sha256_file(pdf_path) if pdf_path is not None else hashlib.sha256(data).hexdigest()
+                cache_key = self.cache.make_key(
+                    digest,
+                    max_pages=max_pages,
+                    force_ocr=force_ocr,
+                    lang=self.lang,
+                    compact=compact,
+                    version=self.CACHE_VERSION
+                )
+                result = self.cache.get(cache_key)
+                if result is not None:
+                    result.update({
+                        "pdf_path": name,
+                        "processing_time": str(datetime.now() - start_time),
+                        "timestamp": str(datetime.now()),
+                        "cache_hit": True
+                    })
+                    logger.info(f"Using cached result for {name}")
+                    self._save_result(result, output_path)
+                    return result
             
-            # Try text extraction first
-            text_content, success = self._extract_text_with_pymupdf(pdf_path)
+            doc = self._open_document(pdf_path, data)
+            try:
+                total_pages = len(doc)
+                pages = list(self._iter_document_pages(doc, max_pages=max_pages, force_ocr=force_ocr,
+                                                       compact=compact))
+            finally:
+                doc.close()
             
-            # Determine if we need OCR
-            needs_ocr = force_ocr or self._is_scanned_pdf(text_content, total_pages)
+            ocr_pages = sum(1 for page in pages if page["method"] == "ocr")
             
-            if needs_ocr:
-                logger.info("PDF appears to be scanned or has poor text quality, using OCR...")
-                text_content = self._run_ocr(pdf_path, pages_to_process)
+            if ocr_pages == len(pages):
+                extraction_method = "ocr"
+            elif ocr_pages:
+                extraction_method = "hybrid"
             else:
-                logger.info("Successfully extracted text without OCR")
+                extraction_method = "text_extraction"
+            logger.info(f"Extracted {len(pages)} pages, {ocr_pages} of them with OCR")
+            
+            form_widgets = [widget for page in pages for widget in page["widgets"]]
+            if form_widgets:
+                logger.info(f"Found {len(form_widgets)} AcroForm widgets")
             
             # Prepare output
             result = {
-                "pdf_path": pdf_path,
+                "pdf_path": name,
                 "total_pages": total_pages,
-                "pages_processed": len(pages_to_process),
-                "extraction_method": "ocr" if needs_ocr else "text_extraction",
+                "pages_processed": len(pages),
+                "extraction_method": extraction_method,
+                "ocr_pages": ocr_pages,
                 "processing_time": str(datetime.now() - start_time),
                 "timestamp": str(datetime.now()),
-                "pages": [
-                    {
-                        "page_number": i + 1,
-                        "content": content
-                    }
-                    for i, content in enumerate(text_content)
-                ],
-                "raw_text": "\n\n".join(text_content)
+                "pages": pages,
+                "form_widgets": form_widgets,
+                "raw_text": "\n\n".join(page["content"] for page in pages if page["content"].strip())
             }
+            if compact:
+                result["compact_text"] = "\n\n".join(
+                    f"[Page {page['page_number']}]\n{page['compact_content']}"
+                    for page in pages if page["compact_content"]
+                )
             
-            # Save if output path provided
-            if output_path:
-                output_path = Path(output_path)
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(result, f, indent=2, ensure_ascii=False)
-                logger.info(f"Saved results to {output_path}")
+            failed_pages = [page["page_number"] for page in pages if page.get("ocr_error")]
+            if cache_key is not None:
+                if failed_pages:
+                    # A timeout or worker failure may be transient; don't pin the empty pages
+                    logger.warning(f"Not caching {name}: OCR failed on pages {failed_pages}")
+                else:
+                    self.cache.put(cache_key, result)
             
+            self._save_result(result, output_path)
             return result
             
         except Exception as e:
             logger.error(f"Processing failed: {str(e)}")
             raise
 
+    @staticmethod
+    def _save_result(result: dict, output_path: str = None):
+        """Save results as JSON if an output path was provided"""
+        if output_path:
+            output_path = Path(output_path)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+            logger.info(f"Saved results to {output_path}")
+
+# Per-process processor used by batch workers
+_batch_processor = None
+
+def _init_batch_worker(cache_dir: str = None, ocr_workers: int = 0, page_timeout: float = None):
+    """Process pool initializer for batch mode: one processor per worker"""
+    global _batch_processor
+    _batch_processor = SmartPDFProcessor(
+        ocr_workers=ocr_workers,
+        page_timeout=page_timeout,
+        cache=PDFResultCache(cache_dir) if cache_dir else None
+    )
+
+def _process_batch_document(pdf_path: str, options: dict) -> dict:
+    """Process one document in a batch worker, turning failures into an error record"""
+    try:
+        return _batch_processor.process_pdf(pdf_path, **options)
+    except Exception as e:
+        return {"pdf_path": pdf_path, "error": str(e), "timestamp": str(datetime.now())}
+
+def _find_batch_documents(pattern: str) -> list:
+    """List the PDFs under a directory, or matching a glob pattern, in a stable order"""
+    path = Path(pattern)
+    if path.is_dir():
+        return sorted(str(f) for f in path.rglob('*') if f.is_file() and f.suffix.lower() == '.pdf')
+    return sorted(f for f in glob.glob(pattern, recursive=True) if f.lower().endswith('.pdf'))
+
+def _document_key(pdf_path: str) -> str:
+    """Identify a document by its resolved path, so ./a.pdf and a.pdf are the same one"""
+    return str(Path(pdf_path).resolve())
+
+def _truncate_partial_record(output_path: Path):
+    """Drop a trailing line left unfinished by a crash, so the next record starts on its own line"""
+    if not output_path.exists():
+        return
+    with open(output_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        # Scan back for the last complete line
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        logger.warning(f"Dropping a partial record at the end of {output_path}")
+        f.truncate(end)
+
+def _load_completed_documents(output_path: Path) -> set:
+    """Read an existing JSONL output and return the keys of the documents that already succeeded"""
+    completed = set()
+    if not output_path.exists():
+        return completed
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a partial line left by an interrupted run
+            if "error" not in record and record.get("pdf_path"):
+                completed.add(_document_key(record["pdf_path"]))
+    return completed
+
+def run_batch(pattern: str, output_path: str, jobs: int = 1, max_pages: int = None,
+              force_ocr: bool = False, compact: bool = False, cache_dir: str = None,
+              ocr_workers: int = 0, page_timeout: float = None) -> dict:
+    """
+    Process every PDF in a directory or glob, appending one JSON line per document
+    
+    Documents already recorded as successful in output_path are skipped, so an
+    interrupted run resumes where it stopped; failed documents are retried.
+    ocr_workers and page_timeout configure each job's processor, so a hung
+    page is given up on instead of stalling its job.
+    
+    Returns:
+        Throughput summary for the run
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    documents = _find_batch_documents(pattern)
+    _truncate_partial_record(output_path)
+    completed = _load_completed_documents(output_path)
+    pending = [doc for doc in documents if _document_key(doc) not in completed]
+    logger.info(f"Batch: {len(documents)} documents found, {len(documents) - len(pending)} already done, "
+                f"{len(pending)} to process with {jobs} jobs")
+    
+    options = {"max_pages": max_pages, "force_ocr": force_ocr, "compact": compact}
+    summary = {
+        "documents": 0,
+        "failed": 0,
+        "skipped": len(documents) - len(pending),
+        "pages": 0,
+        "ocr_pages": 0,
+        "text_pages": 0
+    }
+    start = time.monotonic()
+    
+    def record(result):
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        if "error" in result:
+            summary["failed"] += 1
+            logger.error(f"Failed {result['pdf_path']}: {result['error']}")
+            return
+        summary["documents"] += 1
+        summary["pages"] += result["pages_processed"]
+        summary["ocr_pages"] += result["ocr_pages"]
+        summary["text_pages"] += result["pages_processed"] - result["ocr_pages"]
+    
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            tqdm(total=len(pending), desc="Batch", unit="doc") as progress:
+        if jobs <= 1:
+            _init_batch_worker(cache_dir, ocr_workers, page_timeout)
+            for pdf_path in pending:
+                record(_process_batch_document(pdf_path, options))
+                progress.update(1)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_init_batch_worker,
+                                     initargs=(cache_dir, ocr_workers, page_timeout)) as pool:
+                # Keep a bounded number of documents in flight so results stream out steadily
+                remaining = iter(pending)
+                in_flight = {pool.submit(_process_batch_document, pdf_path, options)
+                             for pdf_path in islice(remaining, jobs * 2)}
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+                        progress.update(1)
+                    for pdf_path in islice(remaining, len(done)):
+                        in_flight.add(pool.submit(_process_batch_document, pdf_path, options))
+    
+    elapsed = time.monotonic() - start
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    summary["docs_per_sec"] = round(summary["documents"] / elapsed, 2) if elapsed else 0.0
+    summary["pages_per_sec"] = round(summary["pages"] / elapsed, 2) if elapsed else 0.0
+    return summary
+
 def main():
     parser = argparse.ArgumentParser(description='Smart PDF Processing')
-    parser.add_argument('pdf_path', help='Path to PDF file')
-    parser.add_argument('--output', '-o', help='Output JSON path')
+    parser.add_argument('pdf_path', help='Path to PDF file, or a directory/glob with --batch')
+    parser.add_argument('--output', '-o', help='Output JSON path (JSONL in batch mode)')
     parser.add_argument('--max-pages', type=int, help='Maximum pages to process')
     parser.add_argument('--force-ocr', action='store_true', help='Force OCR processing')
+    parser.add_argument('--workers', type=int, default=0, help='OCR worker processes (0 = in-process)')
+    parser.add_argument('--page-timeout', type=float, help='Seconds allowed per page in worker mode')
+    parser.add_argument('--cache-dir', help='Reuse results for identical PDFs from this directory')
+    parser.add_argument('--stream', action='store_true', help='Print one JSON line per page as it is ready')
+    parser.add_argument('--compact', action='store_true', help='Also build the compact label/blank text view')
+    parser.add_argument('--batch', action='store_true', help='Process every PDF in a directory or glob')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='Documents processed in parallel in batch mode')
     args = parser.parse_args()
     
+    if args.page_timeout and args.workers < 2:
+        parser.error('--page-timeout requires --workers 2 or more')
+    
+    if args.batch:
+        if not args.output:
+            parser.error('--batch requires --output')
+        summary = run_batch(
+            args.pdf_path,
+            args.output,
+            jobs=args.jobs,
+            max_pages=args.max_pages,
+            force_ocr=args.force_ocr,
+            compact=args.compact,
+            cache_dir=args.cache_dir,
+            ocr_workers=args.workers,
+            page_timeout=args.page_timeout
+        )
+        total_pages = summary["pages"] or 1
+        print(f"Documents: {summary['documents']} processed, {summary['skipped']} skipped, {summary['failed']} failed")
+        print(f"Pages:     {summary['pages']} ({summary['ocr_pages']} OCR / {summary['text_pages']} text, "
+              f"{summary['ocr_pages'] / total_pages:.0%} OCR)")
+        print(f"Elapsed:   {summary['elapsed_seconds']}s, {summary['docs_per_sec']} docs/sec, "
+              f"{summary['pages_per_sec']} pages/sec")
+        return
+    
+    processor = SmartPDFProcessor(
+        ocr_workers=args.workers,
+        page_timeout=args.page_timeout,
+        cache=PDFResultCache(args.cache_dir) if args.cache_dir else None
+    )
     try:
-        processor = SmartPDFProcessor()
+        if args.stream:
+            for page in processor.iter_pages(args.pdf_path, max_pages=args.max_pages,
+                                             force_ocr=args.force_ocr, compact=args.compact):
+                print(json.dumps(page, ensure_ascii=False), flush=True)
+            return
+        
         result = processor.process_pdf(
             args.pdf_path, 
             args.output,
             max_pages=args.max_pages,
-            force_ocr=args.force_ocr
+            force_ocr=args.force_ocr,
+            compact=args.compact
         )
         
         if not args.output:
@@ -185,6 +889,8 @@ def main():
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         exit(1)
+    finally:
+        processor.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+def sha256_file(path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file in chunks so large PDFs are never read into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class PDFResultCache:
+    """Two-tier cache of process_pdf results keyed by document content and options
+
+    The memory tier is a small LRU of serialized results. The disk tier keeps one
+    JSON file per key and evicts the least recently used files once the
+    directory grows past max_disk_bytes.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path] = None, max_memory_items: int = 128,
+                 max_disk_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+        self._disk_bytes = 0
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(f.stat().st_size for f in self.cache_dir.glob('*/*.json'))
+
+    @staticmethod
+    def make_key(digest: str, **options) -> str:
+        """Combine a document digest with the processing options that affect the result"""
+        option_str = json.dumps(options, sort_keys=True, default=str)
+        return hashlib.sha256(f"{digest}:{option_str}".encode('utf-8')).hexdigest()
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a cached result, or None on a miss"""
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return json.loads(payload)
+
+        if self.cache_dir:
+            path = self._path_for(key)
+            try:
+                payload = path.read_text(encoding='utf-8')
+                os.utime(path)  # mark as recently used for eviction
+            except OSError:
+                payload = None
+            if payload is not None:
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                    self._remember(key, payload)
+                return json.loads(payload)
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key: str, result: Dict):
+        """Store a result in both tiers"""
+        payload = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._stats['stores'] += 1
+            self._remember(key, payload)
+
+        if self.cache_dir:
+            path = self._path_for(key)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp_path.write_text(payload, encoding='utf-8')
+                previous = path.stat().st_size if path.exists() else 0
+                os.replace(tmp_path, path)
+                with self._lock:
+                    self._disk_bytes += path.stat().st_size - previous
+                    over_budget = self._disk_bytes > self.max_disk_bytes
+                if over_budget:
+                    self._evict_disk()
+            except OSError as e:
+                logger.warning(f"Could not write cache entry {key}: {str(e)}")
+
+    def _remember(self, key: str, payload: str):
+        """Insert into the memory LRU; caller holds the lock"""
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Delete least recently used entries until the disk tier is back under budget"""
+        entries = []
+        for path in self.cache_dir.glob('*/*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        # Evict down to 90% so we don't rescan the directory on every store
+        target = int(self.max_disk_bytes * 0.9)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self._disk_bytes = total
+            self._stats['evictions'] += evicted
+        logger.info(f"Evicted {evicted} PDF cache entries, disk tier now {total} bytes")
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_items'] = len(self._memory)
+            stats['disk_bytes'] = self._disk_bytes
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._memory.clear()
+            self._disk_bytes = 0
+        if self.cache_dir:
+            for path in self.cache_dir.glob('*/*.json'):
+                path.unlink(missing_ok=True)
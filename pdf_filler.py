@@ -0,0 +1,222 @@
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+class PDFFiller:
+    """Write form values back into the uploaded PDF
+
+    Fillable forms get their values written into the AcroForm widgets named
+    by the extraction's field_map. Everything else is written as overlay text
+    next to the label it belongs to. The original PDF is never modified: it
+    is copied and the copy is saved incrementally, so the output is the
+    original bytes followed by a small update section.
+    """
+
+    CHUNK_SIZE = 256 * 1024
+    OFF_VALUES = ('', 'off', 'false', 'no', '0', 'n')
+    MIN_FONT_SIZE = 6
+
+    def __init__(self, tmp_dir: Union[str, Path] = None, font_size: float = 10,
+                 text_color: Tuple[float, float, float] = (0, 0, 0.6)):
+        self.tmp_dir = str(tmp_dir) if tmp_dir else None
+        self.font_size = font_size
+        self.text_color = text_color
+        if self.tmp_dir:
+            os.makedirs(self.tmp_dir, exist_ok=True)
+
+    @staticmethod
+    def field_values(fields: Dict[str, Any], path: Tuple = ()) -> List[Tuple[Tuple, str]]:
+        """Flatten extracted fields into (path, text) pairs, skipping empty values"""
+        values = []
+        for name, value in fields.items():
+            if isinstance(value, dict):
+                values.extend(PDFFiller.field_values(value, path + (name,)))
+                continue
+            if isinstance(value, list):
+                value = ', '.join(str(item) for item in value if item not in (None, ''))
+            if value is None or str(value).strip() == '':
+                continue
+            values.append((path + (name,), str(value)))
+        return values
+
+    def fill(self, pdf_path: Union[str, Path], extracted_fields: Dict[str, Any],
+             field_map: Dict[str, str] = None) -> Dict:
+        """Write the field values into a copy of the PDF
+
+        Returns the path of the filled copy, its size and what was written.
+        The caller owns the copy and should delete it when done.
+        """
+        start_time = time.perf_counter()
+        values = self.field_values(extracted_fields or {})
+        field_map = field_map or {}
+
+        widget_values = {}
+        overlay_values = []
+        for path, text in values:
+            widget_name = field_map.get(path[0]) if len(path) == 1 else None
+            if widget_name is not None:
+                widget_values[widget_name] = text
+            else:
+                overlay_values.append((path, text))
+
+        fd, out_path = tempfile.mkstemp(suffix='.pdf', dir=self.tmp_dir)
+        os.close(fd)
+        try:
+            shutil.copyfile(pdf_path, out_path)
+            doc = fitz.open(out_path)
+            try:
+                widgets_filled = self._fill_widgets(doc, widget_values) if widget_values else 0
+                placed, unplaced = self._fill_overlay(doc, overlay_values) if overlay_values else (0, [])
+                if doc.can_save_incrementally():
+                    doc.saveIncr()
+                else:
+                    # Damaged or repaired files cannot take an incremental update
+                    logger.warning(f"Cannot save {pdf_path} incrementally, rewriting it")
+                    full_path = out_path + '.full'
+                    doc.save(full_path, garbage=1, deflate=True)
+                    doc.close()
+                    os.replace(full_path, out_path)
+            finally:
+                if not doc.is_closed:
+                    doc.close()
+        except Exception:
+            os.remove(out_path)
+            raise
+
+        if unplaced:
+            logger.info(f"No label found for {len(unplaced)} fields: {unplaced}")
+        logger.info(f"Filled {widgets_filled} widgets and placed {placed} overlay values "
+                    f"in {time.perf_counter() - start_time:.3f}s")
+        return {
+            "path": out_path,
+            "size": os.path.getsize(out_path),
+            "widgets_filled": widgets_filled,
+            "overlay_placed": placed,
+            "unplaced": unplaced
+        }
+
+    @classmethod
+    def _fill_widgets(cls, doc, values: Dict[str, str]) -> int:
+        """Set widget values by field name; returns the number of widgets updated"""
+        filled = 0
+        for page in doc:
+            for widget in page.widgets():
+                text = values.get(widget.field_name)
+                if text is None:
+                    continue
+
+                if widget.field_type == fitz.PDF_WIDGET_TYPE_CHECKBOX:
+                    widget.field_value = text.strip().lower() not in cls.OFF_VALUES
+                elif widget.field_type == fitz.PDF_WIDGET_TYPE_RADIOBUTTON:
+                    # One widget per button; only the button whose on state was chosen is set
+                    on_state = widget.on_state()
+                    if on_state is False or str(on_state) != text:
+                        continue
+                    widget.field_value = True
+                else:
+                    widget.field_value = text
+                widget.update()
+                filled += 1
+        return filled
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return ' '.join(re.findall(r'[a-z0-9]+', text.lower()))
+
+    def _fill_overlay(self, doc, values: List[Tuple[Tuple, str]]) -> Tuple[int, List[str]]:
+        """Write values as text to the right of their label
+
+        Labels are matched against the page text lines in document order;
+        each line is used once, so repeated labels fill successive lines.
+        """
+        # One text page per page serves both the line scan and the label searches,
+        # and one shape per page collects all of its overlay text
+        lines = []
+        rects_by_page = {}
+        textpages = {}
+        shapes = {}
+        for page in doc:
+            textpages[page.number] = page.get_textpage()
+            for block in page.get_text("dict", textpage=textpages[page.number])["blocks"]:
+                if block["type"] != 0:
+                    continue
+                for line in block["lines"]:
+                    text = self._normalize("".join(span["text"] for span in line["spans"]))
+                    if text:
+                        lines.append((page, fitz.Rect(line["bbox"]), f" {text} "))
+                        rects_by_page.setdefault(page.number, []).append(lines[-1][1])
+
+        needles = [f" {self._normalize(str(path[-1]).replace('_', ' '))} " for path, _ in values]
+        used = set()
+        placed = 0
+        unplaced = []
+        for (path, value), needle in zip(values, needles):
+            match = next((i for i, (_, _, text) in enumerate(lines)
+                          if i not in used and needle in text), None)
+            if match is None:
+                unplaced.append('.'.join(str(key) for key in path))
+                continue
+            used.add(match)
+
+            page, line_rect, text = lines[match]
+            label = str(path[-1]).replace('_', ' ')
+            hits = page.search_for(label, clip=line_rect, textpage=textpages[page.number])
+            anchor = hits[0] if hits else line_rect
+            # Labels usually end their line, often followed by a hint like "(yyyy/mm/dd)",
+            # so the value goes after the whole line unless another label shares it.
+            # Values are shrunk to fit before the next text on the row.
+            rest = text[text.index(needle) + len(needle) - 1:]
+            shared = any(other != needle and other in rest for other in needles)
+            x = (anchor.x1 if shared else line_rect.x1) + self.font_size * 0.8
+            font_size = self._fit_font_size(page, rects_by_page[page.number], anchor, x, value)
+            position = (x, anchor.y1 - 0.2 * self.font_size)
+            if page.number not in shapes:
+                shapes[page.number] = page.new_shape()
+            shapes[page.number].insert_text(position, value, fontsize=font_size, color=self.text_color)
+            placed += 1
+
+        for shape in shapes.values():
+            shape.commit()
+        return placed, unplaced
+
+    def _fit_font_size(self, page, line_rects: List, anchor, x: float, value: str) -> float:
+        """Font size at which value fits between x and the next text on the row
+
+        Never smaller than MIN_FONT_SIZE, even if the value then overlaps.
+        """
+        # The next text to the right is usually the neighbouring cell's label
+        right = min((rect.x0 for rect in line_rects
+                     if rect.x0 >= x and rect.y0 < anchor.y1 and rect.y1 > anchor.y0),
+                    default=page.rect.width - 10)
+        available = right - 4 - x
+        width = fitz.get_text_length(value, fontsize=self.font_size)
+        if width <= available:
+            return self.font_size
+        font_size = self.font_size * available / width
+        return max(self.MIN_FONT_SIZE, font_size)
+
+    def iter_file(self, path: Union[str, Path], chunk_size: int = None, remove: bool = False) -> Iterator[bytes]:
+        """Yield a file in chunks so a response never holds the whole PDF in memory
+
+        With remove=True the file is deleted once it has been read or the
+        iterator is closed.
+        """
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(chunk_size or self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            if remove:
+                Path(path).unlink(missing_ok=True)
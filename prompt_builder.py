@@ -0,0 +1,154 @@
+import logging
+import re
+from typing import Dict, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# One token per Latin word, digit, symbol or non-Latin character. This tracks
+# BPE tokenizers closely enough for budgeting, without shipping a tokenizer.
+_TOKEN_RE = re.compile(r'[A-Za-z]+|[^\sA-Za-z]')
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of model tokens in a piece of text"""
+    return len(_TOKEN_RE.findall(text))
+
+class PromptBuilder:
+    """Build extraction requests that send the form text once, within a token budget
+
+    When the document does not fit, the lowest-value lines are dropped first:
+    repeated lines, then lines with no usable label text, then long prose
+    such as instructions, and finally the tail of the document.
+    """
+
+    # Lines that carry answer slots or labels are the most valuable
+    FIELD_MARKER_RE = re.compile(r'___|\[ ?\]|:|\(\s*\)')
+
+    def __init__(self, system_prompt: str, max_input_tokens: int = 6000):
+        self.system_prompt = system_prompt
+        self.max_input_tokens = max_input_tokens
+        self.system_tokens = estimate_tokens(system_prompt)
+
+    @staticmethod
+    def document_text(data: Union[Dict, str]) -> str:
+        """Pull the form text out of an extract_fields input"""
+        if isinstance(data, dict):
+            return "\n\n".join(str(part) for part in data.get("text", []))
+        return str(data)
+
+    @staticmethod
+    def page_text(page: Dict) -> str:
+        """Render one process_pdf page the way compact_text does, falling back to its raw content"""
+        content = page.get("compact_content") or page.get("content") or ""
+        if not content.strip():
+            return ""
+        return f"[Page {page['page_number']}]\n{content}"
+
+    def chunk_pages(self, pages: List[Dict], chunk_tokens: int = None) -> List[str]:
+        """Pack whole pages into chunks of at most chunk_tokens each
+
+        Pages are never reordered. A page that is larger than a chunk on its
+        own is split at line boundaries.
+        """
+        limit = max(self.max_input_tokens - self.system_tokens, 1)
+        if chunk_tokens:
+            limit = min(limit, chunk_tokens)
+
+        chunks = []
+        current, current_tokens = [], 0
+        for page in pages:
+            text = self.page_text(page)
+            if not text:
+                continue
+            tokens = estimate_tokens(text)
+            if tokens > limit:
+                # Later parts get their own header so the model still knows the page
+                header = f"[Page {page['page_number']} continued]"
+                parts = self._split_lines(text, max(limit - estimate_tokens(header), 1))
+                parts = parts[:1] + [(f"{header}\n{part}", part_tokens + estimate_tokens(header))
+                                     for part, part_tokens in parts[1:]]
+            else:
+                parts = [(text, tokens)]
+            for part, part_tokens in parts:
+                if current and current_tokens + part_tokens > limit:
+                    chunks.append("\n\n".join(current))
+                    current, current_tokens = [], 0
+                current.append(part)
+                current_tokens += part_tokens
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
+
+    @staticmethod
+    def _split_lines(text: str, limit: int) -> List[Tuple[str, int]]:
+        """Split an oversized page into line runs of at most limit tokens"""
+        parts = []
+        lines, tokens = [], 0
+        for line in text.split("\n"):
+            line_tokens = estimate_tokens(line)
+            if lines and tokens + line_tokens > limit:
+                parts.append(("\n".join(lines), tokens))
+                lines, tokens = [], 0
+            lines.append(line)
+            tokens += line_tokens
+        if lines:
+            parts.append(("\n".join(lines), tokens))
+        return parts
+
+    def _line_value(self, line: str, seen: set, has_latin: bool) -> int:
+        """Rank a line from 0 (drop first) to 3 (keep longest)"""
+        stripped = line.strip()
+        if stripped in seen:
+            return 0
+        seen.add(stripped)
+        if not re.search(r'[^\W_]', stripped) or (has_latin and not re.search(r'[A-Za-z0-9]', stripped)):
+            return 1
+        if len(stripped.split()) >= 12 and not self.FIELD_MARKER_RE.search(stripped):
+            return 2
+        return 3
+
+    def fit(self, text: str, budget: int) -> Tuple[str, Dict]:
+        """Trim text to at most budget tokens, dropping the lowest-value lines first"""
+        tokens = estimate_tokens(text)
+        stats = {"document_tokens": tokens, "dropped_lines": 0, "truncated": False}
+        if tokens <= budget:
+            return text, stats
+
+        lines = text.split("\n")
+        has_latin = bool(re.search(r'[A-Za-z]{3,}', text))
+        seen = set()
+        ranked = [(self._line_value(line, seen, has_latin), estimate_tokens(line), i)
+                  for i, line in enumerate(lines) if line.strip()]
+        # Lowest value first; within a tier, drop the biggest lines first
+        ranked.sort(key=lambda item: (item[0], -item[1]))
+
+        dropped = set()
+        for value, line_tokens, i in ranked:
+            if tokens <= budget or value == 3:
+                break
+            dropped.add(i)
+            tokens -= line_tokens
+        kept = [line for i, line in enumerate(lines) if i not in dropped]
+        stats["dropped_lines"] = len(dropped)
+
+        if tokens > budget:
+            # Only field lines are left; keep the head of the document
+            while kept and tokens > budget:
+                tokens -= estimate_tokens(kept.pop())
+            stats["truncated"] = True
+
+        stats["document_tokens"] = tokens
+        return "\n".join(kept), stats
+
+    def build(self, data: Union[Dict, str]) -> Tuple[List[Dict], Dict]:
+        """Return chat messages for a request and a summary of their token cost"""
+        budget = max(self.max_input_tokens - self.system_tokens, 0)
+        document, stats = self.fit(self.document_text(data), budget)
+        stats["system_tokens"] = self.system_tokens
+        stats["input_tokens"] = self.system_tokens + stats["document_tokens"]
+        stats["budget"] = self.max_input_tokens
+
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": document}
+        ]
+        return messages, stats
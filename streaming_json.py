@@ -0,0 +1,178 @@
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+
+Path = Tuple  # keys and list indexes from the root, e.g. ('family', 'children', 0, 'name')
+
+def iter_leaves(value: Any, path: Path = ()) -> Iterator[Tuple[Path, Any]]:
+    """Yield (path, value) for every scalar, empty object and empty list in a parsed JSON value"""
+    if isinstance(value, dict) and value:
+        for key, item in value.items():
+            yield from iter_leaves(item, path + (key,))
+    elif isinstance(value, list) and value:
+        for index, item in enumerate(value):
+            yield from iter_leaves(item, path + (index,))
+    else:
+        yield path, value
+
+def set_path(root: Dict, path: Path, value: Any):
+    """Store value at path inside root, creating objects and lists on the way"""
+    if not path:
+        return  # the root object itself, which is root
+    node = root
+    for key, next_key in zip(path, path[1:]):
+        if isinstance(node, list):
+            while len(node) <= key:
+                node.append(None)
+            if not isinstance(node[key], (dict, list)):
+                node[key] = [] if isinstance(next_key, int) else {}
+            node = node[key]
+        else:
+            if not isinstance(node.get(key), (dict, list)):
+                node[key] = [] if isinstance(next_key, int) else {}
+            node = node[key]
+    if isinstance(node, list):
+        while len(node) <= path[-1]:
+            node.append(None)
+    node[path[-1]] = value
+
+class IncrementalJSONParser:
+    """Parse a JSON object as it streams in and report each value once it is complete
+
+    feed() returns (path, value) pairs in document order, the same pairs
+    iter_leaves() would give for the finished object. Anything before the
+    first '{' (such as a markdown code fence) and after the closing '}' is
+    ignored, and trailing commas are accepted.
+    """
+
+    WHITESPACE = ' \t\r\n'
+
+    def __init__(self):
+        self._stack: List[Dict] = []
+        self._state = 'seek'
+        self._buffer: List[str] = []
+        self._escape = False
+        self._string_is_key = False
+        self.done = False
+
+    def _path(self) -> Path:
+        return tuple(frame['key'] if frame['type'] == 'object' else frame['index'] for frame in self._stack)
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """Consume the next piece of text and return the values it completed"""
+        events = []
+        for char in chunk:
+            self._step(char, events)
+        return events
+
+    def _step(self, char: str, events: List):
+        state = self._state
+        if state == 'string':
+            if self._escape:
+                self._escape = False
+                self._buffer.append(char)
+            elif char == '\\':
+                self._escape = True
+                self._buffer.append(char)
+            elif char == '"':
+                self._finish_string(events)
+            else:
+                self._buffer.append(char)
+            return
+
+        if state == 'scalar':
+            if char in ',}]' or char in self.WHITESPACE:
+                self._finish_scalar(events)
+                self._step(char, events)
+            else:
+                self._buffer.append(char)
+            return
+
+        if state in ('seek', 'done'):
+            if state == 'seek' and char == '{':
+                self._open('object')
+            return
+
+        if char in self.WHITESPACE:
+            return
+
+        if state == 'key_or_end':
+            if char == '"':
+                self._start_string(is_key=True)
+            elif char == '}':
+                self._close(events)
+            else:
+                raise ValueError(f"Expected an object key, got {char!r}")
+        elif state == 'colon':
+            if char != ':':
+                raise ValueError(f"Expected ':', got {char!r}")
+            self._state = 'value'
+        elif char == ']' and self._stack[-1]['type'] == 'array':
+            # Empty list, or a trailing comma as clean_api_response tolerates
+            self._close(events)
+        elif state in ('value', 'value_or_end'):
+            if char == '"':
+                self._start_string(is_key=False)
+            elif char == '{':
+                self._open('object')
+            elif char == '[':
+                self._open('array')
+            else:
+                self._state = 'scalar'
+                self._buffer = [char]
+        elif state == 'after_value':
+            if char == ',':
+                frame = self._stack[-1]
+                if frame['type'] == 'object':
+                    self._state = 'key_or_end'
+                else:
+                    frame['index'] += 1
+                    self._state = 'value'
+            elif char in '}]':
+                self._close(events)
+            else:
+                raise ValueError(f"Expected ',' or a closing bracket, got {char!r}")
+
+    def _open(self, kind: str):
+        self._stack.append({'type': kind, 'key': None, 'index': 0, 'items': 0})
+        self._state = 'key_or_end' if kind == 'object' else 'value_or_end'
+
+    def _close(self, events: List):
+        frame = self._stack.pop()
+        if not frame['items']:
+            # Report empty containers so their key is not lost; the parent's
+            # key or index still points at this container
+            events.append((self._path(), {} if frame['type'] == 'object' else []))
+        self._value_done()
+
+    def _start_string(self, is_key: bool):
+        self._state = 'string'
+        self._string_is_key = is_key
+        self._buffer = []
+        self._escape = False
+
+    def _finish_string(self, events: List):
+        value = json.loads('"' + ''.join(self._buffer) + '"')
+        if self._string_is_key:
+            self._stack[-1]['key'] = value
+            self._state = 'colon'
+        else:
+            events.append((self._path(), value))
+            self._value_done()
+
+    def _finish_scalar(self, events: List):
+        token = ''.join(self._buffer)
+        try:
+            value = json.loads(token)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON literal {token!r}")
+        events.append((self._path(), value))
+        self._value_done()
+
+    def _value_done(self):
+        """Record that the current container received a value"""
+        if self._stack:
+            self._stack[-1]['items'] += 1
+            self._state = 'after_value'
+        else:
+            self._state = 'done'
+            self.done = True
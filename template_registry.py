@@ -0,0 +1,218 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import fitz  # PyMuPDF
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def blank_schema(fields: Any) -> Any:
+    """Keep the structure of extracted fields but drop every value"""
+    if isinstance(fields, dict):
+        return {key: blank_schema(value) for key, value in fields.items()}
+    if isinstance(fields, list):
+        return []
+    return None
+
+class TemplateRegistry:
+    """SQLite registry of known blank forms, matched by a near-duplicate fingerprint
+
+    A fingerprint combines the page count, the page sizes and a MinHash
+    signature. The signature covers word shingles of the text layer and, for
+    pages without one, rows of a difference hash of the rendered page.
+    Signatures are split into LSH bands stored in an indexed table, so a
+    lookup only compares the templates that share a band instead of every
+    stored template.
+    """
+
+    NUM_PERM = 64
+    BANDS = 16  # 4 rows per band: pairs above ~0.5 similarity usually share a band
+    SHINGLE_SIZE = 4
+    PAGE_SIZE_TOLERANCE = 2.0  # points
+    HASH_SIZE = 8  # dHash grid per page
+    WORD_RE = re.compile(r'\w+')
+
+    # Fixed seed so signatures stay comparable across processes and restarts
+    _rng = np.random.RandomState(20240611)
+    _PERM_A = _rng.randint(1, 2 ** 32, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+    _PERM_B = _rng.randint(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+
+    def __init__(self, db_path: Union[str, Path] = 'form_templates.db', threshold: float = 0.8):
+        self.db_path = str(db_path)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._stats = {
+            'lookups': 0,
+            'matches': 0,
+            'candidates': 0,
+            'stores': 0
+        }
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS form_templates (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    page_count INTEGER NOT NULL,
+                    page_sizes TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    extracted_fields TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS form_template_bands (
+                    band_key INTEGER NOT NULL,
+                    template_id INTEGER NOT NULL,
+                    PRIMARY KEY (band_key, template_id)
+                ) WITHOUT ROWID
+            ''')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    @staticmethod
+    def _token_hash(token: str) -> int:
+        return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=4).digest(), 'little')
+
+    def _page_hash_tokens(self, page: fitz.Page, page_index: int) -> List[str]:
+        """Difference hash of a rendered page, one token per row of the hash grid"""
+        pix = page.get_pixmap(matrix=fitz.Matrix(0.25, 0.25), colorspace=fitz.csGRAY, alpha=False)
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+        # Average into a (HASH_SIZE) x (HASH_SIZE + 1) grid
+        rows = np.array_split(pixels.astype(np.float32), self.HASH_SIZE, axis=0)
+        grid = np.array([[cell.mean() for cell in np.array_split(row, self.HASH_SIZE + 1, axis=1)]
+                         for row in rows])
+        bits = grid[:, 1:] > grid[:, :-1]
+        return [f"img:{page_index}:{row}:{int(np.packbits(bits[row])[0])}" for row in range(self.HASH_SIZE)]
+
+    def fingerprint(self, source: Union[str, Path, bytes]) -> Dict:
+        """Fingerprint a PDF from its path or bytes"""
+        if isinstance(source, (bytes, bytearray)):
+            doc = fitz.open(stream=bytes(source), filetype='pdf')
+        else:
+            doc = fitz.open(str(source))
+        try:
+            page_sizes = []
+            tokens = set()
+            for index, page in enumerate(doc):
+                page_sizes.append([round(page.rect.width, 1), round(page.rect.height, 1)])
+                words = [word.lower() for word in self.WORD_RE.findall(page.get_text("text"))]
+                if len(words) >= self.SHINGLE_SIZE:
+                    tokens.update(" ".join(words[i:i + self.SHINGLE_SIZE])
+                                  for i in range(len(words) - self.SHINGLE_SIZE + 1))
+                else:
+                    # No usable text layer, e.g. a scan
+                    tokens.update(self._page_hash_tokens(page, index))
+        finally:
+            doc.close()
+
+        return {
+            "page_count": len(page_sizes),
+            "page_sizes": page_sizes,
+            "signature": self._minhash(tokens)
+        }
+
+    def _minhash(self, tokens: set) -> np.ndarray:
+        if not tokens:
+            return np.full(self.NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+        hashes = np.fromiter((self._token_hash(token) for token in tokens), dtype=np.uint64, count=len(tokens))
+        # Multiply-shift hashing: one independent permutation per column
+        permuted = (hashes[:, None] * self._PERM_A + self._PERM_B) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, fingerprint: Dict) -> List[int]:
+        """One indexed key per LSH band; the page count is mixed in so only like forms collide"""
+        rows = self.NUM_PERM // self.BANDS
+        signature = fingerprint["signature"]
+        keys = []
+        for band in range(self.BANDS):
+            chunk = signature[band * rows:(band + 1) * rows].tobytes()
+            digest = hashlib.blake2b(chunk, digest_size=8,
+                                     person=f"{fingerprint['page_count']}:{band}".encode('utf-8')[:16]).digest()
+            keys.append(int.from_bytes(digest, 'little', signed=True))
+        return keys
+
+    def _sizes_match(self, a: List, b: List) -> bool:
+        return len(a) == len(b) and all(
+            abs(wa - wb) <= self.PAGE_SIZE_TOLERANCE and abs(ha - hb) <= self.PAGE_SIZE_TOLERANCE
+            for (wa, ha), (wb, hb) in zip(a, b)
+        )
+
+    def lookup(self, fingerprint: Dict) -> Optional[Dict]:
+        """Return the most similar stored template above the threshold, or None"""
+        band_keys = self._band_keys(fingerprint)
+        placeholders = ",".join("?" * len(band_keys))
+        with self._connect() as conn:
+            rows = conn.execute(f'''
+                SELECT t.id, t.page_sizes, t.signature
+                FROM form_templates t
+                WHERE t.id IN (SELECT template_id FROM form_template_bands WHERE band_key IN ({placeholders}))
+                  AND t.page_count = ?
+            ''', (*band_keys, fingerprint["page_count"])).fetchall()
+
+            best = None
+            for template_id, page_sizes, signature in rows:
+                if not self._sizes_match(json.loads(page_sizes), fingerprint["page_sizes"]):
+                    continue
+                similarity = float(np.mean(np.frombuffer(signature, dtype=np.uint32) == fingerprint["signature"]))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (template_id, similarity)
+
+            match = None
+            if best is not None:
+                conn.execute('UPDATE form_templates SET hits = hits + 1, last_used = ? WHERE id = ?',
+                             (time.time(), best[0]))
+                fields = conn.execute('SELECT extracted_fields FROM form_templates WHERE id = ?',
+                                      (best[0],)).fetchone()[0]
+                match = {
+                    "template_id": best[0],
+                    "similarity": best[1],
+                    "extracted_fields": json.loads(fields)
+                }
+
+        with self._lock:
+            self._stats['lookups'] += 1
+            self._stats['candidates'] += len(rows)
+            self._stats['matches'] += match is not None
+        if match is not None:
+            logger.info(f"Matched form template {match['template_id']} "
+                        f"(similarity {match['similarity']:.2f}, {len(rows)} candidates)")
+        return match
+
+    def add(self, fingerprint: Dict, extracted_fields: Dict) -> int:
+        """Store a template's field schema; values are dropped so no applicant data is kept"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                INSERT INTO form_templates (page_count, page_sizes, signature, extracted_fields, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (fingerprint["page_count"], json.dumps(fingerprint["page_sizes"]),
+                  fingerprint["signature"].astype(np.uint32).tobytes(),
+                  json.dumps(blank_schema(extracted_fields), ensure_ascii=False), now, now))
+            template_id = cursor.lastrowid
+            conn.executemany('INSERT OR IGNORE INTO form_template_bands (band_key, template_id) VALUES (?, ?)',
+                             [(key, template_id) for key in self._band_keys(fingerprint)])
+
+        with self._lock:
+            self._stats['stores'] += 1
+        logger.info(f"Registered form template {template_id} ({fingerprint['page_count']} pages)")
+        return template_id
+
+    def stats(self) -> Dict:
+        """Return lookup counters and the number of stored templates"""
+        with self._connect() as conn:
+            templates = conn.execute('SELECT COUNT(*) FROM form_templates').fetchone()[0]
+        with self._lock:
+            stats = dict(self._stats)
+        stats['match_rate'] = stats['matches'] / stats['lookups'] if stats['lookups'] else 0.0
+        stats['templates'] = templates
+        return stats
@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+class UploadStore:
+    """Content-addressed storage for uploaded PDFs
+
+    Files are hashed while they are read and stored once per unique content at
+    objects/<first two hex digits>/<sha256>.pdf. Each user of a file (an
+    upload job, a stored form) holds a reference; gc() deletes files whose
+    references have expired and evicts the least recently used files once
+    the store grows past max_bytes. Placing a file and deleting one are
+    serialized, so gc() never unlinks a file that a concurrent save() has
+    just referenced again.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root: Union[str, Path] = 'uploads', db_path: Union[str, Path] = 'upload_store.db',
+                 max_bytes: int = 2 * 1024 * 1024 * 1024, max_age_seconds: int = 24 * 3600,
+                 spool_bytes: int = 16 * 1024 * 1024):
+        self.root = Path(root)
+        self.objects_dir = self.root / 'objects'
+        self.tmp_dir = self.root / 'tmp'
+        self.db_path = str(db_path)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.spool_bytes = spool_bytes
+        self._lock = threading.Lock()
+        # Held while objects are placed, referenced or deleted
+        self._objects_lock = threading.Lock()
+        self._stats = {
+            'stored': 0,
+            'deduplicated': 0,
+            'bytes_written': 0,
+            'bytes_deduplicated': 0
+        }
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS upload_objects (
+                    digest TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS upload_refs (
+                    digest TEXT NOT NULL,
+                    owner TEXT,
+                    ref TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (ref, digest)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_upload_refs_digest ON upload_refs (digest)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_upload_refs_created ON upload_refs (created_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def path_for(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}.pdf"
+
+    @staticmethod
+    def digest_of(path: Union[str, Path]) -> str:
+        """Digest of a stored object from its path"""
+        return Path(path).stem
+
+    def save(self, stream: BinaryIO, ref: str, owner: str = None) -> Tuple[str, str]:
+        """Store an upload stream under a reference; returns (digest, path)
+
+        Small uploads are hashed in memory and never written if the content is
+        already stored. Larger ones spill to a temp file that is renamed into
+        place, or discarded when it turns out to be a duplicate.
+        """
+        digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        tmp_file = None
+        try:
+            for chunk in iter(lambda: stream.read(self.CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                if tmp_file is None and size > self.spool_bytes:
+                    tmp_file = tempfile.NamedTemporaryFile(dir=self.tmp_dir, suffix='.part', delete=False)
+                    tmp_file.writelines(chunks)
+                    chunks = []
+                if tmp_file is not None:
+                    tmp_file.write(chunk)
+                else:
+                    chunks.append(chunk)
+            if tmp_file is not None:
+                tmp_file.close()
+
+            hex_digest = digest.hexdigest()
+            path = self.path_for(hex_digest)
+            now = time.time()
+            with self._objects_lock, closing(self._connect()) as conn, conn:
+                # The reference goes in first so a concurrent gc() cannot remove the object
+                conn.execute('INSERT OR REPLACE INTO upload_refs (digest, owner, ref, created_at) VALUES (?, ?, ?, ?)',
+                             (hex_digest, owner, ref, now))
+                exists = conn.execute('SELECT 1 FROM upload_objects WHERE digest = ?',
+                                      (hex_digest,)).fetchone() is not None and path.exists()
+                if exists:
+                    conn.execute('UPDATE upload_objects SET last_used = ? WHERE digest = ?', (now, hex_digest))
+                else:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    if tmp_file is not None:
+                        os.replace(tmp_file.name, path)
+                        tmp_file = None
+                    else:
+                        part = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.part")
+                        with open(part, 'wb') as f:
+                            f.writelines(chunks)
+                        os.replace(part, path)
+                    conn.execute('INSERT OR REPLACE INTO upload_objects (digest, size, created_at, last_used) '
+                                 'VALUES (?, ?, ?, ?)', (hex_digest, size, now, now))
+        finally:
+            if tmp_file is not None:
+                tmp_file.close()
+                os.unlink(tmp_file.name)
+
+        with self._lock:
+            if exists:
+                self._stats['deduplicated'] += 1
+                self._stats['bytes_deduplicated'] += size
+            else:
+                self._stats['stored'] += 1
+                self._stats['bytes_written'] += size
+        logger.info(f"{'Deduplicated' if exists else 'Stored'} upload {hex_digest[:12]} ({size} bytes) for {ref}")
+        return hex_digest, str(path)
+
+    def add_ref(self, digest: str, ref: str, owner: str = None):
+        """Record another user of an already stored object"""
+        now = time.time()
+        with self._objects_lock, closing(self._connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO upload_refs (digest, owner, ref, created_at) VALUES (?, ?, ?, ?)',
+                         (digest, owner, ref, now))
+            conn.execute('UPDATE upload_objects SET last_used = ? WHERE digest = ?', (now, digest))
+
+    def release(self, refs: Iterable[str]):
+        """Drop references; their objects are deleted by the next gc() once unreferenced"""
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM upload_refs WHERE ref = ?', [(ref,) for ref in refs])
+
+    def gc(self, protected: Iterable[str] = (), pinned_refs: Iterable[str] = ()) -> Dict:
+        """Expire old references, delete unreferenced objects and enforce the size budget
+
+        Objects whose digest is in protected (e.g. uploads of queued jobs)
+        are never deleted. Over budget, objects still referenced by a ref
+        starting with one of pinned_refs (e.g. 'form:' for stored forms) are
+        not evicted either; the store then stays over budget until those
+        references expire.
+        """
+        protected = set(protected)
+        pinned_refs = tuple(pinned_refs)
+        now = time.time()
+        with self._objects_lock:
+            deleted, expired_refs, total = self._collect(now, protected, pinned_refs)
+            
+            # Still under the lock: a save() of one of these digests waits until its
+            # file is gone and then writes it afresh
+            for digest, _ in deleted:
+                path = self.path_for(digest)
+                path.unlink(missing_ok=True)
+                try:
+                    path.parent.rmdir()
+                except OSError:
+                    pass  # other objects share the directory
+
+        # Leftovers of interrupted writes
+        stale = 0
+        for part in list(self.tmp_dir.glob('*.part')) + list(self.objects_dir.glob('*/*.part')):
+            try:
+                if part.stat().st_mtime < now - 3600:
+                    part.unlink()
+                    stale += 1
+            except OSError:
+                pass
+
+        result = {
+            'expired_refs': expired_refs,
+            'deleted_objects': len(deleted),
+            'freed_bytes': sum(size for _, size in deleted),
+            'stale_parts': stale,
+            'bytes': total
+        }
+        logger.info(f"Upload store GC: {result}")
+        if total > self.max_bytes:
+            logger.warning(f"Upload store is {total - self.max_bytes} bytes over budget; "
+                           f"the remaining objects are in use")
+        return result
+
+    def _collect(self, now: float, protected: set, pinned_refs: tuple) -> Tuple[list, int, int]:
+        """Delete the rows of expired references and of objects to drop
+
+        Returns the (digest, size) of the dropped objects, the number of
+        expired references and the bytes left in the store.
+        """
+        deleted = []
+        with closing(self._connect()) as conn, conn:
+            expired_refs = conn.execute('DELETE FROM upload_refs WHERE created_at < ?',
+                                        (now - self.max_age_seconds,)).rowcount
+            rows = conn.execute('''
+                SELECT digest, size FROM upload_objects
+                WHERE digest NOT IN (SELECT digest FROM upload_refs)
+            ''').fetchall()
+            deleted.extend(row for row in rows if row[0] not in protected)
+
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM upload_objects').fetchone()[0]
+            total -= sum(size for _, size in deleted)
+            if total > self.max_bytes:
+                # Still over budget: evict the least recently used objects, references and
+                # all, except those a pinned reference (e.g. a stored form) still needs
+                skip = {digest for digest, _ in deleted} | protected
+                for ref, digest in conn.execute('SELECT ref, digest FROM upload_refs'):
+                    if ref.startswith(pinned_refs):
+                        skip.add(digest)
+                for digest, size in conn.execute('SELECT digest, size FROM upload_objects ORDER BY last_used').fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    if digest in skip:
+                        continue
+                    deleted.append((digest, size))
+                    total -= size
+
+            conn.executemany('DELETE FROM upload_refs WHERE digest = ?', [(digest,) for digest, _ in deleted])
+            conn.executemany('DELETE FROM upload_objects WHERE digest = ?', [(digest,) for digest, _ in deleted])
+        return deleted, expired_refs, total
+
+    def stats(self) -> Dict:
+        """Return write/dedupe counters plus the stored object count and size"""
+        with self._connect() as conn:
+            objects, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM upload_objects').fetchone()
+            refs = conn.execute('SELECT COUNT(*) FROM upload_refs').fetchone()[0]
+        with self._lock:
+            stats = dict(self._stats)
+        stats['objects'] = objects
+        stats['refs'] = refs
+        stats['bytes'] = size
+        return stats